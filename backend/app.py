@@ -1,210 +1,210 @@
-from flask import Flask, redirect, url_for, session, request, jsonify
-from authlib.integrations.flask_client import OAuth
+from flask import Blueprint, Flask, Response, current_app, redirect, session, request, jsonify, stream_with_context
 from flask_cors import CORS
-from werkzeug.security import generate_password_hash, check_password_hash
-from datetime import timedelta
+from datetime import date as date_cls, datetime, timedelta
 import os
 import json
-import psycopg2
+import base64
+import logging
+import time
 import psycopg2.extras
-import smtplib
-import random
 from email.message import EmailMessage
 from dotenv import load_dotenv
-from werkzeug.middleware.proxy_fix import ProxyFix # Добавьте этот импорт
-from flask import send_from_directory
-from menu_api import menu_api
-load_dotenv()
+from werkzeug.middleware.proxy_fix import ProxyFix
+from menu_api import menu_api, menu_source
+from db import db_connection, get_pool, PoolTimeout, current_pool_stats
+from occupancy import occupied_tables, apply_status, update_status
+from bookings_store import BookingLog
+from phone_index import PhoneIndex
+from mailer import get_mailer, MailQueueFull, current_mailer_stats
+import migrations
+from reservations import validate_reservation, insert_reservations
+from images import images_api
+from sessions import make_session_interface, regenerate_session
+from metrics import metrics_api, REGISTRY, GaugeCallback
+from applog import setup_logging
+from bookings_cache import BookingsCache
+from notify import get_listener
+from hashing import get_hasher, HashPoolBusy, current_hasher_stats
+from email_codes import store_code, consume_code
+from menu_store import menu_admin_api, check_admin_token
+from availability import BranchCatalog, availability, parse_range
+from json_provider import make_json_provider
+from compression import init_compression
 
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+log = logging.getLogger("cafe")
 
 # ------------------- PostgreSQL -------------------
-DB = {
-    "dbname": os.getenv("DB_NAME"),
-    "user": os.getenv("DB_USER"),
-    "password": os.getenv("DB_PASSWORD"),
-    "host": os.getenv("DB_HOST"),
-    "port": os.getenv("DB_PORT")
-}
-
-def get_db():
-    db_config = DB.copy()
-    db_config["sslmode"] = "require"
-    return psycopg2.connect(**db_config)   # ← исправлено
-
-app = Flask(__name__, static_folder=os.path.join(BASE_DIR, "static"),
-    static_url_path="/static")
-@app.route("/")
-def healthcheck():
-    return {"status": "ok"}
+# Соединения берутся из пула (db.py): with db_connection() as conn: ...
+# Размер пула: DB_POOL_MIN / DB_POOL_MAX, ожидание: DB_POOL_TIMEOUT.
+
+# Все маршруты этого файла — в blueprint api; приложение собирает create_app()
+api = Blueprint("api", __name__, cli_group=None)
 
-@app.route("/static/images/<path:filename>")
-def serve_static_images(filename):
-    # Указываем путь к папке, содержащей images
-    # Обратите внимание: путь "static/images" должен быть относительно корня вашего проекта
-    return send_from_directory("static/images", filename)
-
-app.wsgi_app = ProxyFix(app.wsgi_app, x_for=1, x_proto=1, x_host=1, x_prefix=1) # Добавьте эту строку
-# ---- CORS: разрешаем только локальный фронтенд и включаем credentials ----
-FRONTEND_ORIGIN = os.getenv("FRONTEND_ORIGIN", "https://asian-cafefrontend.vercel.app")
-CORS(
-    app,
-    supports_credentials=True,
-    resources={
-        r"/*": {
-            "origins": [FRONTEND_ORIGIN]
+# ------------------- Сборка приложения -------------------
+def create_app(config=None):
+    """
+    Создаёт и настраивает приложение; config перекрывает значения из окружения.
+    Ничего не подключает: пул БД, LISTEN, очередь писем, пул хэширования и
+    клиент Google создаются при первом обращении в процессе воркера или в
+    warm_up(). Поэтому импорт безопасен для gunicorn --preload: после fork
+    воркерам не достаются чужие соединения и потоки.
+    """
+    load_dotenv()
+    setup_logging()
+
+    app = Flask(__name__, static_folder=os.path.join(BASE_DIR, "static"),
+        static_url_path="/static")
+    # Исходные картинки отдаёт встроенный /static (кэш на час);
+    # оптимизированные варианты — /img/... из images.py (immutable, кэш на год)
+    app.config["SEND_FILE_MAX_AGE_DEFAULT"] = 3600
+
+    # ---- Сессии: в dev оставляем secure=False (на проде - True) ----
+    app.secret_key = os.getenv("SESSION_SECRET")
+    app.config['SESSION_COOKIE_SAMESITE'] = 'None'   # чтобы браузер принимал cookie между origin'ами
+    app.config['SESSION_COOKIE_SECURE'] = True     # в dev False (на prod нужно True + HTTPS)
+    app.config["PERMANENT_SESSION_LIFETIME"] = timedelta(minutes=20)
+    # В cookie только id сессии, данные — на сервере (sessions.py, SESSION_BACKEND)
+    app.config["SESSION_IDLE_TIMEOUT"] = timedelta(hours=int(os.getenv("SESSION_IDLE_HOURS", "24")))
+
+    app.config["FRONTEND_ORIGIN"] = os.getenv("FRONTEND_ORIGIN", "https://asian-cafefrontend.vercel.app")
+    app.config["EMAIL_SENDER"] = os.getenv("EMAIL_SENDER")
+    # Google OAuth: клиент регистрируется при первом входе (oidc.google_client)
+    app.config['GOOGLE_CLIENT_ID'] = os.getenv("GOOGLE_CLIENT_ID")
+    app.config['GOOGLE_CLIENT_SECRET'] = os.getenv("GOOGLE_CLIENT_SECRET")
+    app.config['GOOGLE_DISCOVERY_URL'] = os.getenv(
+        "GOOGLE_DISCOVERY_URL", "https://accounts.google.com/.well-known/openid-configuration")
+    # меню: таблица menu (db) или только menu.json (file), см. menu_api.py
+    app.config["MENU_SOURCE"] = os.getenv("MENU_SOURCE", "db")
+    app.config["BRANCHES_FILE"] = os.getenv("BRANCHES_FILE", os.path.join(BASE_DIR, "branches.json"))
+    app.config.update(config or {})
+
+    # ------------------- JSON и сжатие ответов -------------------
+    # jsonify через orjson (json_provider.py), ответы сжимаются brotli/gzip по
+    # Accept-Encoding (compression.py); меню хранит уже сжатые варианты
+    app.json = make_json_provider(app)
+    init_compression(app)
+    app.session_interface = make_session_interface()
+
+    app.wsgi_app = ProxyFix(app.wsgi_app, x_for=1, x_proto=1, x_host=1, x_prefix=1)
+    # ---- CORS: разрешаем только фронтенд и включаем credentials ----
+    CORS(
+        app,
+        supports_credentials=True,
+        resources={
+            r"/*": {
+                "origins": [app.config["FRONTEND_ORIGIN"]]
+            }
         }
-    }
-)
-# ---- Сессии: в dev оставляем secure=False (на проде - True) ----
-app.secret_key = os.getenv("SESSION_SECRET")
-app.config['SESSION_COOKIE_SAMESITE'] = 'None'   # чтобы браузер принимал cookie между origin'ами
-app.config['SESSION_COOKIE_SECURE'] = True     # в dev False (на prod нужно True + HTTPS)
-app.config["PERMANENT_SESSION_LIFETIME"] = timedelta(minutes=20)
-
-# ------------------- Настройка Google OAuth -------------------
-app.config['GOOGLE_CLIENT_ID'] = os.getenv("GOOGLE_CLIENT_ID")
-app.config['GOOGLE_CLIENT_SECRET'] = os.getenv("GOOGLE_CLIENT_SECRET")
-app.config['GOOGLE_DISCOVERY_URL'] = "https://accounts.google.com/.well-known/openid-configuration"
-
-oauth = OAuth(app)
-google = oauth.register(
-    name='google',
-    client_id=app.config['GOOGLE_CLIENT_ID'],
-    client_secret=app.config['GOOGLE_CLIENT_SECRET'],
-    server_metadata_url=app.config['GOOGLE_DISCOVERY_URL'],
-    client_kwargs={'scope': 'openid email profile'}
+    )
+
+    # /metrics (metrics.py), /img (images.py), /menu и /admin/menu (menu_api.py, menu_store.py)
+    for blueprint in (images_api, metrics_api, menu_api, menu_admin_api, api):
+        app.register_blueprint(blueprint)
+    app.extensions["branch_catalog"] = BranchCatalog(app.config["BRANCHES_FILE"])
+    return app
+
+# ------------------- Прогрев воркера -------------------
+def _warm_db(app):
+    with db_connection() as conn:
+        conn.cursor().execute("SELECT 1")
+
+def _warm_google(app):
+    if not app.config["GOOGLE_CLIENT_ID"]:
+        return
+    from oidc import google_client
+    client = google_client(app)
+    client.load_server_metadata()
+    client.fetch_jwk_set()
+
+WARM_UP_STEPS = (
+    ("db", _warm_db),
+    ("notify", lambda app: get_listener()),
+    ("menu", lambda app: menu_source().get()),
+    ("google", _warm_google),
+    ("mail", lambda app: get_mailer()),
+    ("password_hash", lambda app: get_hasher()),
 )
 
-# ------------------- Создание таблиц
-def init_pg():
-    conn = get_db()
-    cur = conn.cursor()
-
-    # Таблица пользователей
-    cur.execute("""
-        CREATE TABLE IF NOT EXISTS users (
-            id SERIAL PRIMARY KEY,
-            name TEXT,
-            email TEXT UNIQUE NOT NULL,
-            password TEXT,
-            verified BOOLEAN DEFAULT FALSE,
-            google_id TEXT
-        );
-    """)
-
-    # Коды подтверждения email
-    cur.execute("""
-        CREATE TABLE IF NOT EXISTS email_codes (
-            id SERIAL PRIMARY KEY,
-            email TEXT NOT NULL,
-            code TEXT NOT NULL,
-            created_at TIMESTAMP DEFAULT NOW()
-        );
-    """)
-    # Меню
-    cur.execute("""
-        CREATE TABLE IF NOT EXISTS menu (
-            id SERIAL PRIMARY KEY,
-            name TEXT NOT NULL,
-            price INTEGER NOT NULL,
-            category TEXT NOT NULL
-        );
-    """)
-    cur.execute("""
-    CREATE TABLE IF NOT EXISTS reservations (
-        id SERIAL PRIMARY KEY,
-        user_email TEXT NOT NULL,
-        branch TEXT NOT NULL,
-        date DATE NOT NULL,
-        tables TEXT[] NOT NULL,
-        guests INTEGER NOT NULL,
-        notes TEXT,
-        menu_items TEXT[],
-        status TEXT DEFAULT 'pending',
-        created_at TIMESTAMP DEFAULT NOW()
-        );
-    """)
-    #NEW
-    cur.execute("""
-        CREATE TABLE IF NOT EXISTS table_usage (
-    id SERIAL PRIMARY KEY,
-    table_id TEXT NOT NULL,
-    branch TEXT NOT NULL,
-    date DATE NOT NULL,
-    used_seats INTEGER NOT NULL
-);
-    """ )
-    conn.commit()
-    conn.close()
-# ------------------------------------------------
-# ИНИЦИАЛИЗАЦИЯ POSTGRES ПРИ СТАРТЕ ПРИЛОЖЕНИЯ
-# ------------------------------------------------
-try:
-    init_pg()
-    print("PostgreSQL initialized.")
-except Exception as e:
-    print("init_pg ERROR:", e)
+def warm_up(app):
+    """
+    Заранее создаёт ресурсы текущего процесса, чтобы первый запрос к воркеру
+    не платил за подключения и загрузку меню. Вызывается после fork
+    (gunicorn.conf.py, post_worker_init) или командой flask --app app warmup.
+    Ошибка шага не мешает старту: ресурс создастся при первом запросе.
+    Без БД шаг notify пропускается — LISTEN только зря переподключался бы.
+    """
+    timings = {}
+    with app.app_context():
+        for name, step in WARM_UP_STEPS:
+            if name == "notify" and "db" not in timings:
+                continue
+            started = time.perf_counter()
+            try:
+                step(app)
+            except Exception as e:
+                log.warning("warm_up %s error: %s", name, e)
+                continue
+            timings[name] = time.perf_counter() - started
+    log.info("warm_up: %s", ", ".join("%s %.0f ms" % (n, t * 1000) for n, t in timings.items()))
+    return timings
+
+@api.cli.command("warmup")
+def warmup_command():
+    """Проверить подключения и загрузку меню, как при старте воркера."""
+    for name, seconds in warm_up(current_app).items():
+        print("%-14s %7.1f ms" % (name, seconds * 1000))
+
+# ------------------- Метрики (/metrics, формат Prometheus) -------------------
+# Счётчики и гистограммы по маршрутам, SQL и SMTP — см. metrics.py
+REGISTRY.register(GaugeCallback("db_pool", "Пул соединений PostgreSQL", current_pool_stats))
+REGISTRY.register(GaugeCallback("mail_queue", "Очередь писем", current_mailer_stats))
+REGISTRY.register(GaugeCallback("password_hash", "Пул хэширования паролей", current_hasher_stats))
+
+@api.route("/")
+def healthcheck():
+    return {"status": "ok"}
+
+# ------------------- Схема БД -------------------
+# Таблицы и индексы создаются миграциями (migrations.py) отдельным шагом деплоя:
+#     python migrations.py upgrade      или      flask --app app migrate
+@api.cli.command("migrate")
+def migrate_command():
+    """Применить новые миграции схемы."""
+    with db_connection() as conn:
+        applied = migrations.upgrade(conn)
+    print("applied:", applied or "nothing, schema is up to date")
 
 # ------------------- Email отправка
-EMAIL_SENDER = os.getenv("EMAIL_SENDER")
-EMAIL_PASSWORD = os.getenv("EMAIL_PASSWORD")
 
 def send_email_code(to_email, code):
     """
-    Отправляет код на почту. Если отправка упала — логируем и возвращаем False.
+    Ставит письмо с кодом в очередь отправки (mailer.py) и сразу возвращает
+    id задания для опроса статуса. Если очередь переполнена — возвращает None.
     Используем EmailMessage чтобы корректно задать Subject/From/To.
     """
+    msg = EmailMessage()
+    msg['Subject'] = "Код подтверждения регистрации"
+    msg['From'] = current_app.config["EMAIL_SENDER"]
+    msg['To'] = to_email
+    minutes = int(os.getenv("EMAIL_CODE_TTL_MINUTES", "15"))
+    msg.set_content(f"Ваш код подтверждения: {code}\n\nКод действителен {minutes} минут.")
+
     try:
-        msg = EmailMessage()
-        msg['Subject'] = "Код подтверждения регистрации"
-        msg['From'] = EMAIL_SENDER
-        msg['To'] = to_email
-        msg.set_content(f"Ваш код подтверждения: {code}\n\nЭтот код действителен в ближайшее время.")
-
-        server = smtplib.SMTP("smtp.gmail.com", 587)
-        server.starttls()
-        server.login(EMAIL_SENDER, EMAIL_PASSWORD)
-        server.send_message(msg)
-        server.quit()
-        return True
-    except Exception as e:
-        print("send_email_code error:", e)
-        return False
+        return get_mailer().submit(msg).id
+    except MailQueueFull as e:
+        log.warning("send_email_code error: %s", e)
+        return None
 
 def generate_email_code(email):
     """
-    Генерирует 6-значный код, сохраняет в email_codes и возвращает код.
-    """
-    code = str(random.randint(100000, 999999))
-    conn = get_db()
-    cur = conn.cursor()
-    cur.execute("INSERT INTO email_codes (email, code) VALUES (%s, %s)", (email, code))
-    conn.commit()
-    conn.close()
-    return code
-
-# ------------------- Главная (для теста) -------------------
-@app.route("/")
-def index():
-    user = session.get("user")
-    if user:
-        return f"""
-        <h2>Главная страница</h2>
-        <p>Вы вошли как: <b>{user.get('name')}</b> ({user.get('email')})</p>
-        <p><a href="/menu">📋 Меню</a></p>
-        <p><a href="/bookings">📅 Посмотреть брони</a></p>
-        <p><a href="/logout">🚪 Выйти</a></p>
-        """
-    return """
-    <h2>Главная страница</h2>
-    <p>Тут работает сервер API. Для UI используйте frontend на localhost:3000</p>
+    Генерирует 6-значный код, сохраняет в email_codes (заменяя прежний) и возвращает код.
     """
-@app.route('/static/<path:filename>')
-def serve_static(filename):
-    return send_from_directory('static', filename)
+    with db_connection() as conn:
+        return store_code(conn.cursor(), email)
+
 # ------------------- Регистрация (принимает JSON из фронтенда) -------------------
-@app.route("/register", methods=["POST"])
+@api.route("/register", methods=["POST"])
 def register():
     data = request.get_json()
     if not data:
@@ -217,44 +217,37 @@ def register():
     if not name or not email or not password:
         return jsonify({"error": "Заполните все поля"}), 400
 
-    hashed_pw = generate_password_hash(password)
-    code = str(random.randint(100000, 999999))
-
-    conn = get_db()
-    cur = conn.cursor()
+    # KDF считается в пуле процессов (hashing.py); если пул занят — 503
+    hashed_pw = get_hasher().hash(password)
 
-    # Проверяем, есть ли пользователь
-    cur.execute("SELECT id FROM users WHERE email=%s", (email,))
-    existing = cur.fetchone()
+    with db_connection() as conn:
+        cur = conn.cursor()
 
-    if existing:
-        conn.close()
-        return jsonify({"error": "Пользователь уже существует"}), 409
+        # Проверяем, есть ли пользователь
+        cur.execute("SELECT id FROM users WHERE email=%s", (email,))
+        existing = cur.fetchone()
 
-    # Создаём, но verified = False
-    cur.execute("""
-        INSERT INTO users (name, email, password, verified)
-        VALUES (%s, %s, %s, %s)
-    """, (name, email, hashed_pw, False))
+        if existing:
+            return jsonify({"error": "Пользователь уже существует"}), 409
 
-    # Код подтверждения
-    cur.execute("""
-        INSERT INTO email_codes (email, code)
-        VALUES (%s, %s)
-    """, (email, code))
+        # Создаём, но verified = False
+        cur.execute("""
+            INSERT INTO users (name, email, password, verified)
+            VALUES (%s, %s, %s, %s)
+        """, (name, email, hashed_pw, False))
 
-    conn.commit()
-    conn.close()
+        # Код подтверждения (один текущий код на email, см. email_codes.py)
+        code = store_code(cur, email)
 
-    # Отправляем email (если не отправилось — не падаем, но у фронтенда сообщаем)
-    ok = send_email_code(email, code)
-    if not ok:
+    # Отправляем email в фоне (если очередь переполнена — не падаем, но у фронтенда сообщаем)
+    job_id = send_email_code(email, code)
+    if not job_id:
         return jsonify({"message": "Пользователь создан. Но не удалось отправить код по почте."}), 201
 
-    return jsonify({"message": "Пользователь создан. Подтвердите email."}), 201
+    return jsonify({"message": "Пользователь создан. Подтвердите email.", "email_job": job_id}), 201
 
 # Новый endpoint: verify-email
-@app.route("/verify-email", methods=["POST"])
+@api.route("/verify-email", methods=["POST"])
 def verify_email():
     data = request.get_json()
     if not data:
@@ -265,29 +258,29 @@ def verify_email():
     if not email or not code:
         return jsonify({"error": "email и code обязательны"}), 400
 
-    conn = get_db()
-    cur = conn.cursor()
+    with db_connection() as conn:
+        cur = conn.cursor()
+
+        result = consume_code(cur, email, code)
 
-    cur.execute("SELECT code FROM email_codes WHERE email=%s ORDER BY id DESC LIMIT 1", (email,))
-    record = cur.fetchone()
+        if result == "not_found":
+            return jsonify({"error": "Код не найден"}), 400
 
-    if not record:
-        conn.close()
-        return jsonify({"error": "Код не найден"}), 400
+        if result == "expired":
+            return jsonify({"error": "Срок действия кода истёк, запросите новый"}), 400
 
-    if record[0] != code:
-        conn.close()
-        return jsonify({"error": "Неверный код"}), 400
+        if result == "mismatch":
+            return jsonify({"error": "Неверный код"}), 400
 
-    # ставим пользователю verified = True
-    cur.execute("UPDATE users SET verified=True WHERE email=%s", (email,))
-    conn.commit()
-    conn.close()
+        # ставим пользователю verified = True
+        cur.execute("UPDATE users SET verified=True WHERE email=%s", (email,))
 
+    # аккаунт стал доступен для входа — id сессии, выданный до этого, не переиспользуем
+    regenerate_session(session)
     return jsonify({"message": "Email подтвержден!"})
 
 # endpoint для отправки только кода по email (используется в инструкции/тесте)
-@app.post("/register/email")
+@api.post("/register/email")
 def register_email():
     data = request.get_json()
     if not data:
@@ -300,14 +293,22 @@ def register_email():
     # Генерация кода (сохранение в БД)
     code = generate_email_code(email)
 
-    ok = send_email_code(email, code)
-    if not ok:
-        return jsonify({"error": "Не удалось отправить email"}), 500
+    job_id = send_email_code(email, code)
+    if not job_id:
+        return jsonify({"error": "Не удалось отправить email"}), 503
+
+    return jsonify({"message": "Code sent", "email_job": job_id}), 200
 
-    return jsonify({"message": "Code sent"}), 200
+# Статус фоновой отправки письма: queued / sending / sent / failed
+@api.get("/register/email/status/<job_id>")
+def register_email_status(job_id):
+    status = get_mailer().status(job_id)
+    if not status:
+        return jsonify({"error": "Задание не найдено"}), 404
+    return jsonify(status), 200
 
 # ------------------- Вход по email (принимает JSON) -------------------
-@app.route("/login/email", methods=["POST"])
+@api.route("/login/email", methods=["POST"])
 def login_email():
     data = request.get_json()
     if not data:
@@ -319,11 +320,10 @@ def login_email():
     if not email or not password:
         return jsonify({"error": "Введите email и пароль"}), 400
 
-    conn = get_db()
-    cur = conn.cursor(cursor_factory=psycopg2.extras.DictCursor)
-    cur.execute("SELECT * FROM users WHERE email=%s", (email,))
-    user = cur.fetchone()
-    conn.close()
+    with db_connection() as conn:
+        cur = conn.cursor(cursor_factory=psycopg2.extras.DictCursor)
+        cur.execute("SELECT * FROM users WHERE email=%s", (email,))
+        user = cur.fetchone()
 
     if not user:
         return jsonify({"error": "Пользователь не найден"}), 404
@@ -331,9 +331,17 @@ def login_email():
     if not user["verified"]:
         return jsonify({"error": "Email не подтвержден"}), 403
 
-    if not check_password_hash(user["password"], password):
+    hasher = get_hasher()
+    if not hasher.check(user["password"], password):
         return jsonify({"error": "Неверный пароль"}), 401
 
+    # PASSWORD_HASH_METHOD поменялся — перехэшируем пароль в фоне
+    if hasher.needs_rehash(user["password"]):
+        hasher.rehash_async(password, lambda new_hash, user_id=user["id"], old_hash=user["password"]:
+                            update_password_hash(user_id, old_hash, new_hash))
+
+    # новый id сессии при входе: старый мог быть известен кому-то ещё (session fixation)
+    regenerate_session(session)
     session["user"] = {
         "id": user["id"],
         "name": user["name"],
@@ -342,117 +350,145 @@ def login_email():
 
     return jsonify({"message": "Успешный вход", "user": session["user"]}), 200
 
+def update_password_hash(user_id, old_hash, new_hash):
+    # пароль могли сменить, пока считался новый хэш
+    with db_connection() as conn:
+        conn.cursor().execute("UPDATE users SET password=%s WHERE id=%s AND password=%s",
+                              (new_hash, user_id, old_hash))
+
 # ------------------- Endpoint для проверки текущей сессии -------------------
-@app.route("/auth/user", methods=["GET"])
+@api.route("/auth/user", methods=["GET"])
 def auth_user():
     user = session.get("user")
     if not user:
         return jsonify({"authenticated": False}), 200
     return jsonify({"authenticated": True, "user": user}), 200
 # для профиля
-@app.route("/user/bookings", methods=["GET"])
-def user_bookings():
-    user = session.get("user")
-    if not user:
-        return jsonify({"error": "Не авторизован"}), 401
-
-    email = user["email"]
+# Готовый JSON броней пользователя кэшируется в памяти воркера и сбрасывается
+# при любом изменении его броней (bookings_cache.py, NOTIFY bookings_changed)
+bookings_cache = BookingsCache(get_listener)
+REGISTRY.register(GaugeCallback("bookings_cache", "Кэш /user/bookings", bookings_cache.stats))
 
-    conn = get_db()
-    cur = conn.cursor(cursor_factory=psycopg2.extras.DictCursor)
-    cur.execute("SELECT * FROM reservations WHERE user_email=%s ORDER BY date DESC", (email,))
-    rows = cur.fetchall()
-    conn.close()
+def load_user_bookings(email):
+    with db_connection() as conn:
+        cur = conn.cursor()
+        cur.execute("""
+            SELECT id, date, branch, guests, menu_items, status
+            FROM reservations WHERE user_email=%s ORDER BY date DESC
+        """, (email,))
+        rows = cur.fetchall()
 
     bookings = []
-    for r in rows:
+    for res_id, date, branch, guests, menu_items, status in rows:
         bookings.append({
-            "id": r["id"],
-            "date": str(r["date"]),
-            "branch": r["branch"],
-            "persons": r["guests"],
-            "menu": r["menu_items"],   # список меню
-            "status": r["status"]
+            "id": res_id,
+            "date": str(date),
+            "branch": branch,
+            "persons": guests,
+            "menu": menu_items,   # список меню
+            "status": status
         })
+    return current_app.json.dumps({"bookings": bookings}).encode("utf-8")
+
+@api.route("/user/bookings", methods=["GET"])
+def user_bookings():
+    user = session.get("user")
+    if not user:
+        return jsonify({"error": "Не авторизован"}), 401
 
-    return jsonify({"bookings": bookings})
+    body = bookings_cache.get_or_load(user["email"], load_user_bookings)
+    return Response(body, mimetype="application/json")
 
 # ------------------- Вход через Google (redirect) -------------------
-@app.route("/login/google")
+@api.route("/login/google")
 def login_google():
     session.permanent = True
     redirect_uri = "https://asiancafebackend.onrender.com/authorize"
-    return google.authorize_redirect(redirect_uri)
+    # authlib импортируется и клиент регистрируется при первом входе, а не при старте
+    from oidc import google_client
+    return google_client(current_app).authorize_redirect(redirect_uri)
 
-@app.route("/authorize")
+@api.route("/authorize")
 def authorize():
-    session.permanent = True
-    token = google.authorize_access_token()
-    user_info = google.get("https://openidconnect.googleapis.com/v1/userinfo").json()
-
-    session["user"] = {
-        "id": user_info.get("sub"),
-        "name": user_info.get("name"),
-        "email": user_info.get("email"),
-    }
+    from oidc import LOGIN_ERRORS, google_client, upsert_google_user
 
-    return redirect(FRONTEND_ORIGIN + "/profile")
+    session.permanent = True
+    try:
+        token = google_client(current_app).authorize_access_token()
+    except LOGIN_ERRORS as e:
+        log.warning("authorize error: %s", e)
+        return jsonify({"error": "Не удалось войти через Google"}), 400
+
+    # claims id_token, подпись и nonce уже проверены — запрос userinfo не нужен
+    claims = token.get("userinfo") or {}
+    if not claims.get("sub") or not claims.get("email"):
+        return jsonify({"error": "Google не вернул email"}), 400
+    if not claims.get("email_verified"):
+        return jsonify({"error": "Email в Google не подтвержден"}), 403
+
+    with db_connection() as conn:
+        user = upsert_google_user(conn.cursor(), claims)
+    if user is None:
+        return jsonify({"error": "Этот email привязан к другому аккаунту Google"}), 409
+
+    regenerate_session(session)
+    session["user"] = user
+    return redirect(current_app.config["FRONTEND_ORIGIN"] + "/profile")
 
 # ------------------- Выход -------------------
-@app.route("/logout", methods=["POST", "GET"])
+@api.route("/logout", methods=["POST", "GET"])
 def logout():
     session.pop("user", None)
+    regenerate_session(session)
     # если вызван AJAX — вернуть JSON
     if request.method == "POST" or request.is_json:
         return jsonify({"message": "Выход выполнен"}), 200
-    return redirect(FRONTEND_ORIGIN)
+    return redirect(current_app.config["FRONTEND_ORIGIN"])
 
-# ------------------- Меню (оставил как есть) -------------------
-@app.route("/menu", methods=["GET"])
-@app.route("/api/menu", methods=["GET"]) 
-def get_menu():
-    with open("menu.json", "r", encoding="utf-8") as f:
-        menu = json.load(f)
-    return jsonify(menu)
+# ------------------- Журнал броней (bookings.jsonl) -------------------
+# Запись только в конец файла под блокировкой, см. bookings_store.py
+booking_log = BookingLog(
+    os.path.join(BASE_DIR, "bookings.jsonl"),
+    legacy_path=os.path.join(BASE_DIR, "bookings.json"),
+)
+# Индекс телефонов для /search_booking, дочитывает журнал по мере записи
+phone_index = PhoneIndex(booking_log)
 
 # ------------------- Создание брони -------------------
-@app.route("/book", methods=["POST"])
+@api.route("/book", methods=["POST"])
 def create_booking():
-    data = request.get_json()
-    if os.path.exists("bookings.json"):
-        with open("bookings.json", "r", encoding="utf-8") as f:
-            bookings = json.load(f)
-    else:
-        bookings = []
-
-    bookings.append(data)
-    with open("bookings.json", "w", encoding="utf-8") as f:
-        json.dump(bookings, f, ensure_ascii=False, indent=4)
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        return jsonify({"error": "Нет данных"}), 400
+
+    booking_log.append(data)
     return jsonify({"message": "Бронь успешно добавлена"}), 201
 
 # ------------------- Просмотр броней -------------------
-@app.route("/bookings", methods=["GET"])
+@api.route("/bookings", methods=["GET"])
 def view_bookings():
-    if not os.path.exists("bookings.json"):
-        return jsonify([])
-    with open("bookings.json", "r", encoding="utf-8") as f:
-        bookings = json.load(f)
-    return jsonify(bookings)
+    def generate():
+        # отдаём массив по частям, не собирая все брони в памяти
+        yield "["
+        for i, booking in enumerate(booking_log.iter_records()):
+            yield ("," if i else "") + json.dumps(booking, ensure_ascii=False)
+        yield "]"
+
+    return Response(generate(), mimetype="application/json")
 
 # ------------------- Поиск брони -------------------
-@app.route("/search_booking", methods=["GET"])
+@api.route("/search_booking", methods=["GET"])
 def search_booking():
     phone = request.args.get("phone")
-    if not os.path.exists("bookings.json"):
-        return jsonify({"message": "Файл с бронями не найден"}), 404
-    with open("bookings.json", "r", encoding="utf-8") as f:
-        bookings = json.load(f)
-    results = [b for b in bookings if phone.replace("+", "") in b.get("phone", "").replace("+", "")]
+    if not phone:
+        return jsonify({"error": "phone обязателен"}), 400
+    exact = request.args.get("exact") in ("1", "true")
+    results = phone_index.search(phone, exact=exact)
     if not results:
         return jsonify({"message": "Бронь не найдена"}), 404
     return jsonify(results)
 # NEW
-@app.route("/occupied", methods=["GET"])
+@api.route("/occupied", methods=["GET"])
 def get_occupied():
     branch = request.args.get("branch")
     date = request.args.get("date")
@@ -460,61 +496,111 @@ def get_occupied():
     if not branch or not date:
         return jsonify({"error": "branch и date обязательны"}), 400
 
-    conn = get_db()
-    cur = conn.cursor()
+    with db_connection() as conn:
+        cur = conn.cursor()
+        occupied = occupied_tables(cur, branch, date)
 
-    cur.execute("""
-        SELECT tables FROM reservations
-        WHERE branch = %s AND date = %s AND status != 'cancelled'
-    """, (branch, date))
+    return jsonify({"occupied": occupied})
 
-    rows = cur.fetchall()
-    conn.close()
+# Занятость за диапазон дат для календаря: один запрос вместо /occupied на каждый день.
+# branch можно повторить или перечислить через запятую; без branch — все филиалы каталога.
+AVAILABILITY_MAX_BRANCHES = 20
 
-    occupied = []
-    for row in rows:
-        occupied.extend(row[0])
+def _branch_args():
+    """Филиалы из ?branch=: параметр можно повторить или перечислить через запятую."""
+    branches = [b.strip() for value in request.args.getlist("branch") for b in value.split(",") if b.strip()]
+    return list(dict.fromkeys(branches))
 
-    return jsonify({"occupied": occupied})
-# Создание брони
-@app.route("/reservation", methods=["POST"])
-def create_reservation():
-    data = request.get_json()
+@api.route("/availability", methods=["GET"])
+def get_availability():
+    date_from, date_to, error = parse_range(request.args)
+    if error:
+        return jsonify({"error": error}), 400
 
-    required = ["user_email", "branch", "date", "tables", "guests"]
-    if any(k not in data for k in required):
-        return jsonify({"error": "Заполнены не все обязательные поля"}), 400
+    catalog = current_app.extensions["branch_catalog"].get()
+    branches = _branch_args() or list(catalog)
+    if not branches:
+        return jsonify({"error": "branch обязателен"}), 400
+    if len(branches) > AVAILABILITY_MAX_BRANCHES:
+        return jsonify({"error": "Не больше %d филиалов" % AVAILABILITY_MAX_BRANCHES}), 400
 
-    user_email = data["user_email"]
-    branch = data["branch"]
-    date = data["date"]
-    tables = data["tables"]       # ["L4-1", "C6-1"]
-    guests = data["guests"]
-    notes = data.get("notes", "")
-    menu_items = data.get("menu_items", [])
+    with db_connection() as conn:
+        result = availability(conn.cursor(), branches, date_from, date_to, catalog)
+    return jsonify(result)
 
-    conn = get_db()
-    cur = conn.cursor()
+# Создание брони
+@api.route("/reservation", methods=["POST"])
+def create_reservation():
+    data = request.get_json(silent=True)
 
-    cur.execute("""
-        INSERT INTO reservations (user_email, branch, date, tables, guests, notes, menu_items)
-        VALUES (%s, %s, %s, %s, %s, %s, %s)
-        RETURNING id
-    """, (user_email, branch, date, tables, guests, notes, menu_items))
+    row, error = validate_reservation(data)
+    if error:
+        return jsonify({"error": error}), 400
 
-    res_id = cur.fetchone()[0]
-    conn.commit()
-    conn.close()
+    with db_connection() as conn:
+        cur = conn.cursor()
+        res_id, taken = insert_reservations(cur, [row])[0]
 
+    if taken:
+        return tables_taken_response(taken)
+    bookings_cache.invalidate(row[0])
     return jsonify({"success": True, "reservation_id": res_id})
 
+def tables_taken_response(taken):
+    """409: столы уже заняты другой бронью — фронтенду не нужно перепроверять /occupied."""
+    return jsonify({
+        "error": "Выбранные столы уже заняты",
+        "conflict": True,
+        "taken": taken,
+    }), 409
+
+# Пакетное создание: {"reservations": [{...}, ...]} — один INSERT в одной транзакции.
+# Невалидные элементы не мешают остальным и возвращаются с ошибкой по индексу.
+BATCH_MAX = 500
+
+@api.route("/reservations/batch", methods=["POST"])
+def create_reservations_batch():
+    data = request.get_json(silent=True)
+    items = data.get("reservations") if isinstance(data, dict) else data
+    if not isinstance(items, list) or not items:
+        return jsonify({"error": "Ожидается непустой список reservations"}), 400
+    if len(items) > BATCH_MAX:
+        return jsonify({"error": f"Не больше {BATCH_MAX} броней за запрос"}), 413
+
+    results = []
+    valid = []
+    for i, item in enumerate(items):
+        row, error = validate_reservation(item)
+        if error:
+            results.append({"index": i, "error": error})
+        else:
+            results.append(None)
+            valid.append((i, row))
+
+    if valid:
+        with db_connection() as conn:
+            cur = conn.cursor()
+            inserted = insert_reservations(cur, [row for _, row in valid])
+        bookings_cache.invalidate(*{row[0] for _, row in valid})
+        for (i, _), (res_id, taken) in zip(valid, inserted):
+            if taken:
+                results[i] = {"index": i, "error": "Выбранные столы уже заняты",
+                              "conflict": True, "taken": taken}
+            else:
+                results[i] = {"index": i, "reservation_id": res_id}
+
+    created = sum(1 for r in results if "reservation_id" in r)
+    status = 201 if created else (409 if valid else 400)
+    return jsonify({"success": bool(created), "created": created, "results": results}), status
+
 # ------------------- Pending booking (server-side temporary) -------------------
 from flask import session as flask_session  # если не импортирован выше
 
-@app.route("/pending", methods=["POST"])
+@api.route("/pending", methods=["POST"])
 def save_pending():
     """
-    Сохраняет временную бронь в сессии (для незалогиненных).
+    Сохраняет временную бронь в серверной сессии (для незалогиненных);
+    браузеру уходит только id сессии.
     Ожидает JSON с payload, например:
     {
       "branch": "...",
@@ -525,8 +611,8 @@ def save_pending():
       "menu_items": ["Рамен 1", ...]
     }
     """
-    data = request.get_json()
-    if not data:
+    data = request.get_json(silent=True)
+    if not data or not isinstance(data, dict):
         return jsonify({"error": "Нет данных"}), 400
 
     # сохраняем в flask session
@@ -535,7 +621,7 @@ def save_pending():
     return jsonify({"message": "pending saved"}), 200
 
 
-@app.route("/pending/claim", methods=["POST"])
+@api.route("/pending/claim", methods=["POST"])
 def claim_pending():
     """
     Если пользователь авторизован (session['user']), берет pending из session
@@ -547,40 +633,38 @@ def claim_pending():
         return jsonify({"error": "Не авторизован"}), 401
 
     # Попытка взять pending из body (т.к. фронтенд может отправить localStorage copy)
-    body = request.get_json(silent=True) or {}
+    body = request.get_json(silent=True)
+    if not isinstance(body, dict):
+        body = {}
     pending = body.get("pending") or flask_session.get("pending_booking")
 
     if not pending:
         return jsonify({"message": "Нет pending брони"}), 200
+    if not isinstance(pending, dict):
+        return jsonify({"error": "pending должен быть объектом"}), 400
 
     # валидируем минимальные поля
     required = ["branch", "date", "tables", "guests"]
     if any(k not in pending for k in required):
         return jsonify({"error": "Заполнены не все обязательные поля в pending"}), 400
 
-    user_email = user.get("email")
-    branch = pending["branch"]
-    date = pending["date"]
-    tables = pending["tables"]
-    guests = pending["guests"]
-    notes = pending.get("notes", "")
-    menu_items = pending.get("menu_items", [])
+    row, error = validate_reservation(dict(pending, user_email=user.get("email")))
+    if error:
+        return jsonify({"error": error}), 400
 
     try:
-        conn = get_db()
-        cur = conn.cursor()
-        cur.execute("""
-            INSERT INTO reservations (user_email, branch, date, tables, guests, notes, menu_items)
-            VALUES (%s, %s, %s, %s, %s, %s, %s)
-            RETURNING id
-        """, (user_email, branch, date, tables, guests, notes, menu_items))
-        res_id = cur.fetchone()[0]
-        conn.commit()
-        conn.close()
+        with db_connection() as conn:
+            cur = conn.cursor()
+            res_id, taken = insert_reservations(cur, [row])[0]
     except Exception as e:
-        print("claim_pending error:", e)
+        log.exception("claim_pending error: %s", e)
         return jsonify({"error": "Ошибка при создании брони"}), 500
 
+    if taken:
+        # pending оставляем в сессии: гость выберет другие столы
+        return tables_taken_response(taken)
+
+    bookings_cache.invalidate(row[0])
     # Убираем pending из session
     flask_session.pop("pending_booking", None)
 
@@ -588,38 +672,35 @@ def claim_pending():
 
 
 # POST /reservation/confirm
-@app.route("/reservation/confirm", methods=["POST"])
+@api.route("/reservation/confirm", methods=["POST"])
 def confirm_reservation():
     data = request.get_json()
     res_id = data.get("reservation_id")
     if not res_id:
         return jsonify({"error": "reservation_id required"}), 400
 
-    conn = get_db()
-    cur = conn.cursor()
-    cur.execute("UPDATE reservations SET status = 'confirmed' WHERE id = %s RETURNING id", (res_id,))
-    row = cur.fetchone()
-    conn.commit()
-    conn.close()
+    with db_connection() as conn:
+        cur = conn.cursor()
+        rows, conflicts = apply_status(cur, [res_id], "confirmed")
 
-    if not row:
+    bookings_cache.invalidate(*{r[-1] for r in rows})
+    if conflicts:
+        return tables_taken_response(next(iter(conflicts.values())))
+    if not rows:
         return jsonify({"error": "Reservation not found"}), 404
 
     return jsonify({"success": True, "reservation_id": res_id}), 200
 
-@app.route("/reservation/cancel", methods=["POST"])
+@api.route("/reservation/cancel", methods=["POST"])
 def cancel_reservation():
     try:
         # 1. Сначала попробуем получить JSON
         data = request.get_json(silent=True) # Используем silent=True, чтобы не упасть, если JSON невалидный
-        print("CANCEL RECEIVED (JSON):", data)
 
-        # 2. Если JSON не получен, логируем сырые данные/заголовки
+        # 2. Если JSON не получен — 400 (заголовки не логируем: там cookie и Authorization)
         if data is None:
-            # Попробуем прочитать как текст, если get_json провалился
-            raw_data = request.data.decode('utf-8')
-            print("CANCEL FAILED. RAW DATA RECEIVED:", raw_data)
-            print("HEADERS:", request.headers)
+            log.info("cancel_reservation: no JSON (Content-Type %s, %d bytes)",
+                     request.content_type, request.content_length or 0)
             return jsonify({"error": "No valid JSON payload received or 'id' is missing"}), 400
 
         # 3. Продолжаем, если JSON есть
@@ -629,44 +710,196 @@ def cancel_reservation():
             # Сюда мы, вероятно, попадаем. data - это {}, или 'id' - None/0
             return jsonify({"error": "Missing or invalid reservation id field in JSON"}), 400
 
-        conn = get_db()
-        cur = conn.cursor()
-
-        cur.execute("""
-            UPDATE reservations
-            SET status = 'cancelled'
-            WHERE id = %s
-            RETURNING id;
-        """, (res_id,))
+        with db_connection() as conn:
+            cur = conn.cursor()
 
-        row = cur.fetchone()
-        conn.commit()
-        conn.close()
+            rows, _ = apply_status(cur, [res_id], "cancelled")
 
-        if not row:
+        bookings_cache.invalidate(*{r[-1] for r in rows})
+        if not rows:
             return jsonify({"error": "Reservation not found"}), 404
         
 
         return jsonify({"success": True}), 200
 
     except Exception as e:
-        print("cancel_reservation ERROR:", e)
+        log.exception("cancel_reservation ERROR: %s", e)
         return jsonify({"error": str(e)}), 500
 
 
+# Массовая смена статуса (закрыть день, отменить вечер филиала):
+#   {"status": "cancelled", "ids": [1, 2, 3]}
+#   {"status": "confirmed", "filter": {"branch": "...", "date": "YYYY-MM-DD", "status": "pending"}}
+# ids и filter можно совместить. Один UPDATE на все брони, столы освобождаются
+# и занимаются одним запросом (occupancy.update_status), кэш сбрасывается один раз.
+# Брони, у которых уже этот статус, не трогаются. Фильтр без ids не задевает
+# отменённые брони («подтвердить весь день» не воскрешает отмены), если только
+# в нём явно не указан status: "cancelled".
+RESERVATION_STATUSES = ("pending", "confirmed", "cancelled")
+STATUS_IDS_MAX = 5000
+
+@api.route("/admin/reservations/status", methods=["POST"])
+def bulk_reservation_status():
+    check_admin_token()
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        return jsonify({"error": "Нет данных"}), 400
+
+    status = data.get("status")
+    if status not in RESERVATION_STATUSES:
+        return jsonify({"error": "status: одно из " + ", ".join(RESERVATION_STATUSES)}), 400
+    ids = data.get("ids") or []
+    filters = data.get("filter") or {}
+    if not isinstance(ids, list) or not isinstance(filters, dict):
+        return jsonify({"error": "ids — список, filter — объект"}), 400
+    if len(ids) > STATUS_IDS_MAX:
+        return jsonify({"error": f"Не больше {STATUS_IDS_MAX} id за запрос"}), 413
+    # только целые числа JSON: true, "17" и 17.9 — ошибка клиента, а не id 1 или 17
+    if not all(type(i) is int for i in ids):
+        return jsonify({"error": "ids — целые числа"}), 400
+    ids = sorted(set(ids))
+    try:
+        where, params = _bookings_filters(filters)
+    except (TypeError, ValueError):
+        return jsonify({"error": "Даты в формате YYYY-MM-DD"}), 400
+    # без ids фильтр только по статусу задел бы всю историю броней
+    if not ids and not any(filters.get(f) for f in ("branch", "date", "date_from", "date_to")):
+        return jsonify({"error": "Нужны ids или filter с branch или датой"}), 400
+    if ids:
+        where.append("id = ANY(%s)")
+        params.append(ids)
+    elif not filters.get("status"):
+        where.append("status IS DISTINCT FROM 'cancelled'")
+
+    with db_connection() as conn:
+        rows, conflicts = update_status(conn.cursor(), where, params, status, changed_only=True)
+
+    bookings_cache.invalidate(*{r[-1] for r in rows})
+    updated = [r[0] for r in rows]
+    result = {
+        "success": True,
+        "status": status,
+        "updated": updated,
+        "count": len(updated),
+        # восстановить из cancelled не удалось: столы уже заняты другой бронью
+        "conflicts": [{"id": res_id, "taken": taken} for res_id, taken in sorted(conflicts.items())],
+    }
+    if ids:
+        # нет такой брони или статус уже был этим
+        done = set(updated) | set(conflicts)
+        result["unchanged"] = [i for i in ids if i not in done]
+    return jsonify(result), 200
+
 # Просмотр всех броней
-@app.route("/admin/bookings", methods=["GET"])
+# Фильтры: branch, date, date_from, date_to, status.
+# С limit/cursor — постранично (keyset по created_at, id): {"items": [...], "next_cursor": ...}.
+# Без них — весь список потоком через серверный курсор (память не растёт с историей).
+# Отдаёт почту, телефоны и заметки гостей — только с ADMIN_TOKEN (check_admin_token).
+ADMIN_PAGE_MAX = 1000
+EXPORT_CHUNK = 500
+
+def _encode_cursor(row):
+    raw = json.dumps([row["created_at"].isoformat(), row["id"]])
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+def _decode_cursor(cursor):
+    raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+    created_at, res_id = json.loads(raw)
+    return datetime.fromisoformat(created_at), int(res_id)
+
+def _bookings_filters(args):
+    where, params = [], []
+    for field, column, op in (("branch", "branch", "="), ("status", "status", "="), ("date", "date", "="),
+                              ("date_from", "date", ">="), ("date_to", "date", "<=")):
+        value = args.get(field)
+        if value:
+            if column == "date":
+                value = date_cls.fromisoformat(value)
+            where.append(f"{column} {op} %s")
+            params.append(value)
+    return where, params
+
+@api.route("/admin/bookings", methods=["GET"])
 def get_bookings():
-    conn = get_db()
-    cur = conn.cursor(cursor_factory=psycopg2.extras.DictCursor)
-
-    cur.execute("SELECT * FROM reservations ORDER BY created_at DESC")
-    rows = cur.fetchall()
-    conn.close()
+    check_admin_token()
+    try:
+        where, params = _bookings_filters(request.args)
+    except ValueError:
+        return jsonify({"error": "Даты в формате YYYY-MM-DD"}), 400
 
-    return jsonify([dict(r) for r in rows])
+    if "limit" not in request.args and "cursor" not in request.args:
+        return _export_bookings(where, params)
 
-@app.route("/api/reserve-tables", methods=["POST"])
+    try:
+        limit = min(max(int(request.args.get("limit", 100)), 1), ADMIN_PAGE_MAX)
+        if request.args.get("cursor"):
+            created_at, res_id = _decode_cursor(request.args["cursor"])
+            where.append("(created_at, id) < (%s, %s)")
+            params += [created_at, res_id]
+    except (TypeError, ValueError):
+        return jsonify({"error": "Некорректные limit или cursor"}), 400
+
+    sql = "SELECT * FROM reservations"
+    if where:
+        sql += " WHERE " + " AND ".join(where)
+    sql += " ORDER BY created_at DESC, id DESC LIMIT %s"
+
+    with db_connection() as conn:
+        cur = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
+        cur.execute(sql, params + [limit + 1])
+        rows = cur.fetchall()
+
+    next_cursor = _encode_cursor(rows[limit - 1]) if len(rows) > limit else None
+    return jsonify({"items": rows[:limit], "next_cursor": next_cursor})
+
+def _export_bookings(where, params):
+    sql = "SELECT * FROM reservations"
+    if where:
+        sql += " WHERE " + " AND ".join(where)
+    sql += " ORDER BY created_at DESC, id DESC"
+
+    def generate():
+        # соединение занято, пока клиент читает ответ; вернётся в пул в конце
+        with db_connection() as conn:
+            cur = conn.cursor(name="admin_bookings_export",
+                              cursor_factory=psycopg2.extras.RealDictCursor)
+            cur.itersize = EXPORT_CHUNK
+            cur.execute(sql, params)
+            yield "["
+            first = True
+            while True:
+                rows = cur.fetchmany(EXPORT_CHUNK)
+                if not rows:
+                    break
+                chunk = ",".join(current_app.json.dumps(r) for r in rows)
+                yield chunk if first else "," + chunk
+                first = False
+            yield "]"
+            cur.close()
+
+    return Response(stream_with_context(generate()), mimetype="application/json")
+
+# Отчёт для панели: брони по филиалам и дням, средний размер компании, пиковые дни,
+# популярные столы и блюда. ?from=&to= (по умолчанию 30 дней), ?branch= (без него —
+# все филиалы), ?group=day|week|month. Читает агрегаты (stats.py, миграция 011).
+@api.route("/admin/stats", methods=["GET"])
+def admin_stats():
+    # numpy загружается при первом отчёте, а не при старте воркера
+    from stats import parse_stats_args, stats_report
+
+    check_admin_token()
+    date_from, date_to, group, error = parse_stats_args(request.args)
+    if error:
+        return jsonify({"error": error}), 400
+    branches = _branch_args()
+    if len(branches) > AVAILABILITY_MAX_BRANCHES:
+        return jsonify({"error": "Не больше %d филиалов" % AVAILABILITY_MAX_BRANCHES}), 400
+
+    with db_connection() as conn:
+        result = stats_report(conn.cursor(), branches, date_from, date_to, group)
+    return jsonify(result)
+
+@api.route("/api/reserve-tables", methods=["POST"])
 def reserve_tables():
     data = request.get_json()
     tables = data.get("tables")
@@ -682,34 +915,50 @@ def reserve_tables():
     }), 200
 
 # ------------------- Очистка -------------------
-@app.route("/clear_bookings", methods=["DELETE"])
+@api.route("/clear_bookings", methods=["DELETE"])
 def clear_bookings():
-    with open("bookings.json", "w", encoding="utf-8") as f:
-        json.dump([], f, ensure_ascii=False, indent=4)
+    booking_log.clear()
     return jsonify({"message": "Все брони удалены"}), 200
 
-@app.before_request
+# Счётчики пула соединений (для подбора DB_POOL_MIN / DB_POOL_MAX)
+@api.route("/admin/db/pool", methods=["GET"])
+def db_pool_stats():
+    check_admin_token()
+    return jsonify(get_pool().stats())
+
+# Очередь писем: глубина, отправлено/ошибок, среднее время отправки
+@api.route("/admin/mail/queue", methods=["GET"])
+def mail_queue_stats():
+    check_admin_token()
+    return jsonify(get_mailer().stats())
+
+@api.app_errorhandler(PoolTimeout)
+def handle_pool_timeout(e):
+    return jsonify({"error": "Сервер перегружен, попробуйте позже"}), 503
+
+@api.app_errorhandler(HashPoolBusy)
+def handle_hash_pool_busy(e):
+    response = jsonify({"error": "Слишком много входов одновременно, повторите через секунду"})
+    response.headers["Retry-After"] = "1"
+    return response, 503
+
+@api.before_app_request
 def log_request():
-    print("REQUEST:", request.method, request.path)
+    # запись уходит в очередь, в stderr её пишет фоновый поток (applog.py)
+    log.info("REQUEST: %s %s", request.method, request.path)
 
-@app.route("/reservation/confirm", methods=["OPTIONS"])
+@api.route("/reservation/confirm", methods=["OPTIONS"])
 def confirm_reservation_options():
   return "", 200
 
 # ------------------- Запуск -------------------
-if __name__ == "__main__":
-    init_pg()
-    if not os.path.exists("bookings.json"):
-        with open("bookings.json", "w", encoding="utf-8") as f:
-            json.dump([], f, ensure_ascii=False, indent=4)
+# gunicorn: gunicorn -c gunicorn.conf.py app:app (--preload и прогрев воркеров)
+app = create_app()
 
-    # menu.json и menu_api инициализация s
-    try:
-        from menu_api import menu_api, init_menu
-        init_menu()
-        app.register_blueprint(menu_api)
-    except Exception as e:
-        print("menu_api not loaded:", e)
+if __name__ == "__main__":
+    # локальный запуск: заодно применяем миграции (в проде — отдельный шаг деплоя)
+    with db_connection() as conn:
+        migrations.upgrade(conn)
 
     print("Сервер запущен: http://127.0.0.1:5000")
     app.run(host="0.0.0.0", port=5000, debug=True)
@@ -0,0 +1,74 @@
+"""
+Неблокирующий лог приложения.
+
+Обработчик запроса только кладёт запись в ограниченную очередь (QueueHandler),
+а в stderr её пишет отдельный поток (QueueListener). Медленный stdout/stderr
+контейнера не задерживает запросы; если очередь переполнена, запись
+отбрасывается и учитывается в метрике log_records_dropped_total.
+
+Модули пишут в logging.getLogger(__name__): обработчик стоит на корневом
+логгере, поэтому print() в коде приложения не нужен.
+
+Настройки: LOG_LEVEL (INFO), LOG_QUEUE_SIZE (10000).
+"""
+import atexit
+import logging
+import logging.handlers
+import os
+import queue
+import threading
+
+from metrics import LOG_DROPPED
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """
+    QueueHandler, который не блокирует и не пишет traceback при переполнении.
+    Поток-писатель не переживает fork, поэтому в новом процессе он запускается заново.
+    """
+
+    def __init__(self, target):
+        super().__init__(queue.Queue(maxsize=int(os.getenv("LOG_QUEUE_SIZE", "10000"))))
+        self.target = target
+        self._listener = None
+        self._pid = None
+        self._start_lock = threading.Lock()
+
+    def _ensure_listener(self):
+        pid = os.getpid()
+        if self._pid == pid:
+            return
+        with self._start_lock:
+            if self._pid != pid:
+                self.queue = queue.Queue(maxsize=self.queue.maxsize)
+                self._listener = logging.handlers.QueueListener(self.queue, self.target,
+                                                                respect_handler_level=True)
+                self._listener.start()
+                atexit.register(self._listener.stop)
+                self._pid = pid
+
+    def prepare(self, record):
+        # форматирование — в потоке-писателе, а не в обработчике запроса
+        return record
+
+    def enqueue(self, record):
+        self._ensure_listener()
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            LOG_DROPPED.inc()
+
+
+def setup_logging(name="cafe"):
+    """
+    Ставит фоновую запись на корневой логгер, чтобы через очередь шли и логгеры
+    модулей (logging.getLogger(__name__)), и библиотек. Возвращает логгер
+    приложения; повторный вызов ничего не добавляет.
+    """
+    root = logging.getLogger()
+    if not any(isinstance(h, DroppingQueueHandler) for h in root.handlers):
+        stream = logging.StreamHandler()
+        stream.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(name)s: %(message)s"))
+        root.addHandler(DroppingQueueHandler(stream))
+        root.setLevel(os.getenv("LOG_LEVEL", "INFO").upper())
+    return logging.getLogger(name)
@@ -0,0 +1,111 @@
+"""
+Занятость столов за диапазон дат: /availability?branch=&from=&to=
+
+Календарь на месяц раньше делал запрос /occupied на каждый день. Здесь весь
+диапазон по нескольким филиалам читается одним запросом из индекса занятости
+(table_usage, уникальный индекс branch, date, table_id) и кодируется компактно:
+
+    {"from": "2025-01-01", "to": "2025-01-31",
+     "branches": {"Абая 150": {"tables": ["C6-1", "L4-1", ...],
+                               "days": {"2025-01-03": "0500", ...},
+                               "full": ["2025-01-05"]}}}
+
+- tables — порядок столов филиала: из каталога BRANCHES_FILE (branches.json,
+  {"филиал": ["стол", ...]}), а столы, которых в каталоге нет, — в конце по алфавиту;
+- days — только дни, где что-то занято; значение — битовая маска в hex:
+  стол tables[i] занят, если бит i % 8 байта i // 8 равен 1
+  (в JS: parseInt(mask.substr((i >> 3) * 2, 2), 16) >> (i & 7) & 1);
+- full — дни, когда заняты все столы каталога (только если филиал есть в каталоге).
+
+Без каталога tables — столы, занятые хотя бы раз в этом диапазоне.
+"""
+import json
+import os
+from datetime import date as date_cls
+
+AVAILABILITY_MAX_DAYS = int(os.getenv("AVAILABILITY_MAX_DAYS", "92"))
+
+
+class BranchCatalog:
+    """Столы филиалов из json-файла; перечитывается при изменении файла, файла может не быть."""
+
+    def __init__(self, path):
+        self.path = path
+        self._key = None
+        self._branches = {}
+
+    def get(self):
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            return {}
+        key = (st.st_mtime_ns, st.st_size)
+        if key != self._key:
+            with open(self.path, "r", encoding="utf-8") as f:
+                branches = json.load(f)
+            self._branches = {str(name): [str(t) for t in tables] for name, tables in branches.items()}
+            self._key = key
+        return self._branches
+
+
+def parse_range(args):
+    """from/to из query-строки. Возвращает (date_from, date_to, None) или (None, None, ошибка)."""
+    try:
+        date_from = date_cls.fromisoformat(args.get("from", ""))
+        date_to = date_cls.fromisoformat(args.get("to", ""))
+    except ValueError:
+        return None, None, "from и to обязательны, формат YYYY-MM-DD"
+    if date_to < date_from:
+        return None, None, "to раньше from"
+    if (date_to - date_from).days + 1 > AVAILABILITY_MAX_DAYS:
+        return None, None, "Диапазон не больше %d дней" % AVAILABILITY_MAX_DAYS
+    return date_from, date_to, None
+
+
+def occupied_by_day(cur, branches, date_from, date_to):
+    """{branch: [(date, [занятые столы]), ...]} по возрастанию даты — один запрос на весь диапазон."""
+    cur.execute("""
+        SELECT branch, date, array_agg(DISTINCT table_id)
+        FROM table_usage
+        WHERE branch = ANY(%s) AND date BETWEEN %s AND %s
+        GROUP BY branch, date
+        ORDER BY branch, date
+    """, (list(branches), date_from, date_to))
+    result = {}
+    for branch, day, tables in cur.fetchall():
+        result.setdefault(branch, []).append((day, tables))
+    return result
+
+
+def encode_mask(positions, size):
+    """Позиции занятых столов -> hex-маска (бит i % 8 байта i // 8)."""
+    mask = bytearray((size + 7) // 8)
+    for i in positions:
+        mask[i >> 3] |= 1 << (i & 7)
+    return mask.hex()
+
+
+def availability(cur, branches, date_from, date_to, catalog=None):
+    """Ответ /availability (формат — в docstring модуля)."""
+    catalog = catalog or {}
+    occupied = occupied_by_day(cur, branches, date_from, date_to)
+
+    result = {}
+    for branch in branches:
+        rows = occupied.get(branch, [])
+        known = catalog.get(branch)
+        tables = list(known or ())
+        tables += sorted({t for _, busy in rows for t in busy}.difference(tables))
+        index = {table_id: i for i, table_id in enumerate(tables)}
+
+        days, full = {}, []
+        for day, busy in rows:
+            days[day.isoformat()] = encode_mask((index[t] for t in busy), len(tables))
+            if known and set(known).issubset(busy):
+                full.append(day.isoformat())
+
+        entry = {"tables": tables, "days": days}
+        if known:
+            entry["full"] = full
+        result[branch] = entry
+    return {"from": date_from.isoformat(), "to": date_to.isoformat(), "branches": result}
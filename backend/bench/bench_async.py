@@ -0,0 +1,139 @@
+"""
+Синхронный gunicorn против gevent-режима (gevent_app.py) при медленном внешнем
+провайдере.
+
+Каждый клиент проходит вход через Google: GET /login/google (редирект к
+провайдеру), GET /authorize у LocalOIDC (редирект обратно с кодом), затем
+GET /authorize приложения — оно меняет код на токен (ответ задерживается на
+--delay секунд, как у медленного Google) и сохраняет пользователя в users.
+Параллельно отдельный клиент раз в 20 мс запрашивает /menu — насколько
+ожидание провайдера мешает остальным запросам.
+
+    python -m bench.bench_async [--clients 200] [--delay 0.2] [--duration 15]
+
+Нужен gunicorn, gevent + psycogreen (requirements.txt) и initdb/pg_ctl (PATH или PG_BIN).
+"""
+import argparse
+import http.client
+import os
+import statistics
+import sys
+import threading
+import time
+from urllib.parse import urlparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench.http_bench import Client, percentile, start_gunicorn  # noqa: E402
+from bench.local_services import LocalOIDC, LocalPostgres, _free_port  # noqa: E402
+
+
+def login_flow(client, provider):
+    status, _ = client.request("GET", "/login/google")
+    if status != 302 or not client.last_location:
+        return False
+    url = urlparse(client.last_location)
+    status, _ = provider.request("GET", url.path + "?" + url.query)
+    if status != 302 or not provider.last_location:
+        return False
+    # redirect_uri указывает на прод — берём только path и query
+    url = urlparse(provider.last_location)
+    status, _ = client.request("GET", url.path + "?" + url.query)
+    return status == 302 and client.last_location.endswith("/profile")
+
+
+def run(port, oidc_port, clients, duration):
+    logins, menu, errors = [], [], [0]
+    lock = threading.Lock()
+    stop_at = time.monotonic() + duration
+
+    def login_worker():
+        client = Client("127.0.0.1", port, timeout=60)
+        provider = Client("127.0.0.1", oidc_port, timeout=60)
+        while time.monotonic() < stop_at:
+            client.cookie = None
+            started = time.perf_counter()
+            try:
+                ok = login_flow(client, provider)
+            except (http.client.HTTPException, OSError):
+                ok = False
+            with lock:
+                if ok:
+                    logins.append(time.perf_counter() - started)
+                else:
+                    errors[0] += 1
+        client.close()
+        provider.close()
+
+    def menu_worker():
+        client = Client("127.0.0.1", port, timeout=60)
+        while time.monotonic() < stop_at:
+            started = time.perf_counter()
+            try:
+                client.request("GET", "/menu")
+                menu.append(time.perf_counter() - started)
+            except (http.client.HTTPException, OSError):
+                pass
+            time.sleep(0.02)
+        client.close()
+
+    threads = [threading.Thread(target=login_worker) for _ in range(clients)]
+    threads.append(threading.Thread(target=menu_worker))
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return logins, menu, errors[0]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--clients", type=int, default=200)
+    parser.add_argument("--delay", type=float, default=0.2, help="задержка token/userinfo, с")
+    parser.add_argument("--duration", type=float, default=15.0)
+    parser.add_argument("--sync-workers", type=int, default=4)
+    parser.add_argument("--gevent-workers", type=int, default=1)
+    parser.add_argument("--worker-connections", type=int, default=2000)
+    args = parser.parse_args()
+
+    modes = [
+        ("sync x%d" % args.sync_workers,
+         dict(workers=args.sync_workers, worker_class="sync", target="app:app")),
+        ("gevent x%d" % args.gevent_workers,
+         dict(workers=args.gevent_workers, worker_class="gevent", target="gevent_app:app",
+              extra=["--worker-connections", str(args.worker_connections)])),
+    ]
+
+    with LocalPostgres(), LocalOIDC(delay=args.delay) as oidc:
+        os.environ.update({
+            "DB_POOL_MAX": str(min(args.clients, 50)),
+            "GOOGLE_DISCOVERY_URL": oidc.discovery_url,
+            "GOOGLE_CLIENT_ID": "bench-client",
+            "GOOGLE_CLIENT_SECRET": "bench-secret",
+            "SESSION_BACKEND": "cookie",
+            "MENU_SOURCE": "file",
+            "SESSION_SECRET": "bench-secret",
+            "LOG_LEVEL": "WARNING",
+        })
+        print("%d клиентов, задержка провайдера %.0f мс на запрос, %.0f с" % (
+            args.clients, args.delay * 1000, args.duration))
+        print("%-12s %9s %8s %10s %10s %10s %12s %12s" % (
+            "режим", "входов", "ошибок", "входов/с", "p50 мс", "p99 мс", "/menu p50", "/menu p99"))
+        for name, options in modes:
+            port = _free_port()
+            stop = start_gunicorn(port, **options)
+            try:
+                logins, menu, errors = run(port, oidc.server_address[1], args.clients, args.duration)
+            finally:
+                stop()
+            print("%-12s %9d %8d %10.1f %10.0f %10.0f %12.1f %12.1f" % (
+                name, len(logins), errors, len(logins) / args.duration,
+                statistics.median(logins) * 1000 if logins else 0,
+                percentile(logins, 0.99) * 1000 if logins else 0,
+                statistics.median(menu) * 1000 if menu else 0,
+                percentile(menu, 0.99) * 1000 if menu else 0))
+        print("запросов к провайдеру:", oidc.calls)
+
+
+if __name__ == "__main__":
+    main()
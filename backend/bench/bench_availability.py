@@ -0,0 +1,101 @@
+"""
+Календарь занятости: /occupied на каждый день против одного /availability
+(локальный PostgreSQL, тестовый клиент Flask).
+
+Заполняет table_usage для --branches филиалов на --days дней (занята примерно
+--fill доля столов) и измеряет время построения календаря на весь диапазон
+по всем филиалам: N*days запросов /occupied против одного /availability.
+
+    python -m bench.bench_availability [--branches 3] [--days 90] [--fill 0.5]
+
+Нужны initdb/pg_ctl в PATH (или PG_BIN).
+"""
+import argparse
+import json
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+from urllib.parse import urlencode
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench.http_bench import TABLES  # noqa: E402
+from bench.local_services import LocalPostgres  # noqa: E402
+
+
+def seed(pg, branches, days, fill, rnd):
+    today = date.today()
+    rows = []
+    for branch in branches:
+        for offset in range(days):
+            for table_id in TABLES:
+                if rnd.random() < fill:
+                    rows.append((branch, today + timedelta(days=offset), table_id))
+    conn = pg.connect()
+    cur = conn.cursor()
+    cur.executemany("INSERT INTO table_usage (branch, date, table_id, used_seats) VALUES (%s, %s, %s, 2)", rows)
+    cur.execute("ANALYZE table_usage")
+    conn.commit()
+    conn.close()
+    return len(rows)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--branches", type=int, default=3)
+    parser.add_argument("--days", type=int, default=90)
+    parser.add_argument("--fill", type=float, default=0.5)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    os.environ.setdefault("SESSION_SECRET", "bench-secret")
+    os.environ.setdefault("SESSION_BACKEND", "memory")
+    os.environ.setdefault("MENU_SOURCE", "file")
+    os.environ["LOG_LEVEL"] = "WARNING"
+    branches = ["Филиал %d" % i for i in range(1, args.branches + 1)]
+    catalog = tempfile.NamedTemporaryFile("w", suffix=".json", delete=False, encoding="utf-8")
+    json.dump({branch: TABLES for branch in branches}, catalog, ensure_ascii=False)
+    catalog.close()
+    os.environ["BRANCHES_FILE"] = catalog.name
+
+    try:
+        with LocalPostgres() as pg:
+            rows = seed(pg, branches, args.days, args.fill, random.Random(1))
+            import app as cafe
+
+            client = cafe.app.test_client()
+            today = date.today()
+            dates = [(today + timedelta(days=i)).isoformat() for i in range(args.days)]
+
+            per_day, single, size = [], [], 0
+            for _ in range(args.repeat):
+                started = time.perf_counter()
+                for branch in branches:
+                    for day in dates:
+                        client.get("/occupied?" + urlencode({"branch": branch, "date": day})).close()
+                per_day.append((time.perf_counter() - started) * 1000)
+
+                started = time.perf_counter()
+                response = client.get("/availability?" + urlencode(
+                    {"from": dates[0], "to": dates[-1], "branch": ",".join(branches)}))
+                single.append((time.perf_counter() - started) * 1000)
+                size = len(response.data)
+                response.close()
+
+            print("%d филиалов x %d дней, %d занятых столов (из %d)" % (
+                args.branches, args.days, rows, args.branches * args.days * len(TABLES)))
+            print("%-28s %10s %10s" % ("", "p50 мс", "max мс"))
+            print("%-28s %10.1f %10.1f" % ("/occupied x %d" % (args.branches * args.days),
+                                            statistics.median(per_day), max(per_day)))
+            print("%-28s %10.1f %10.1f" % ("/availability x 1", statistics.median(single), max(single)))
+            print("размер ответа /availability: %d байт" % size)
+    finally:
+        os.unlink(catalog.name)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+"""
+Бенчмарк пакетного создания броней на локальном PostgreSQL.
+
+Сравнивает N отдельных POST /reservation (соединение, INSERT и коммит
+на каждую бронь) с одним POST /reservations/batch на N броней
+(многострочный INSERT в одной транзакции). Затем проверяет пакет со
+спором за столы: A=[2], B=[1, 2], C=[1] — B проигрывает стол 2 брони A,
+и освобождённый им стол 1 должен достаться C.
+
+    python -m bench.bench_batch_reservations [--size 50] [--rounds 10]
+
+Нужны initdb/pg_ctl в PATH (или PG_BIN).
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench.local_services import LocalPostgres  # noqa: E402
+
+
+def make_items(round_no, size, prefix):
+    # у каждой брони свой стол, чтобы пакеты не конфликтовали между собой
+    return [{
+        "user_email": "guest%d@example.com" % i,
+        "branch": "Bench",
+        "date": "2030-01-%02d" % (round_no % 28 + 1),
+        "tables": ["%s-%d-%d" % (prefix, round_no, i)],
+        "guests": 2,
+        "menu_items": ["Классический рамен"],
+    } for i in range(size)]
+
+
+def check_cascade(client):
+    """Проигравшая бронь отдаёт столы, которые успела занять, следующей по порядку."""
+    item = {"user_email": "cascade@example.com", "branch": "Bench", "date": "2030-03-01", "guests": 2}
+    resp = client.post("/reservations/batch", json={"reservations": [
+        dict(item, tables=["X-2"]), dict(item, tables=["X-1", "X-2"]), dict(item, tables=["X-1"])]})
+    results = resp.get_json()["results"]
+    assert resp.status_code == 201 and resp.get_json()["created"] == 2, resp.get_json()
+    assert "reservation_id" in results[0] and "reservation_id" in results[2], results
+    assert results[1]["taken"] == ["X-1", "X-2"], results
+    print("спор за столы в пакете: A и C созданы, B — 409 (заняты X-1, X-2)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--size", type=int, default=50)
+    parser.add_argument("--rounds", type=int, default=10)
+    args = parser.parse_args()
+
+    with LocalPostgres():
+        from app import app
+        client = app.test_client()
+
+        started = time.perf_counter()
+        for r in range(args.rounds):
+            for item in make_items(r, args.size, "S"):
+                assert client.post("/reservation", json=item).status_code == 200
+        single = time.perf_counter() - started
+
+        started = time.perf_counter()
+        for r in range(args.rounds):
+            resp = client.post("/reservations/batch", json={"reservations": make_items(r, args.size, "B")})
+            assert resp.status_code == 201, resp.get_json()
+        batch = time.perf_counter() - started
+
+        total = args.size * args.rounds
+        print("%d броней (%d пакетов по %d)" % (total, args.rounds, args.size))
+        print("по одной:  %.2f с, %.0f броней/с" % (single, total / single))
+        print("пакетами:  %.2f с, %.0f броней/с (x%.1f)" % (batch, total / batch, single / batch))
+        check_cascade(client)
+
+
+if __name__ == "__main__":
+    main()
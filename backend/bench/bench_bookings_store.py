@@ -0,0 +1,115 @@
+"""
+Бенчмарк журнала броней (bookings_store.BookingLog).
+
+Показывает, что задержка записи не растёт с размером файла
+(до 100k+ броней), в отличие от старой схемы «прочитать массив —
+дописать — перезаписать bookings.json», и что параллельные процессы
+не теряют записи.
+
+    python -m bench.bench_bookings_store [--total 120000] [--procs 4]
+"""
+import argparse
+import json
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from multiprocessing import Process
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bookings_store import BookingLog  # noqa: E402
+
+
+def fake_booking(i):
+    return {
+        "name": "Гость %d" % i,
+        "phone": "+7701%07d" % random.randint(0, 9999999),
+        "people": str(random.randint(1, 8)),
+        "time": "19:00",
+        "comment": "",
+    }
+
+
+def legacy_append(path, record):
+    if os.path.exists(path):
+        with open(path, "r", encoding="utf-8") as f:
+            bookings = json.load(f)
+    else:
+        bookings = []
+    bookings.append(record)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(bookings, f, ensure_ascii=False, indent=4)
+
+
+def measure(append, path, total, checkpoints, sample=200):
+    """Дописывает total броней и меряет задержку sample записей у каждой контрольной точки."""
+    results = []
+    written = 0
+    for point in checkpoints:
+        while written < point - sample:
+            append(path, fake_booking(written))
+            written += 1
+        latencies = []
+        while written < point:
+            started = time.perf_counter()
+            append(path, fake_booking(written))
+            latencies.append((time.perf_counter() - started) * 1e6)
+            written += 1
+        latencies.sort()
+        results.append((point, statistics.median(latencies), latencies[int(len(latencies) * 0.99) - 1]))
+    return results
+
+
+def _worker(path, count):
+    log = BookingLog(path)
+    for i in range(count):
+        log.append(fake_booking(i))
+
+
+def concurrency_check(directory, procs, per_proc):
+    path = os.path.join(directory, "concurrent.jsonl")
+    workers = [Process(target=_worker, args=(path, per_proc)) for _ in range(procs)]
+    started = time.perf_counter()
+    for w in workers:
+        w.start()
+    for w in workers:
+        w.join()
+    elapsed = time.perf_counter() - started
+    found = BookingLog(path).count()
+    return found, procs * per_proc, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--total", type=int, default=120000)
+    parser.add_argument("--legacy-total", type=int, default=5000)
+    parser.add_argument("--procs", type=int, default=4)
+    parser.add_argument("--per-proc", type=int, default=5000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        log_path = os.path.join(directory, "bookings.jsonl")
+        log = BookingLog(log_path)
+        points = sorted({p for p in (1000, 10000, 50000, 100000, args.total) if p <= args.total})
+        print("BookingLog.append (мкс на запись)")
+        print("%10s %10s %10s" % ("броней", "p50", "p99"))
+        for point, p50, p99 in measure(lambda _p, r: log.append(r), log_path, args.total, points):
+            print("%10d %10.1f %10.1f" % (point, p50, p99))
+
+        legacy_path = os.path.join(directory, "bookings.json")
+        points = sorted({p for p in (1000, 2500, args.legacy_total) if p <= args.legacy_total})
+        print("\nСтарый bookings.json: чтение + перезапись (мкс на запись)")
+        print("%10s %10s %10s" % ("броней", "p50", "p99"))
+        for point, p50, p99 in measure(legacy_append, legacy_path, args.legacy_total, points, sample=50):
+            print("%10d %10.1f %10.1f" % (point, p50, p99))
+
+        found, expected, elapsed = concurrency_check(directory, args.procs, args.per_proc)
+        print("\nПараллельная запись: %d процессов, найдено %d из %d за %.2f с (%s)"
+              % (args.procs, found, expected, elapsed, "OK" if found == expected else "ПОТЕРИ"))
+
+
+if __name__ == "__main__":
+    main()
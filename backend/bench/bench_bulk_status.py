@@ -0,0 +1,77 @@
+"""
+Бенчмарк массовой смены статуса броней на локальном PostgreSQL.
+
+Сравнивает N вызовов POST /reservation/cancel (соединение, UPDATE, DELETE из
+table_usage и коммит на каждую бронь) с одним POST /admin/reservations/status
+по фильтру branch + date (один UPDATE, один DELETE, одно NOTIFY на email).
+
+    python -m bench.bench_bulk_status [--size 200] [--rounds 5]
+
+Нужны initdb/pg_ctl в PATH (или PG_BIN).
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench.local_services import LocalPostgres  # noqa: E402
+
+
+def make_items(day, size, prefix):
+    return [{
+        "user_email": "guest%d@example.com" % (i % 50),
+        "branch": "Bench",
+        "date": "2030-%02d-%02d" % (day // 28 % 12 + 1, day % 28 + 1),
+        "tables": ["%s-%d" % (prefix, i)],
+        "guests": 2,
+        "menu_items": ["Классический рамен"],
+    } for i in range(size)]
+
+
+def create(client, items):
+    resp = client.post("/reservations/batch", json={"reservations": items})
+    assert resp.status_code == 201, resp.get_json()
+    return [r["reservation_id"] for r in resp.get_json()["results"]]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--size", type=int, default=200, help="броней в дне филиала")
+    parser.add_argument("--rounds", type=int, default=5)
+    args = parser.parse_args()
+    os.environ.setdefault("ADMIN_OPEN", "1")
+
+    with LocalPostgres():
+        from app import app
+        client = app.test_client()
+
+        single = 0.0
+        for r in range(args.rounds):
+            ids = create(client, make_items(r, args.size, "S"))
+            started = time.perf_counter()
+            for res_id in ids:
+                assert client.post("/reservation/cancel", json={"id": res_id}).status_code == 200
+            single += time.perf_counter() - started
+
+        bulk = 0.0
+        for r in range(args.rounds):
+            items = make_items(args.rounds + r, args.size, "B")
+            create(client, items)
+            started = time.perf_counter()
+            resp = client.post("/admin/reservations/status", json={
+                "status": "cancelled",
+                "filter": {"branch": "Bench", "date": items[0]["date"], "status": "pending"},
+            })
+            bulk += time.perf_counter() - started
+            assert resp.get_json()["count"] == args.size, resp.get_json()
+
+        total = args.size * args.rounds
+        print("%d броней (%d дней по %d)" % (total, args.rounds, args.size))
+        print("по одной:  %.2f с, %.0f броней/с" % (single, total / single))
+        print("фильтром:  %.3f с, %.0f броней/с (x%.0f)" % (bulk, total / bulk, single / bulk))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+"""
+Время /verify-email в зависимости от числа регистраций (локальный PostgreSQL).
+
+legacy — прежняя схема: таблица только растёт (строка на каждую попытку),
+         поиск последнего кода через ORDER BY id DESC LIMIT 1 без индекса;
+current — email_codes после миграции 007: одна строка на email (upsert),
+          проверка удаляет код (email_codes.consume_code).
+
+    python -m bench.bench_email_codes [--sizes 1000,10000,100000] [--verifies 300]
+
+Нужны initdb/pg_ctl в PATH (или PG_BIN).
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench.local_services import LocalPostgres  # noqa: E402
+
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * q))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sizes", default="1000,10000,100000")
+    parser.add_argument("--verifies", type=int, default=300)
+    parser.add_argument("--attempts", type=int, default=3, help="попыток регистрации на email")
+    args = parser.parse_args()
+
+    with LocalPostgres() as pg:
+        from email_codes import consume_code, store_code
+        import db
+
+        conn = pg.connect()
+        cur = conn.cursor()
+        cur.execute("CREATE TABLE legacy_codes (id SERIAL PRIMARY KEY, email TEXT NOT NULL, code TEXT NOT NULL)")
+        conn.commit()
+
+        total = 0
+        print("%10s %16s %16s %16s" % ("регистраций", "legacy строк", "legacy p50 мс", "current p50 мс"))
+        for size in [int(s) for s in args.sizes.split(",")]:
+            new = ["user%d@bench.local" % i for i in range(total, size)]
+            # прежняя схема: строка на каждую попытку
+            cur.execute("""
+                INSERT INTO legacy_codes (email, code)
+                SELECT 'user' || i || '@bench.local', '123456'
+                FROM generate_series(%s, %s - 1) AS i, generate_series(1, %s)
+            """, (total, size, args.attempts))
+            conn.commit()
+            with db.db_connection() as pooled:
+                pooled_cur = pooled.cursor()
+                for _ in range(args.attempts):
+                    for email in new:
+                        store_code(pooled_cur, email)
+            total = size
+            cur.execute("ANALYZE")
+            cur.execute("SELECT count(*) FROM legacy_codes")
+            legacy_rows = cur.fetchone()[0]
+            conn.commit()
+
+            step = max(1, size // args.verifies)
+            emails = ["user%d@bench.local" % i for i in range(0, size, step)][:args.verifies]
+            legacy, current = [], []
+            for email in emails:
+                started = time.perf_counter()
+                cur.execute("SELECT code FROM legacy_codes WHERE email=%s ORDER BY id DESC LIMIT 1", (email,))
+                cur.fetchone()
+                conn.commit()
+                legacy.append((time.perf_counter() - started) * 1000)
+
+                with db.db_connection() as pooled:
+                    pooled_cur = pooled.cursor()
+                    pooled_cur.execute("SELECT code FROM email_codes WHERE email=%s", (email,))
+                    code = pooled_cur.fetchone()[0]
+                    started = time.perf_counter()
+                    consume_code(pooled_cur, email, code)
+                    current.append((time.perf_counter() - started) * 1000)
+                    # код возвращаем, чтобы следующий размер мерился на той же таблице
+                    store_code(pooled_cur, email)
+
+            print("%10d %16d %16.3f %16.3f" % (size, legacy_rows, statistics.median(legacy),
+                                               statistics.median(current)))
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+"""
+Бенчмарк хэширования паролей (hashing.py).
+
+Пачка одновременных «входов» (check_password_hash) при двух схемах:
+- inline — KDF в потоке запроса, как раньше;
+- pool — пул процессов с ограничением очереди: лишние входы сразу получают 503.
+
+Параллельно измеряется задержка /menu через тестовый клиент — насколько входы
+мешают остальным запросам.
+
+    python -m bench.bench_hashing [--logins 64] [--workers 2] [--max-pending 8]
+"""
+import argparse
+import os
+import statistics
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("SESSION_SECRET", "bench-secret")
+os.environ.setdefault("SESSION_BACKEND", "memory")
+os.environ.setdefault("LOG_LEVEL", "WARNING")
+os.environ.setdefault("MENU_SOURCE", "file")
+
+from werkzeug.security import check_password_hash, generate_password_hash  # noqa: E402
+
+import app as cafe  # noqa: E402
+from hashing import HashPoolBusy, PasswordHasher  # noqa: E402
+
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * q))]
+
+
+def burst(check, logins, concurrency):
+    """concurrency потоков делят logins проверок; возвращает (задержки ok, отказов, время)."""
+    latencies, rejected = [], [0]
+    lock = threading.Lock()
+    remaining = [logins]
+
+    def worker():
+        while True:
+            with lock:
+                if remaining[0] <= 0:
+                    return
+                remaining[0] -= 1
+            started = time.perf_counter()
+            try:
+                check()
+            except HashPoolBusy:
+                with lock:
+                    rejected[0] += 1
+                continue
+            with lock:
+                latencies.append(time.perf_counter() - started)
+
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    started = time.perf_counter()
+    for t in threads:
+        t.start()
+    return threads, latencies, rejected, started
+
+
+def menu_latency_during(threads):
+    client = cafe.app.test_client()
+    samples = []
+    while any(t.is_alive() for t in threads):
+        started = time.perf_counter()
+        client.get("/menu").close()
+        samples.append((time.perf_counter() - started) * 1000)
+        time.sleep(0.005)
+    return samples
+
+
+def report(name, threads, latencies, rejected, started, menu):
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - started
+    ok = len(latencies)
+    print("%-7s входов ok %3d, отказов 503 %3d, %.1f входов/с, вход p50 %.0f мс p99 %.0f мс, "
+          "/menu p50 %.1f мс p99 %.1f мс" % (
+              name, ok, rejected[0], ok / elapsed,
+              statistics.median(latencies) * 1000 if latencies else 0,
+              percentile(latencies, 0.99) * 1000 if latencies else 0,
+              statistics.median(menu), percentile(menu, 0.99)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--logins", type=int, default=64)
+    parser.add_argument("--concurrency", type=int, default=32, help="одновременных входов")
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--max-pending", type=int, default=8)
+    parser.add_argument("--method", default="scrypt")
+    args = parser.parse_args()
+
+    pwhash = generate_password_hash("secret-password", method=args.method)
+    client = cafe.app.test_client()
+    client.get("/menu").close()
+
+    idle = []
+    for _ in range(50):
+        started = time.perf_counter()
+        client.get("/menu").close()
+        idle.append((time.perf_counter() - started) * 1000)
+    print("/menu без нагрузки: p50 %.1f мс" % statistics.median(idle))
+
+    threads, latencies, rejected, started = burst(
+        lambda: check_password_hash(pwhash, "secret-password"), args.logins, args.concurrency)
+    report("inline", threads, latencies, rejected, started, menu_latency_during(threads))
+
+    hasher = PasswordHasher(method=args.method, workers=args.workers, max_pending=args.max_pending)
+    hasher.check(pwhash, "secret-password")   # запуск процессов пула
+    threads, latencies, rejected, started = burst(
+        lambda: hasher.check(pwhash, "secret-password"), args.logins, args.concurrency)
+    report("pool", threads, latencies, rejected, started, menu_latency_during(threads))
+    hasher.shutdown()
+
+
+if __name__ == "__main__":
+    main()
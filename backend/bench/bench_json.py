@@ -0,0 +1,106 @@
+"""
+Сериализация JSON (stdlib против orjson) и байты на проводе (без сжатия,
+gzip, brotli) для типичных ответов. БД не нужна: строки броней синтетические,
+в том же виде, в каком их отдаёт psycopg2 (date, datetime, TEXT[] как список).
+
+    python -m bench.bench_json [--rows 1000] [--repeat 200]
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import time
+from datetime import date, datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+os.environ.setdefault("SESSION_SECRET", "bench-secret")
+os.environ.setdefault("MENU_SOURCE", "file")
+os.environ.setdefault("LOG_LEVEL", "WARNING")
+
+from flask.json.provider import DefaultJSONProvider  # noqa: E402
+
+import app as cafe  # noqa: E402
+import menu_api  # noqa: E402
+from bench.http_bench import BRANCHES, TABLES  # noqa: E402
+from compression import ENCODINGS, compress, precompress  # noqa: E402
+from json_provider import OrjsonProvider, orjson  # noqa: E402
+
+
+def admin_rows(n, rnd):
+    now = datetime(2025, 1, 1, 12, 0)
+    return [{
+        "id": i, "user_email": "guest%d@bench.local" % rnd.randrange(5000),
+        "branch": rnd.choice(BRANCHES), "date": date(2025, 1, 1) + timedelta(days=rnd.randrange(90)),
+        "tables": rnd.sample(TABLES, rnd.randint(1, 2)), "guests": rnd.randint(1, 6),
+        "notes": "у окна" if rnd.random() < 0.3 else "", "menu_items": ["Рамен с сыром", "Матча бабл-ти"],
+        "status": rnd.choice(["pending", "confirmed", "cancelled"]),
+        "created_at": now - timedelta(minutes=i),
+    } for i in range(n)]
+
+
+def user_bookings(n, rnd):
+    return {"bookings": [{
+        "id": i, "date": str(date(2025, 1, 1) + timedelta(days=i)), "branch": rnd.choice(BRANCHES),
+        "persons": rnd.randint(1, 6), "menu": ["Филадельфия"], "status": "confirmed",
+    } for i in range(n)]}
+
+
+def timed(fn, repeat):
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - started) * 1000)
+    return statistics.median(samples)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, default=1000, help="строк в странице /admin/bookings")
+    parser.add_argument("--repeat", type=int, default=200)
+    args = parser.parse_args()
+    if orjson is None:
+        print("orjson не установлен")
+        return
+
+    rnd = random.Random(1)
+    stdlib = DefaultJSONProvider(cafe.app)
+    fast = OrjsonProvider(cafe.app)
+    payloads = [
+        ("menu", menu_api.menu_file_cache.get().data),
+        ("admin/bookings x%d" % args.rows, {"items": admin_rows(args.rows, rnd), "next_cursor": None}),
+        ("user/bookings x20", user_bookings(20, rnd)),
+    ]
+
+    print("сериализация, мс (медиана из %d)" % args.repeat)
+    print("%-26s %10s %10s %8s" % ("", "stdlib", "orjson", "x"))
+    for name, obj in payloads:
+        with cafe.app.app_context():
+            before = timed(lambda: stdlib.response(obj), args.repeat)
+            after = timed(lambda: fast.response(obj), args.repeat)
+        print("%-26s %10.3f %10.3f %8.1f" % (name, before, after, before / after))
+
+    print("\nбайты на проводе (время сжатия, мс)")
+    print("%-26s %10s %10s" % ("", "stdlib", "orjson") + "".join(" %16s" % e for e in ENCODINGS))
+    for name, obj in payloads:
+        old = stdlib.dumps(obj, separators=(",", ":")).encode()
+        body = fast.dumps_bytes(obj)
+        line = "%-26s %10d %10d" % (name, len(old), len(body))
+        for encoding in ENCODINGS:
+            size = len(compress(body, encoding))
+            spent = timed(lambda: compress(body, encoding), max(args.repeat // 10, 5))
+            line += " %9d (%5.2f)" % (size, spent)
+        print(line)
+
+    body = menu_api.menu_file_cache.get().body
+    started = time.perf_counter()
+    variants = precompress(body)
+    print("\nменю, сжатие один раз при загрузке (%.1f мс): %s" % (
+        (time.perf_counter() - started) * 1000,
+        ", ".join("%s %d байт" % (e, len(v)) for e, v in variants.items())))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+"""
+Бенчмарк отправки кодов подтверждения (mailer.Mailer) на локальном SMTP.
+
+Сравнивает старую схему «новое подключение + STARTTLS + login на каждое
+письмо прямо в запросе» с очередью: сколько времени запрос тратит на
+постановку письма, сколько занимает доставка и сколько SMTP-сессий открыто.
+
+    python -m bench.bench_mailer [--emails 200] [--connect-delay 0.25]
+"""
+import argparse
+import os
+import smtplib
+import statistics
+import sys
+import time
+from email.message import EmailMessage
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from mailer import Mailer  # noqa: E402
+from bench.local_services import LocalSMTPServer  # noqa: E402
+
+
+def code_message(i):
+    msg = EmailMessage()
+    msg["Subject"] = "Код подтверждения регистрации"
+    msg["From"] = "cafe@example.com"
+    msg["To"] = "guest%d@example.com" % i
+    msg.set_content("Ваш код подтверждения: %06d" % i)
+    return msg
+
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * q))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--emails", type=int, default=200)
+    parser.add_argument("--inline-emails", type=int, default=20)
+    parser.add_argument("--connect-delay", type=float, default=0.25,
+                        help="имитация TCP+TLS+login у провайдера, с")
+    parser.add_argument("--send-delay", type=float, default=0.01)
+    parser.add_argument("--workers", type=int, default=4)
+    args = parser.parse_args()
+
+    with LocalSMTPServer(connect_delay=args.connect_delay, send_delay=args.send_delay) as smtp:
+        inline = []
+        for i in range(args.inline_emails):
+            started = time.perf_counter()
+            server = smtplib.SMTP(smtp.host, smtp.port)
+            server.login("cafe@example.com", "secret")
+            server.send_message(code_message(i))
+            server.quit()
+            inline.append((time.perf_counter() - started) * 1000)
+        inline_connections = smtp.connections
+
+        mailer = Mailer(smtp.host, smtp.port, "cafe@example.com", password="secret",
+                        starttls=False, workers=args.workers, queue_size=args.emails)
+        enqueue = []
+        started_all = time.perf_counter()
+        max_depth = 0
+        for i in range(args.emails):
+            started = time.perf_counter()
+            mailer.submit(code_message(i))
+            enqueue.append((time.perf_counter() - started) * 1000)
+            max_depth = max(max_depth, mailer.stats()["queue_depth"])
+        mailer.join(timeout=600)
+        total = time.perf_counter() - started_all
+        stats = mailer.stats()
+        mailer.stop()
+
+        print("Старая схема (в запросе): p50 %.1f мс, p95 %.1f мс на письмо, %d подключений на %d писем"
+              % (statistics.median(inline), percentile(inline, 0.95), inline_connections, args.inline_emails))
+        print("Очередь: постановка p50 %.3f мс, p95 %.3f мс" % (statistics.median(enqueue), percentile(enqueue, 0.95)))
+        print("Очередь: %d писем доставлено за %.2f с (%.0f писем/с), отправка в среднем %.1f мс"
+              % (stats["sent"], total, stats["sent"] / total, (stats["avg_send_time"] or 0) * 1000))
+        print("Очередь: SMTP-сессий открыто %d, ошибок %d, максимальная глубина %d"
+              % (stats["connects"], stats["failed"], max_depth))
+
+
+if __name__ == "__main__":
+    main()
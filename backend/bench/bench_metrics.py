@@ -0,0 +1,84 @@
+"""
+Накладные расходы инструментирования (metrics.py, applog.py).
+
+1. Стоимость одной записи в гистограмму/счётчик и одной строки лога.
+2. /menu и /auth/user через тестовый клиент Flask: без хуков метрик и лога
+   против варианта с ними.
+
+    python -m bench.bench_metrics [--requests 5000] 2>/dev/null
+"""
+import argparse
+import logging
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("SESSION_SECRET", "bench-secret")
+os.environ.setdefault("SESSION_BACKEND", "memory")
+os.environ.setdefault("MENU_SOURCE", "file")
+
+import app as cafe  # noqa: E402
+from metrics import Counter, Histogram  # noqa: E402
+
+
+def per_call(fn, n):
+    started = time.perf_counter()
+    for _ in range(n):
+        fn()
+    return (time.perf_counter() - started) / n * 1e9
+
+
+def request_timings(client, path, n):
+    timings = []
+    for _ in range(n):
+        started = time.perf_counter()
+        client.get(path).close()
+        timings.append((time.perf_counter() - started) * 1e6)
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--requests", type=int, default=5000)
+    args = parser.parse_args()
+
+    hist = Histogram("bench_seconds", "bench", ("endpoint", "method"))
+    counter = Counter("bench_total", "bench", ("endpoint", "method", "status"))
+    print("Histogram.observe: %.0f нс" % per_call(lambda: hist.observe(0.0042, "/menu", "GET"), 200000))
+    print("Counter.inc:       %.0f нс" % per_call(lambda: counter.inc("/menu", "GET", "200"), 200000))
+
+    log = logging.getLogger("cafe")
+    print("log.info (очередь): %.0f нс" % per_call(lambda: log.info("REQUEST: %s %s", "GET", "/menu"), 20000))
+
+    before = dict(cafe.app.before_request_funcs)
+    after = dict(cafe.app.after_request_funcs)
+    client = cafe.app.test_client()
+    paths = ["/menu", "/auth/user"]
+    for path in paths:
+        client.get(path).close()
+
+    modes = {
+        "без хуков": ("log_request", "_start_timer", "_record_request"),
+        "метрики": ("log_request",),
+        "метрики+лог": (),
+    }
+    results = {}
+    for mode, disabled in modes.items():
+        cafe.app.before_request_funcs = {k: [f for f in v if f.__name__ not in disabled] for k, v in before.items()}
+        cafe.app.after_request_funcs = {k: [f for f in v if f.__name__ not in disabled] for k, v in after.items()}
+        for path in paths:
+            results[mode, path] = request_timings(client, path, args.requests)
+    cafe.app.before_request_funcs, cafe.app.after_request_funcs = before, after
+
+    print("%-12s %-12s %10s %10s" % ("path", "режим", "p50, мкс", "разница"))
+    for path in paths:
+        base = statistics.median(results["без хуков", path])
+        for mode in modes:
+            p50 = statistics.median(results[mode, path])
+            print("%-12s %-12s %10.1f %9.1f%%" % (path, mode, p50, (p50 - base) / base * 100))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+"""
+Бенчмарк поиска брони по телефону (phone_index.PhoneIndex).
+
+Сравнивает старый полный перебор журнала со строковыми заменами
+на каждую бронь и поиск по индексу: точный номер, последние цифры
+и подстрока из середины номера.
+
+    python -m bench.bench_phone_index [--bookings 200000] [--queries 2000]
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bookings_store import BookingLog  # noqa: E402
+from phone_index import PhoneIndex  # noqa: E402
+
+
+def synthetic_phone():
+    prefix = random.choice(["+7", "8", "+7 ", ""])
+    return "%s7%02d%07d" % (prefix, random.choice([1, 2, 5, 7, 8]), random.randint(0, 9999999))
+
+
+def linear_search(log, phone):
+    phone = phone.replace("+", "")
+    return [b for b in log.iter_records() if phone in str(b.get("phone", "")).replace("+", "")]
+
+
+def timed(fn, queries):
+    started = time.perf_counter()
+    hits = 0
+    for q in queries:
+        hits += len(fn(q))
+    elapsed = time.perf_counter() - started
+    return elapsed / len(queries) * 1e6, hits
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--bookings", type=int, default=200000)
+    parser.add_argument("--queries", type=int, default=2000)
+    parser.add_argument("--linear-queries", type=int, default=20)
+    args = parser.parse_args()
+    random.seed(42)
+
+    with tempfile.TemporaryDirectory() as directory:
+        log = BookingLog(os.path.join(directory, "bookings.jsonl"))
+        phones = []
+        for i in range(args.bookings):
+            phone = synthetic_phone()
+            phones.append(phone)
+            log.append({"name": "Гость %d" % i, "phone": phone, "people": "2", "time": "19:00"})
+
+        index = PhoneIndex(log)
+        started = time.perf_counter()
+        index.refresh()
+        print("Построение индекса по %d броням: %.2f с" % (args.bookings, time.perf_counter() - started))
+
+        sample = [random.choice(phones) for _ in range(args.queries)]
+        digits = ["".join(ch for ch in p if ch.isdigit()) for p in sample]
+        cases = [
+            ("точный номер", [p for p in sample], lambda q: index.search(q, exact=True)),
+            ("последние 4 цифры", [d[-4:] for d in digits], index.search),
+            ("подстрока (6 цифр)", [d[3:9] for d in digits], index.search),
+        ]
+
+        print("\n%-22s %14s %14s" % ("запрос", "индекс, мкс", "перебор, мкс"))
+        for name, queries, fn in cases:
+            index_us, _ = timed(fn, queries)
+            linear_us, _ = timed(lambda q: linear_search(log, q), queries[:args.linear_queries])
+            print("%-22s %14.1f %14.1f" % (name, index_us, linear_us))
+
+        started = time.perf_counter()
+        for i in range(1000):
+            log.append({"name": "Новый %d" % i, "phone": synthetic_phone()})
+            if i % 10 == 0:
+                index.refresh()
+        index.refresh()
+        print("\nДочитывание 1000 новых броней (refresh каждые 10): %.1f мс"
+              % ((time.perf_counter() - started) * 1000))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+"""
+Бенчмарк сессий: подписанная cookie Flask против серверных хранилищ (sessions.py).
+
+Гость сохраняет pending-бронь (/pending), входит (session["user"]) и затем
+делает обычные запросы: /menu, /auth/user, картинку из /static. Для каждого
+бэкенда печатается размер заголовка Cookie, который браузер шлёт с каждым
+запросом, и задержка запросов через тестовый клиент Flask.
+
+    python -m bench.bench_sessions [--requests 2000] [--postgres]
+
+--postgres добавляет SESSION_BACKEND=postgres на локальном кластере
+(нужны initdb/pg_ctl, см. bench/local_services.py).
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("SESSION_SECRET", "bench-secret")
+os.environ.setdefault("MENU_SOURCE", "file")
+
+import app as cafe  # noqa: E402
+from sessions import make_session_interface  # noqa: E402
+
+PENDING = {
+    "branch": "Абая 150",
+    "date": "2025-12-31",
+    "tables": ["L4-1", "L4-2", "C6-1"],
+    "guests": 9,
+    "notes": "День рождения, нужен детский стул и тихий столик у окна. " * 3,
+    "menu_items": ["Рамен с говядиной", "Том ям", "Гёдза", "Сет роллов «Филадельфия»",
+                   "Пад тай", "Моти", "Чай улун", "Лимонад юдзу"] * 2,
+}
+USER = {"id": 4217, "name": "Гость Кафе", "email": "guest@example.com"}
+
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * q))]
+
+
+def pick_image():
+    images = os.path.join(cafe.BASE_DIR, "static", "images")
+    names = sorted(n for n in os.listdir(images) if n.endswith(".png"))
+    return "/static/images/" + names[0] if names else "/"
+
+
+def run(backend, requests):
+    cafe.app.session_interface = make_session_interface(backend)
+    client = cafe.app.test_client()
+    assert client.post("/pending", json=PENDING).status_code == 200
+    with client.session_transaction() as s:
+        s["user"] = USER
+    cookie = client.get_cookie(cafe.app.config["SESSION_COOKIE_NAME"])
+    header_bytes = len("%s=%s" % (cookie.key, cookie.value))
+
+    paths = ["/menu", "/auth/user", pick_image()]
+    for path in paths:
+        client.get(path).close()   # прогрев кэшей меню и файлов
+
+    results = {}
+    for path in paths:
+        timings = []
+        for _ in range(requests):
+            started = time.perf_counter()
+            response = client.get(path)
+            response.close()
+            timings.append((time.perf_counter() - started) * 1e6)
+        results[path] = timings
+    return header_bytes, results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--postgres", action="store_true")
+    args = parser.parse_args()
+
+    # логирование каждого запроса в stdout мешает замерам
+    cafe.app.before_request_funcs[None] = [f for f in cafe.app.before_request_funcs.get(None, [])
+                                           if f.__name__ != "log_request"]
+
+    backends = ["cookie", "memory"]
+    pg = None
+    if args.postgres:
+        from bench.local_services import LocalPostgres
+        pg = LocalPostgres().start()
+        backends.append("postgres")
+
+    try:
+        print("%-9s %-30s %12s %10s %10s" % ("backend", "path", "cookie, байт", "p50, мкс", "p99, мкс"))
+        for backend in backends:
+            header_bytes, results = run(backend, args.requests)
+            for path, timings in results.items():
+                print("%-9s %-30s %12d %10.0f %10.0f" % (
+                    backend, path, header_bytes, statistics.median(timings), percentile(timings, 0.99)))
+    finally:
+        if pg is not None:
+            pg.stop()
+
+
+if __name__ == "__main__":
+    main()
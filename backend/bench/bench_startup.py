@@ -0,0 +1,133 @@
+"""
+Время старта: импорт app.py и путь от запуска gunicorn до первого ответа.
+
+1. `import app` в новом процессе (медиана из --repeat) и сколько потоков
+   создано импортом — при --preload всё это наследуют воркеры после fork;
+2. gunicorn: от запуска процесса до первого ответа на / (воркер принимает
+   запросы), затем время первого и второго запроса /menu — первый платит
+   за ленивую инициализацию; для каждого режима из --modes, медиана из --repeat.
+
+    python -m bench.bench_startup [--repeat 5] [--workers 1] [--pg]
+
+Режимы: plain — без предзагрузки; preload — --preload (app импортируется
+один раз в мастере); warm — gunicorn.conf.py целиком: preload и warm_up()
+в каждом воркере до приёма запросов. Google — LocalOIDC. Без --pg БД не нужна:
+меню из menu.json, сессии в cookie, DB_HOST указывает на закрытый порт.
+"""
+import argparse
+import http.client
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench.http_bench import BACKEND_DIR  # noqa: E402
+from bench.local_services import LocalOIDC, LocalPostgres, _free_port  # noqa: E402
+
+IMPORT_SNIPPET = (
+    "import threading, time; started = time.perf_counter(); import app; "
+    "print('%.4f %d' % (time.perf_counter() - started, threading.active_count()))"
+)
+
+
+def measure_import(repeat):
+    times, threads = [], 0
+    for _ in range(repeat):
+        out = subprocess.run([sys.executable, "-c", IMPORT_SNIPPET], cwd=BACKEND_DIR, env=dict(os.environ),
+                             capture_output=True, text=True, check=True).stdout.split()
+        times.append(float(out[-2]))
+        threads = int(out[-1])
+    return statistics.median(times), threads
+
+
+def get(port, path):
+    conn = http.client.HTTPConnection("127.0.0.1", port, timeout=30)
+    try:
+        started = time.perf_counter()
+        conn.request("GET", path)
+        response = conn.getresponse()
+        response.read()
+        return response.status, time.perf_counter() - started
+    finally:
+        conn.close()
+
+
+# gunicorn сам читает ./gunicorn.conf.py, поэтому режимы выбираются его переменными
+MODES = {
+    "plain": {"GUNICORN_PRELOAD": "0", "WARMUP": "0"},
+    "preload": {"GUNICORN_PRELOAD": "1", "WARMUP": "0"},
+    "warm": {"GUNICORN_PRELOAD": "1", "WARMUP": "1"},
+}
+
+
+def measure_gunicorn(mode, workers):
+    port = _free_port()
+    args = [sys.executable, "-m", "gunicorn", "-w", str(workers), "-b", "127.0.0.1:%d" % port,
+            "--log-level", "warning"]
+    if mode != "plain" and not os.path.exists(os.path.join(BACKEND_DIR, "gunicorn.conf.py")):
+        args.append("--preload")
+    started = time.perf_counter()
+    process = subprocess.Popen(args + ["app:app"], cwd=BACKEND_DIR, env=dict(os.environ, **MODES[mode]),
+                               stdout=subprocess.DEVNULL)
+    try:
+        deadline = time.monotonic() + 60
+        while True:
+            if process.poll() is not None or time.monotonic() > deadline:
+                raise SystemExit("gunicorn (%s) не запустился" % mode)
+            try:
+                status, _ = get(port, "/")
+            except OSError:
+                time.sleep(0.01)
+                continue
+            if status == 200:
+                break
+        ready = time.perf_counter() - started
+        _, first = get(port, "/menu")
+        _, second = get(port, "/menu")
+        return ready, first, second
+    finally:
+        process.terminate()
+        process.wait(timeout=30)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--modes", default="plain,preload,warm")
+    parser.add_argument("--pg", action="store_true", help="с локальным PostgreSQL (меню и сессии в БД)")
+    args = parser.parse_args()
+
+    os.environ.setdefault("SESSION_SECRET", "bench-secret")
+    os.environ["LOG_LEVEL"] = "WARNING"
+    oidc = LocalOIDC().start()
+    os.environ.update({"GOOGLE_DISCOVERY_URL": oidc.discovery_url, "GOOGLE_CLIENT_ID": oidc.client_id,
+                       "GOOGLE_CLIENT_SECRET": "bench-secret"})
+    pg = None
+    if args.pg:
+        pg = LocalPostgres().start()
+    else:
+        os.environ.update({"MENU_SOURCE": "file", "SESSION_BACKEND": "cookie",
+                           "DB_HOST": "127.0.0.1", "DB_PORT": str(_free_port())})
+    try:
+        seconds, threads = measure_import(args.repeat)
+        print("import app: %.0f мс (медиана из %d), потоков после импорта: %d" % (
+            seconds * 1000, args.repeat, threads))
+        print("%-10s %16s %14s %14s" % ("gunicorn", "до ответа /, мс", "1-й /menu мс", "2-й /menu мс"))
+        for mode in args.modes.split(","):
+            if mode == "warm" and not os.path.exists(os.path.join(BACKEND_DIR, "gunicorn.conf.py")):
+                continue
+            runs = [measure_gunicorn(mode, args.workers) for _ in range(args.repeat)]
+            ready, first, second = (statistics.median(column) for column in zip(*runs))
+            print("%-10s %16.0f %14.1f %14.1f" % (mode, ready * 1000, first * 1000, second * 1000))
+    finally:
+        oidc.stop()
+        if pg is not None:
+            pg.stop()
+
+
+if __name__ == "__main__":
+    main()
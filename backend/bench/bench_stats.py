@@ -0,0 +1,263 @@
+"""
+Бенчмарк /admin/stats на синтетической истории броней.
+
+Без --pg (БД не нужна): брони генерируются в памяти и сворачиваются в те же
+агрегаты, что ведёт триггер (stats_daily, stats_tables, stats_menu_items).
+Сравнивается подсчёт отчёта по выгрузке броней циклом Python (как считали
+вручную из /admin/bookings) с build_report() по агрегатам (numpy).
+
+С --pg — на локальном PostgreSQL: история заливается одним INSERT ... SELECT
+из generate_series, агрегаты пересчитываются reservations_stats_rebuild(), затем:
+- те же цифры запросами прямо к reservations (GROUP BY по броням за диапазон)
+  против GET /admin/stats (три запроса к агрегатам + numpy);
+- цена триггера на запись: /reservations/batch с триггером агрегатов (запись
+  в очередь stats_changes) и без, и время свёртки накопленной очереди.
+
+    python -m bench.bench_stats [--branches 5] [--years 10] [--per-day 20] [--pg]
+
+Для --pg нужны initdb/pg_ctl в PATH (или PG_BIN).
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+from collections import Counter, defaultdict
+from datetime import date, timedelta
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from stats import TOP_N, build_report  # noqa: E402
+
+ITEMS = ["Классический рамен", "Рамен с сыром", "Филадельфия", "Калифорния", "Матча бабл-ти",
+         "Моти с клубникой", "Японский чизкейк", "Кока-Кола", "Вода без газа"]
+STATUSES = ("pending", "confirmed", "cancelled")
+
+
+def timed(fn, repeat):
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - started) * 1000)
+    return statistics.median(samples)
+
+
+def ranges(start, end):
+    """Типичные запросы панели: месяц, год, вся история."""
+    return [
+        ("30 дней", end - timedelta(days=29), end),
+        ("1 год", end - timedelta(days=364), end),
+        ("вся история", start, end),
+    ]
+
+
+# ------------------- Без БД -------------------
+def synthetic(branches, days, per_day, rnd):
+    n = branches * days * per_day
+    return {
+        "branch": rnd.integers(0, branches, n),
+        "day": rnd.integers(0, days, n),
+        "status": rnd.choice(3, n, p=[0.2, 0.7, 0.1]),
+        "guests": rnd.integers(1, 7, n),
+        "table": rnd.integers(0, 30, n),
+        "item": rnd.integers(0, len(ITEMS), n),
+    }
+
+
+def aggregate(data, names, days):
+    """То, что держит триггер: матрицы stats_daily и помесячные счётчики (за всё время)."""
+    active = data["status"] != 2
+    daily = {}
+    tables, items = {}, {}
+    for b, branch in enumerate(names):
+        mine = data["branch"] == b
+        matrix = np.zeros((5, days), dtype=np.int64)
+        for s in range(3):
+            matrix[s] = np.bincount(data["day"][mine & (data["status"] == s)], minlength=days)
+        matrix[3] = np.bincount(data["day"][mine & active], weights=data["guests"][mine & active], minlength=days)
+        matrix[4] = np.bincount(data["day"][mine & active], minlength=days)
+        daily[branch] = matrix
+        counts = np.bincount(data["table"][mine & active], minlength=30)
+        tables[branch] = (np.array(["T%02d" % t for t in range(30)], dtype=object), counts)
+        counts = np.bincount(data["item"][mine & active], minlength=len(ITEMS))
+        items[branch] = (np.array(ITEMS, dtype=object), counts)
+    return daily, tables, items
+
+
+def crunch_by_hand(rows, date_from, date_to):
+    """Отчёт по выгрузке броней обычным циклом: по броням, а не по агрегатам."""
+    per_branch = defaultdict(lambda: {"days": Counter(), "guests": 0, "status": Counter(),
+                                      "tables": Counter(), "items": Counter(), "weekday": Counter()})
+    for branch, day, status, guests, table, item in rows:
+        if not date_from <= day <= date_to:
+            continue
+        stats = per_branch[branch]
+        stats["status"][status] += 1
+        if status == "cancelled":
+            continue
+        stats["days"][day] += 1
+        stats["weekday"][day.weekday()] += 1
+        stats["guests"] += guests
+        stats["tables"][table] += 1
+        stats["items"][item] += 1
+    return {branch: {
+        "bookings": sum(s["days"].values()),
+        "avg_party": s["guests"] / max(sum(s["days"].values()), 1),
+        "peak_days": s["days"].most_common(5),
+        "top_tables": s["tables"].most_common(TOP_N),
+        "top_menu_items": s["items"].most_common(TOP_N),
+    } for branch, s in per_branch.items()}
+
+
+def run_offline(args):
+    rnd = np.random.default_rng(1)
+    end = date(2025, 12, 31)
+    start = end - timedelta(days=365 * args.years - 1)
+    days = (end - start).days + 1
+    names = ["Филиал %d" % b for b in range(args.branches)]
+    data = synthetic(args.branches, days, args.per_day, rnd)
+    print("броней: %d (%d филиалов x %d дней x %d)" % (len(data["day"]), args.branches, days, args.per_day))
+
+    day_dates = [start + timedelta(days=d) for d in range(days)]
+    rows = list(zip([names[b] for b in data["branch"].tolist()], [day_dates[d] for d in data["day"].tolist()],
+                    [STATUSES[s] for s in data["status"].tolist()], data["guests"].tolist(),
+                    data["table"].tolist(), [ITEMS[i] for i in data["item"].tolist()]))
+    daily, tables, items = aggregate(data, names, days)
+
+    print("%-14s %22s %22s" % ("диапазон", "по броням (Python), мс", "по агрегатам (numpy), мс"))
+    for label, date_from, date_to in ranges(start, end):
+        first, last = (date_from - start).days, (date_to - start).days
+        # столы и блюда — за всю историю: на время расчёта отчёта это не влияет
+        window = {b: (np.arange(last - first + 1), m[:, first:last + 1]) for b, m in daily.items()}
+        group = "day" if last - first < 92 else "week" if last - first < 731 else "month"
+        by_hand = timed(lambda: crunch_by_hand(rows, date_from, date_to), 1)
+        numpy_ms = timed(lambda: build_report(window, tables, items, [], date_from, date_to, group), args.repeat)
+        print("%-14s %22.0f %22.2f" % (label, by_hand, numpy_ms))
+
+
+# ------------------- PostgreSQL -------------------
+RAW_DAILY_SQL = """
+    SELECT branch, date,
+           count(*) FILTER (WHERE status IS DISTINCT FROM 'cancelled'),
+           count(*) FILTER (WHERE status = 'cancelled'),
+           sum(guests) FILTER (WHERE status IS DISTINCT FROM 'cancelled'),
+           sum(cardinality(tables)) FILTER (WHERE status IS DISTINCT FROM 'cancelled')
+    FROM reservations WHERE date BETWEEN %s AND %s
+    GROUP BY branch, date
+"""
+RAW_TOP_SQL = """
+    SELECT r.branch, x.name, count(*)
+    FROM reservations r, unnest(r.{column}) AS x(name)
+    WHERE r.date BETWEEN %s AND %s AND r.status IS DISTINCT FROM 'cancelled'
+    GROUP BY r.branch, x.name
+"""
+
+
+def load_history(conn, branches, start, days, per_day):
+    cur = conn.cursor()
+    cur.execute("ALTER TABLE reservations DISABLE TRIGGER USER")
+    cur.execute("""
+        INSERT INTO reservations (user_email, branch, date, tables, guests, menu_items, status)
+        SELECT 'guest' || (g %% 5000) || '@bench.local',
+               'Филиал ' || (g %% %(branches)s),
+               %(start)s::date + (g / (%(branches)s * %(per_day)s))::int,
+               ARRAY['T' || lpad(((g * 7) %% 30)::text, 2, '0')],
+               1 + (g %% 6),
+               ARRAY[(%(items)s::text[])[1 + g %% %(n_items)s], (%(items)s::text[])[1 + (g / 7) %% %(n_items)s]],
+               CASE WHEN g %% 10 = 0 THEN 'cancelled' WHEN g %% 5 = 0 THEN 'pending' ELSE 'confirmed' END
+        FROM generate_series(0, %(total)s - 1) AS g
+    """, {"branches": branches, "per_day": per_day, "start": start, "items": ITEMS,
+          "n_items": len(ITEMS), "total": branches * days * per_day})
+    cur.execute("ALTER TABLE reservations ENABLE TRIGGER USER")
+    conn.commit()
+    started = time.perf_counter()
+    cur.execute("SELECT reservations_stats_rebuild()")
+    conn.commit()
+    cur.execute("ANALYZE")
+    conn.commit()
+    return time.perf_counter() - started
+
+
+def batch_items(round_no, size, prefix):
+    return [{"user_email": "w%d@bench.local" % i, "branch": "Запись", "date": "2031-01-%02d" % (round_no % 28 + 1),
+             "tables": ["%s-%d-%d" % (prefix, round_no, i)], "guests": 2, "menu_items": ITEMS[:2]}
+            for i in range(size)]
+
+
+def batch_insert_ms(client, rounds, size, prefix):
+    started = time.perf_counter()
+    for r in range(rounds):
+        resp = client.post("/reservations/batch", json={"reservations": batch_items(r, size, prefix)})
+        assert resp.status_code == 201, resp.get_json()
+    return (time.perf_counter() - started) * 1000 / rounds
+
+
+def run_pg(args):
+    from bench.local_services import LocalPostgres
+
+    end = date(2025, 12, 31)
+    start = end - timedelta(days=365 * args.years - 1)
+    days = (end - start).days + 1
+    with LocalPostgres() as pg:
+        conn = pg.connect()
+        rebuild = load_history(conn, args.branches, start, days, args.per_day)
+        print("броней: %d, пересчёт агрегатов: %.1f с" % (args.branches * days * args.per_day, rebuild))
+
+        from app import app
+        client = app.test_client()
+        cur = conn.cursor()
+
+        def raw(date_from, date_to):
+            cur.execute(RAW_DAILY_SQL, (date_from, date_to))
+            cur.fetchall()
+            for column in ("tables", "menu_items"):
+                cur.execute(RAW_TOP_SQL.format(column=column), (date_from, date_to))
+                cur.fetchall()
+
+        def endpoint(date_from, date_to):
+            resp = client.get("/admin/stats?from=%s&to=%s" % (date_from, date_to))
+            assert resp.status_code == 200, resp.get_json()
+
+        print("%-14s %22s %22s" % ("диапазон", "по reservations, мс", "/admin/stats, мс"))
+        for label, date_from, date_to in ranges(start, end):
+            print("%-14s %22.1f %22.1f" % (label, timed(lambda: raw(date_from, date_to), max(args.repeat // 10, 3)),
+                                           timed(lambda: endpoint(date_from, date_to), args.repeat)))
+
+        with_trigger = batch_insert_ms(client, 20, 50, "S")
+        started = time.perf_counter()
+        cur.execute("SELECT reservations_stats_fold()")
+        folded = cur.fetchone()[0]
+        conn.commit()
+        fold_ms = (time.perf_counter() - started) * 1000
+        cur.execute("ALTER TABLE reservations DISABLE TRIGGER reservations_stats_insert")
+        conn.commit()
+        without = batch_insert_ms(client, 20, 50, "N")
+        cur.execute("ALTER TABLE reservations ENABLE TRIGGER reservations_stats_insert")
+        conn.commit()
+        print("/reservations/batch x50: %.1f мс с агрегатами, %.1f мс без" % (with_trigger, without))
+        print("свёртка очереди: %d изменений за %.1f мс" % (folded, fold_ms))
+        conn.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--branches", type=int, default=5)
+    parser.add_argument("--years", type=int, default=10)
+    parser.add_argument("--per-day", type=int, default=20, help="броней на филиал в день")
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--pg", action="store_true", help="на локальном PostgreSQL")
+    args = parser.parse_args()
+    os.environ.setdefault("SESSION_SECRET", "bench-secret")
+    os.environ.setdefault("LOG_LEVEL", "WARNING")
+    os.environ.setdefault("ADMIN_OPEN", "1")
+    if args.pg:
+        run_pg(args)
+    else:
+        run_offline(args)
+
+
+if __name__ == "__main__":
+    main()
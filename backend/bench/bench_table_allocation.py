@@ -0,0 +1,107 @@
+"""
+Нагрузочный тест распределения столов на локальном PostgreSQL.
+
+Много потоков одновременно бронируют случайные столы из небольшого набора
+на несколько дат (высокая конкуренция за одни и те же столы). После прогона
+проверяется, что ни один стол не занят двумя активными бронями, и что
+индекс table_usage совпадает с reservations.
+
+    python -m bench.bench_table_allocation [--threads 32] [--requests 200]
+
+Нужны initdb/pg_ctl в PATH (или PG_BIN).
+"""
+import argparse
+import os
+import random
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench.local_services import LocalPostgres  # noqa: E402
+
+DOUBLE_BOOKINGS_SQL = """
+    SELECT r.branch, r.date, t.table_id, count(*)
+    FROM reservations r, unnest(r.tables) AS t(table_id)
+    WHERE r.status != 'cancelled'
+    GROUP BY 1, 2, 3
+    HAVING count(*) > 1
+"""
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--threads", type=int, default=32)
+    parser.add_argument("--requests", type=int, default=200, help="запросов на поток")
+    parser.add_argument("--tables", type=int, default=40)
+    parser.add_argument("--dates", type=int, default=5)
+    args = parser.parse_args()
+
+    os.environ["DB_POOL_MAX"] = str(args.threads)
+    with LocalPostgres() as pg:
+        from app import app
+        import occupancy
+
+        tables = ["T%d" % i for i in range(args.tables)]
+        dates = ["2030-02-%02d" % (d + 1) for d in range(args.dates)]
+        counts = {"ok": 0, "conflict": 0, "error": 0}
+        counts_lock = threading.Lock()
+        latencies = []
+
+        def worker(seed):
+            rnd = random.Random(seed)
+            client = app.test_client()
+            local = {"ok": 0, "conflict": 0, "error": 0}
+            local_lat = []
+            for _ in range(args.requests):
+                item = {
+                    "user_email": "guest%d@example.com" % seed,
+                    "branch": "Bench",
+                    "date": rnd.choice(dates),
+                    "tables": rnd.sample(tables, rnd.randint(1, 3)),
+                    "guests": 2,
+                }
+                started = time.perf_counter()
+                resp = client.post("/reservation", json=item)
+                local_lat.append(time.perf_counter() - started)
+                if resp.status_code == 200:
+                    local["ok"] += 1
+                elif resp.status_code == 409:
+                    local["conflict"] += 1
+                else:
+                    local["error"] += 1
+            with counts_lock:
+                for k, v in local.items():
+                    counts[k] += v
+                latencies.extend(local_lat)
+
+        threads = [threading.Thread(target=worker, args=(i,)) for i in range(args.threads)]
+        started = time.perf_counter()
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        elapsed = time.perf_counter() - started
+
+        conn = pg.connect()
+        cur = conn.cursor()
+        cur.execute(DOUBLE_BOOKINGS_SQL)
+        doubles = cur.fetchall()
+        consistency = occupancy.check_consistency(conn)
+        conn.close()
+
+        latencies.sort()
+        total = sum(counts.values())
+        print("%d запросов, %d потоков: %.2f с, %.0f запросов/с"
+              % (total, args.threads, elapsed, total / elapsed))
+        print("успешно %(ok)d, конфликт (409) %(conflict)d, ошибок %(error)d" % counts)
+        print("задержка p50 %.1f мс, p99 %.1f мс"
+              % (latencies[len(latencies) // 2] * 1000, latencies[int(len(latencies) * 0.99)] * 1000))
+        print("двойных броней: %d, расхождений индекса: missing=%d extra=%d"
+              % (len(doubles), consistency["missing"], consistency["extra"]))
+        sys.exit(1 if doubles or counts["error"] else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,433 @@
+"""
+Нагрузочный HTTP-бенчмарк всего бэкенда на локальных заменителях сервисов.
+
+Поднимает временный PostgreSQL (LocalPostgres, с миграциями и тестовыми
+данными), локальный SMTP (LocalSMTPServer) и само приложение — встроенным
+многопоточным сервером werkzeug или gunicorn. Затем N клиентов с keep-alive
+соединениями выполняют смешанную нагрузку:
+
+    menu            GET  /menu
+    occupied        GET  /occupied?branch=..&date=..
+    reservation     POST /reservation
+    login           POST /login/email
+    user_bookings   GET  /user/bookings   (с cookie после входа)
+    register_email  POST /register/email  (код в БД + письмо в очередь)
+    static          GET  /static/images/<картинка>
+
+Для каждого маршрута печатаются p50/p95/p99, ошибки и запросов в секунду.
+Результат сохраняется в JSON (по умолчанию bench/results/http-<commit>-<время>.json);
+--compare показывает разницу с прошлым прогоном.
+
+    python -m bench.http_bench --duration 30 --concurrency 16
+    python -m bench.http_bench --server gunicorn --workers 4 --compare bench/results/http-abc1234-....json
+    python -m bench.http_bench --no-db        # только menu/static, без PostgreSQL
+
+Нужны initdb/pg_ctl в PATH или PG_BIN (кроме --no-db).
+"""
+import argparse
+import http.client
+import json
+import os
+import random
+import socket
+import statistics
+import subprocess
+import sys
+import threading
+import time
+from datetime import date, timedelta
+from urllib.parse import urlencode
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+from bench.local_services import LocalPostgres, LocalSMTPServer, _free_port  # noqa: E402
+
+DEFAULT_MIX = "menu=40,occupied=20,reservation=10,login=5,user_bookings=10,register_email=5,static=10"
+DB_FREE_OPS = ("menu", "static")
+BRANCHES = ["Абая 150", "Достык 5", "Сатпаева 30"]
+TABLES = ["L4-%d" % i for i in range(1, 11)] + ["C6-%d" % i for i in range(1, 6)] + ["S2-%d" % i for i in range(1, 9)]
+PASSWORD = "bench-password"
+
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * q))]
+
+
+def parse_mix(text):
+    mix = {}
+    for part in text.split(","):
+        name, _, weight = part.partition("=")
+        mix[name.strip()] = float(weight or 1)
+    unknown = set(mix) - set(OPERATIONS)
+    if unknown:
+        raise SystemExit("неизвестные операции: %s" % ", ".join(sorted(unknown)))
+    return mix
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=BACKEND_DIR,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+# ------------------- Тестовые данные -------------------
+def seed_database(pg, users, reservations, days, rnd):
+    from werkzeug.security import generate_password_hash
+
+    hashed = generate_password_hash(PASSWORD)
+    today = date.today()
+    conn = pg.connect()
+    cur = conn.cursor()
+    cur.executemany("INSERT INTO users (name, email, password, verified) VALUES (%s, %s, %s, TRUE)",
+                    [("Гость %d" % i, "guest%d@bench.local" % i, hashed) for i in range(users)])
+    rows = []
+    for _ in range(reservations):
+        rows.append(("guest%d@bench.local" % rnd.randrange(users), rnd.choice(BRANCHES),
+                     today + timedelta(days=rnd.randrange(days)), [rnd.choice(TABLES)], rnd.randint(1, 6)))
+    conn.commit()
+    conn.close()
+
+    # через insert_reservations, чтобы заполнился и индекс занятости
+    import db
+    from reservations import insert_reservations
+    with db.db_connection() as conn:
+        insert_reservations(conn.cursor(), [r + ("", []) for r in rows])
+
+    # /menu отдаётся из таблицы menu (menu_store.py)
+    from menu_store import import_menu
+    with open(os.path.join(BACKEND_DIR, "menu.json"), encoding="utf-8") as f:
+        menu_data = json.load(f)
+    with db.db_connection() as conn:
+        import_menu(conn.cursor(), menu_data)
+
+
+# ------------------- Клиент -------------------
+class Client:
+    """Одно keep-alive соединение и cookie сессии, как у браузера."""
+
+    def __init__(self, host, port, timeout=30.0):
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+        self.cookie = None
+        self.conn = None
+        self.last_location = None   # Location последнего ответа (редиректы OAuth)
+
+    def request(self, method, path, body=None):
+        headers = {"Accept-Encoding": "identity"}
+        if body is not None:
+            body = json.dumps(body).encode()
+            headers["Content-Type"] = "application/json"
+        if self.cookie:
+            headers["Cookie"] = self.cookie
+        for attempt in (1, 2):
+            if self.conn is None:
+                self.conn = http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+            try:
+                self.conn.request(method, path, body=body, headers=headers)
+                response = self.conn.getresponse()
+                data = response.read()
+            except (http.client.HTTPException, OSError):
+                # сервер закрыл keep-alive соединение — один повтор на новом
+                self.conn.close()
+                self.conn = None
+                if attempt == 2:
+                    raise
+                continue
+            if response.will_close:
+                self.conn.close()
+                self.conn = None
+            set_cookie = response.getheader("Set-Cookie")
+            if set_cookie:
+                self.cookie = set_cookie.split(";", 1)[0]
+            self.last_location = response.getheader("Location")
+            return response.status, data
+
+    def close(self):
+        if self.conn is not None:
+            self.conn.close()
+
+
+# ------------------- Операции нагрузки -------------------
+def op_menu(client, ctx, rnd):
+    return client.request("GET", "/menu")
+
+
+def op_static(client, ctx, rnd):
+    return client.request("GET", rnd.choice(ctx["images"]))
+
+
+def op_occupied(client, ctx, rnd):
+    query = urlencode({"branch": rnd.choice(BRANCHES), "date": ctx["date"](rnd).isoformat()})
+    return client.request("GET", "/occupied?" + query)
+
+
+def op_reservation(client, ctx, rnd):
+    return client.request("POST", "/reservation", {
+        "user_email": "guest%d@bench.local" % rnd.randrange(ctx["users"]),
+        "branch": rnd.choice(BRANCHES),
+        "date": ctx["date"](rnd).isoformat(),
+        "tables": rnd.sample(TABLES, rnd.randint(1, 2)),
+        "guests": rnd.randint(1, 6),
+        "notes": "",
+        "menu_items": [],
+    })
+
+
+def op_login(client, ctx, rnd):
+    return client.request("POST", "/login/email", {
+        "email": "guest%d@bench.local" % rnd.randrange(ctx["users"]), "password": PASSWORD})
+
+
+def op_user_bookings(client, ctx, rnd):
+    if client.cookie is None:
+        op_login(client, ctx, rnd)
+    return client.request("GET", "/user/bookings")
+
+
+def op_register_email(client, ctx, rnd):
+    return client.request("POST", "/register/email", {"email": "new%d@bench.local" % rnd.randrange(10 ** 6)})
+
+
+OPERATIONS = {
+    "menu": op_menu,
+    "occupied": op_occupied,
+    "reservation": op_reservation,
+    "login": op_login,
+    "user_bookings": op_user_bookings,
+    "register_email": op_register_email,
+    "static": op_static,
+}
+# ожидаемые статусы: 409 у /reservation — нормальный отказ (стол занят)
+OK_STATUSES = {"reservation": (200, 409)}
+
+
+def run_load(host, port, mix, ctx, concurrency, duration, warmup, seed):
+    names = list(mix)
+    weights = [mix[n] for n in names]
+    samples = {name: [] for name in names}
+    errors = {name: 0 for name in names}
+    lock = threading.Lock()
+    start_at = time.monotonic() + warmup
+    stop_at = start_at + duration
+
+    def worker(index):
+        rnd = random.Random(seed * 1000 + index)
+        client = Client(host, port)
+        local = {name: [] for name in names}
+        local_errors = {name: 0 for name in names}
+        try:
+            while True:
+                now = time.monotonic()
+                if now >= stop_at:
+                    break
+                name = rnd.choices(names, weights)[0]
+                started = time.perf_counter()
+                try:
+                    status, _ = OPERATIONS[name](client, ctx, rnd)
+                    ok = status in OK_STATUSES.get(name, (200, 201))
+                except (http.client.HTTPException, OSError):
+                    ok = False
+                elapsed = time.perf_counter() - started
+                if now < start_at:
+                    continue   # прогрев не учитываем
+                local[name].append(elapsed)
+                if not ok:
+                    local_errors[name] += 1
+        finally:
+            client.close()
+        with lock:
+            for name in names:
+                samples[name].extend(local[name])
+                errors[name] += local_errors[name]
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(concurrency)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return samples, errors
+
+
+def summarize(samples, errors, duration):
+    routes = {}
+    all_samples = []
+    for name, values in samples.items():
+        if not values:
+            continue
+        all_samples += values
+        routes[name] = {
+            "count": len(values),
+            "errors": errors[name],
+            "rps": round(len(values) / duration, 2),
+            "p50_ms": round(statistics.median(values) * 1000, 3),
+            "p95_ms": round(percentile(values, 0.95) * 1000, 3),
+            "p99_ms": round(percentile(values, 0.99) * 1000, 3),
+            "mean_ms": round(statistics.fmean(values) * 1000, 3),
+        }
+    total = {
+        "count": len(all_samples),
+        "errors": sum(errors.values()),
+        "rps": round(len(all_samples) / duration, 2),
+        "p50_ms": round(statistics.median(all_samples) * 1000, 3) if all_samples else None,
+        "p95_ms": round(percentile(all_samples, 0.95) * 1000, 3) if all_samples else None,
+        "p99_ms": round(percentile(all_samples, 0.99) * 1000, 3) if all_samples else None,
+    }
+    return routes, total
+
+
+def print_report(routes, total, previous=None):
+    header = "%-15s %8s %7s %9s %9s %9s %9s" % ("route", "count", "errors", "rps", "p50 ms", "p95 ms", "p99 ms")
+    if previous:
+        header += "   %9s %9s" % ("Δp50", "Δrps")
+    print(header)
+    rows = sorted(routes.items()) + [("TOTAL", total)]
+    for name, r in rows:
+        line = "%-15s %8d %7d %9.1f %9.2f %9.2f %9.2f" % (
+            name, r["count"], r["errors"], r["rps"], r["p50_ms"] or 0, r["p95_ms"] or 0, r["p99_ms"] or 0)
+        if previous:
+            old = previous["total"] if name == "TOTAL" else previous["routes"].get(name)
+            if old and old.get("p50_ms") and old.get("rps"):
+                line += "   %+8.1f%% %+8.1f%%" % ((r["p50_ms"] - old["p50_ms"]) / old["p50_ms"] * 100,
+                                                  (r["rps"] - old["rps"]) / old["rps"] * 100)
+        print(line)
+
+
+# ------------------- Сервер приложения -------------------
+def start_werkzeug(port):
+    from werkzeug.serving import WSGIRequestHandler, make_server
+
+    class KeepAliveHandler(WSGIRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_request(self, *args, **kwargs):
+            pass
+
+    from app import app
+    server = make_server("127.0.0.1", port, app, threaded=True, request_handler=KeepAliveHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server.shutdown
+
+
+def start_gunicorn(port, workers, threads=1, worker_class="sync", target="app:app", extra=()):
+    process = subprocess.Popen(
+        [sys.executable, "-m", "gunicorn", "-k", worker_class, "-w", str(workers), "--threads", str(threads),
+         "-b", "127.0.0.1:%d" % port, "--log-level", "warning"] + list(extra) + [target],
+        cwd=BACKEND_DIR, env=dict(os.environ))
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise SystemExit("gunicorn завершился с кодом %s" % process.returncode)
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=0.5).close()
+            break
+        except OSError:
+            time.sleep(0.2)
+
+    def stop():
+        process.terminate()
+        process.wait(timeout=30)
+    return stop
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--duration", type=float, default=20.0, help="секунд замера")
+    parser.add_argument("--warmup", type=float, default=3.0, help="секунд прогрева (не учитываются)")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--mix", default=DEFAULT_MIX, help="веса операций, например menu=50,occupied=50")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--reservations", type=int, default=5000, help="броней в тестовой базе")
+    parser.add_argument("--days", type=int, default=30, help="на сколько дней вперёд брони")
+    parser.add_argument("--server", choices=("werkzeug", "gunicorn"), default="werkzeug")
+    parser.add_argument("--workers", type=int, default=4, help="воркеры gunicorn")
+    parser.add_argument("--threads", type=int, default=4, help="потоки на воркер gunicorn")
+    parser.add_argument("--smtp-delay", type=float, default=0.05, help="задержка SMTP-подключения, с")
+    parser.add_argument("--no-db", action="store_true", help="без PostgreSQL: только menu и static")
+    parser.add_argument("--out", help="куда сохранить JSON (по умолчанию bench/results/)")
+    parser.add_argument("--compare", help="JSON прошлого прогона для сравнения")
+    args = parser.parse_args()
+
+    mix = parse_mix(args.mix)
+    if args.no_db:
+        mix = {name: w for name, w in mix.items() if name in DB_FREE_OPS}
+    rnd = random.Random(args.seed)
+
+    os.environ.setdefault("SESSION_SECRET", "bench-secret")
+    os.environ["LOG_LEVEL"] = "WARNING"
+    os.environ["DB_POOL_MAX"] = str(max(args.concurrency, 10))
+    if args.no_db:
+        os.environ["SESSION_BACKEND"] = "memory"
+        os.environ["MENU_SOURCE"] = "file"
+
+    images_dir = os.path.join(BACKEND_DIR, "static", "images")
+    today = date.today()
+    ctx = {
+        "users": args.users,
+        "images": ["/static/images/" + n for n in sorted(os.listdir(images_dir)) if n.endswith(".png")],
+        "date": lambda r: today + timedelta(days=r.randrange(args.days)),
+    }
+
+    pg = None
+    smtp = LocalSMTPServer(connect_delay=args.smtp_delay).start()
+    os.environ.update({"SMTP_HOST": smtp.host, "SMTP_PORT": str(smtp.port), "SMTP_STARTTLS": "0",
+                       "EMAIL_SENDER": "cafe@bench.local", "EMAIL_PASSWORD": "bench"})
+    stop_server = None
+    try:
+        if not args.no_db:
+            pg = LocalPostgres().start()
+            seed_database(pg, args.users, args.reservations, args.days, rnd)
+
+        port = _free_port()
+        if args.server == "gunicorn":
+            stop_server = start_gunicorn(port, args.workers, args.threads)
+        else:
+            stop_server = start_werkzeug(port)
+
+        print("%s, %d клиентов, %.0f с (+%.0f с прогрев), смесь: %s" % (
+            args.server, args.concurrency, args.duration, args.warmup,
+            ", ".join("%s=%g" % kv for kv in mix.items())))
+        samples, errors = run_load("127.0.0.1", port, mix, ctx, args.concurrency,
+                                   args.duration, args.warmup, args.seed)
+    finally:
+        if stop_server is not None:
+            stop_server()
+        if pg is not None:
+            pg.stop()
+        smtp.stop()
+
+    routes, total = summarize(samples, errors, args.duration)
+    previous = None
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            previous = json.load(f)
+    print_report(routes, total, previous)
+
+    commit = git_commit()
+    result = {
+        "meta": {
+            "commit": commit,
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": sys.version.split()[0],
+            "args": vars(args),
+            "mix": mix,
+        },
+        "routes": routes,
+        "total": total,
+    }
+    out = args.out or os.path.join(BACKEND_DIR, "bench", "results",
+                                   "http-%s-%s.json" % (commit, time.strftime("%Y%m%d-%H%M%S")))
+    os.makedirs(os.path.dirname(out), exist_ok=True)
+    with open(out, "w", encoding="utf-8") as f:
+        json.dump(result, f, ensure_ascii=False, indent=2)
+    print("результат:", out)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,363 @@
+"""
+Локальные заменители внешних сервисов для бенчмарков — без сети, без Neon
+и без настоящего Gmail.
+
+LocalPostgres — временный кластер PostgreSQL (initdb + pg_ctl из PATH или
+из PG_BIN) на свободном порту, с применёнными миграциями. Переменные DB_*
+окружения переключаются на него, так что db.get_pool() подключается к нему.
+
+    with LocalPostgres() as pg:
+        ...
+
+LocalSMTPServer — минимальный SMTP-сервер (EHLO/AUTH/MAIL/RCPT/DATA/NOOP/
+RSET/QUIT) в отдельном потоке. Задержки connect_delay и send_delay
+имитируют TLS-рукопожатие/логин и приём письма у реального провайдера.
+
+    with LocalSMTPServer(connect_delay=0.3) as smtp:
+        os.environ["SMTP_HOST"], os.environ["SMTP_PORT"] = smtp.host, str(smtp.port)
+
+LocalOIDC — заменитель Google OAuth: discovery, JWKS, /authorize, /token
+(id_token с подписью RS256) и /userinfo; /token и /userinfo отвечают с задержкой
+delay (медленный внешний провайдер). GOOGLE_DISCOVERY_URL направляется на него.
+
+    with LocalOIDC(delay=0.2) as oidc:
+        os.environ["GOOGLE_DISCOVERY_URL"] = oidc.discovery_url
+"""
+import json
+import os
+import secrets
+import shutil
+import socket
+import socketserver
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlencode
+
+from joserfc import jwt
+from joserfc.jwk import RSAKey
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+class LocalPostgres:
+    ENV_KEYS = ("DB_NAME", "DB_USER", "DB_PASSWORD", "DB_HOST", "DB_PORT", "DB_SSLMODE")
+
+    def __init__(self, dbname="cafe_bench", migrate=True):
+        self.dbname = dbname
+        self.migrate = migrate
+        self.port = _free_port()
+        self.user = "postgres"
+        self._dir = None
+        self._saved_env = {}
+
+    @staticmethod
+    def _binary(name):
+        pg_bin = os.getenv("PG_BIN")
+        path = os.path.join(pg_bin, name) if pg_bin else shutil.which(name)
+        if not path or not os.path.exists(path):
+            raise RuntimeError("%s не найден: установите PostgreSQL или задайте PG_BIN" % name)
+        return path
+
+    def start(self):
+        self._dir = tempfile.mkdtemp(prefix="cafe-pg-")
+        data = os.path.join(self._dir, "data")
+        subprocess.run([self._binary("initdb"), "-D", data, "-U", self.user, "-A", "trust", "-E", "UTF8"],
+                       check=True, stdout=subprocess.DEVNULL)
+        subprocess.run([self._binary("pg_ctl"), "-D", data, "-l", os.path.join(self._dir, "pg.log"), "-w",
+                        "-o", "-F -p %d -k %s -c listen_addresses=127.0.0.1 -c max_connections=200"
+                        % (self.port, self._dir), "start"],
+                       check=True, stdout=subprocess.DEVNULL)
+
+        import psycopg2
+        conn = psycopg2.connect(dbname="postgres", user=self.user, host="127.0.0.1", port=self.port)
+        conn.autocommit = True
+        conn.cursor().execute("CREATE DATABASE %s" % self.dbname)
+        conn.close()
+
+        env = {"DB_NAME": self.dbname, "DB_USER": self.user, "DB_PASSWORD": "",
+               "DB_HOST": "127.0.0.1", "DB_PORT": str(self.port), "DB_SSLMODE": "disable"}
+        for key in self.ENV_KEYS:
+            self._saved_env[key] = os.environ.get(key)
+        os.environ.update(env)
+
+        import db
+        db.close_pool()
+        if self.migrate:
+            import migrations
+            with db.db_connection() as conn:
+                migrations.upgrade(conn)
+        return self
+
+    def connect(self):
+        import psycopg2
+        return psycopg2.connect(dbname=self.dbname, user=self.user, host="127.0.0.1", port=self.port)
+
+    def stop(self):
+        import db
+        db.close_pool()
+        for key, value in self._saved_env.items():
+            if value is None:
+                os.environ.pop(key, None)
+            else:
+                os.environ[key] = value
+        if self._dir:
+            subprocess.run([self._binary("pg_ctl"), "-D", os.path.join(self._dir, "data"), "-m", "fast", "-w", "stop"],
+                           stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+            shutil.rmtree(self._dir, ignore_errors=True)
+            self._dir = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+class _SMTPHandler(socketserver.StreamRequestHandler):
+    def _reply(self, line):
+        self.wfile.write((line + "\r\n").encode("ascii"))
+        self.wfile.flush()
+
+    def handle(self):
+        server = self.server
+        with server.stats_lock:
+            server.connections += 1
+        if server.connect_delay:
+            time.sleep(server.connect_delay)
+        self._reply("220 localhost ESMTP stand-in")
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            command = line.decode("ascii", "replace").strip()
+            verb = command.split(" ", 1)[0].upper()
+            if verb in ("EHLO", "HELO"):
+                self.wfile.write(b"250-localhost\r\n250-AUTH PLAIN LOGIN\r\n250 8BITMIME\r\n")
+                self.wfile.flush()
+            elif verb == "AUTH":
+                self._reply("235 2.7.0 Authentication successful")
+            elif verb in ("MAIL", "RSET", "NOOP"):
+                self._reply("250 OK")
+            elif verb == "RCPT":
+                if server.reject_recipients:
+                    self._reply("550 5.1.1 No such user")
+                else:
+                    self._reply("250 OK")
+            elif verb == "DATA":
+                self._reply("354 End data with <CR><LF>.<CR><LF>")
+                data = []
+                while True:
+                    chunk = self.rfile.readline()
+                    if not chunk or chunk == b".\r\n":
+                        break
+                    data.append(chunk)
+                if server.send_delay:
+                    time.sleep(server.send_delay)
+                with server.stats_lock:
+                    server.messages.append(b"".join(data))
+                self._reply("250 OK queued")
+            elif verb == "QUIT":
+                self._reply("221 Bye")
+                return
+            else:
+                self._reply("502 Command not implemented")
+
+
+class LocalSMTPServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, host="127.0.0.1", port=0, connect_delay=0.0, send_delay=0.0):
+        super().__init__((host, port), _SMTPHandler)
+        self.connect_delay = connect_delay
+        self.send_delay = send_delay
+        self.reject_recipients = False
+        self.messages = []
+        self.connections = 0
+        self.stats_lock = threading.Lock()
+        self._thread = None
+
+    @property
+    def host(self):
+        return self.server_address[0]
+
+    @property
+    def port(self):
+        return self.server_address[1]
+
+    def start(self):
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+class _OIDCHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args):
+        pass
+
+    def _json(self, data, status=200, max_age=None):
+        body = json.dumps(data).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        if max_age is not None:
+            self.send_header("Cache-Control", "public, max-age=%d" % max_age)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        server = self.server
+        path, _, query = self.path.partition("?")
+        if path == "/.well-known/openid-configuration":
+            server.count("discovery")
+            self._json(server.metadata(), max_age=server.max_age)
+        elif path == "/jwks":
+            server.count("jwks")
+            self._json(server.jwks(), max_age=server.max_age)
+        elif path == "/authorize":
+            # пользователь «согласился» сразу: редирект обратно с кодом
+            params = {k: v[0] for k, v in parse_qs(query).items()}
+            code = server.issue_code(params.get("nonce"))
+            location = "%s?%s" % (params["redirect_uri"], urlencode({"code": code, "state": params.get("state", "")}))
+            self.send_response(302)
+            self.send_header("Location", location)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+        elif path == "/userinfo":
+            time.sleep(server.delay)
+            n = server.count("userinfo")
+            self._json(server.claims_for(n))
+        else:
+            self._json({"error": "not_found"}, 404)
+
+    def do_POST(self):
+        server = self.server
+        length = int(self.headers.get("Content-Length") or 0)
+        form = {k: v[0] for k, v in parse_qs(self.rfile.read(length).decode()).items()}
+        if self.path == "/token" and form.get("grant_type") == "authorization_code":
+            time.sleep(server.delay)
+            n = server.count("token")
+            nonce = server.redeem_code(form.get("code"))
+            if nonce is False:
+                self._json({"error": "invalid_grant"}, 400)
+                return
+            self._json({"access_token": "local-token-%d" % n, "token_type": "Bearer",
+                        "expires_in": 3600, "scope": "openid email profile",
+                        "id_token": server.id_token(n, nonce)})
+        else:
+            self._json({"error": "invalid_request"}, 400)
+
+
+class LocalOIDC(ThreadingHTTPServer):
+    """
+    Провайдер с кодом авторизации: /authorize сразу редиректит на redirect_uri
+    с кодом, /token выдаёт id_token, подписанный RS256 (ключ из /jwks, kid
+    меняется rotate_key()). Каждый вход — новый пользователь local-N.
+    Счётчики обращений — calls["discovery" | "jwks" | "token" | "userinfo"].
+    """
+    daemon_threads = True
+
+    def __init__(self, host="127.0.0.1", port=0, delay=0.0, client_id="bench-client", max_age=3600):
+        super().__init__((host, port), _OIDCHandler)
+        self.delay = delay
+        self.client_id = client_id
+        self.max_age = max_age
+        self.calls = {}
+        self.stats_lock = threading.Lock()
+        self._codes = {}
+        self._keys = []
+        self._thread = None
+        self.rotate_key()
+
+    def count(self, name):
+        with self.stats_lock:
+            self.calls[name] = self.calls.get(name, 0) + 1
+            return self.calls[name]
+
+    def rotate_key(self):
+        """Новый ключ подписи; старый остаётся в JWKS (как у Google при смене ключей)."""
+        kid = "local-%d" % (len(self._keys) + 1)
+        self._keys = [RSAKey.generate_key(2048, parameters={"kid": kid}, private=True)] + self._keys[:1]
+
+    def jwks(self):
+        return {"keys": [dict(key.as_dict(private=False), use="sig", alg="RS256") for key in self._keys]}
+
+    def issue_code(self, nonce):
+        code = secrets.token_urlsafe(16)
+        with self.stats_lock:
+            self._codes[code] = nonce
+        return code
+
+    def redeem_code(self, code):
+        """nonce кода (код одноразовый); False — неизвестный код."""
+        with self.stats_lock:
+            return self._codes.pop(code, False)
+
+    def claims_for(self, n):
+        return {"sub": "local-%d" % n, "email": "oidc%d@bench.local" % n,
+                "name": "OIDC %d" % n, "email_verified": True}
+
+    def id_token(self, n, nonce):
+        now = int(time.time())
+        claims = dict(self.claims_for(n), iss=self.issuer, aud=self.client_id, iat=now, exp=now + 3600)
+        if nonce:
+            claims["nonce"] = nonce
+        key = self._keys[0]
+        return jwt.encode({"alg": "RS256", "kid": key.kid}, claims, key)
+
+    @property
+    def issuer(self):
+        return "http://%s:%d" % self.server_address[:2]
+
+    @property
+    def discovery_url(self):
+        return self.issuer + "/.well-known/openid-configuration"
+
+    def metadata(self):
+        return {
+            "issuer": self.issuer,
+            "authorization_endpoint": self.issuer + "/authorize",
+            "token_endpoint": self.issuer + "/token",
+            "userinfo_endpoint": self.issuer + "/userinfo",
+            "jwks_uri": self.issuer + "/jwks",
+            "response_types_supported": ["code"],
+            "subject_types_supported": ["public"],
+            "id_token_signing_alg_values_supported": ["RS256"],
+        }
+
+    def start(self):
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
@@ -0,0 +1,112 @@
+"""
+Кэш /user/bookings: готовый JSON списка броней каждого пользователя.
+
+Профиль запрашивает /user/bookings при каждом открытии, а брони пользователя
+меняются редко. Поэтому в памяти процесса хранится уже сериализованный ответ,
+а сбрасывается он точно при изменении броней этого пользователя:
+
+- в своём процессе — сразу после коммита (invalidate() в обработчиках
+  /reservation, /pending/claim, /reservation/confirm, /reservation/cancel,
+  /reservations/batch и /admin/reservations/status), чтобы пользователь
+  сразу увидел свою бронь;
+- в остальных воркерах — по NOTIFY bookings_changed, который шлёт триггер
+  на reservations (миграции 006, 010) при любой вставке, изменении или
+  удалении — один раз на оператор и email.
+
+Пока соединение LISTEN не установлено (notify.py), кэш не используется.
+Запись в кэш отменяется, если за время чтения из БД пришло хоть одно
+сбрасывание (счётчик epoch), — устаревший список не попадёт в кэш.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+from metrics import REGISTRY, Counter
+
+CHANNEL = "bookings_changed"
+
+BOOKINGS_CACHE = REGISTRY.register(Counter(
+    "bookings_cache_requests_total", "Обращения к кэшу /user/bookings: hit, miss, bypass", ("result",)))
+BOOKINGS_CACHE_INVALIDATIONS = REGISTRY.register(Counter(
+    "bookings_cache_invalidations_total", "Сброшенные записи кэша /user/bookings", ("source",)))
+
+
+class BookingsCache:
+    """
+    get_listener — функция, возвращающая NotifyListener текущего процесса
+    (notify.get_listener); None — без межпроцессного сброса (один процесс).
+    """
+
+    def __init__(self, get_listener=None, max_entries=10000, ttl=3600.0):
+        self.get_listener = get_listener
+        self.max_entries = max_entries
+        self.ttl = ttl               # страховка на случай потерянного уведомления
+        self._items = OrderedDict()  # email -> (body, stored_at)
+        self._lock = threading.Lock()
+        self._epoch = 0
+        self._listener = None
+
+    def _usable(self):
+        if self.get_listener is None:
+            return True
+        listener = self.get_listener()
+        if listener is not self._listener:
+            # первый запрос в процессе (или после fork) — подписываемся
+            with self._lock:
+                if listener is not self._listener:
+                    self._listener = listener
+                    self._epoch += 1
+                    self._items.clear()
+                    listener.subscribe(CHANNEL, self._on_notify, self.clear)
+        return listener.connected
+
+    def get_or_load(self, email, load):
+        """
+        Возвращает байты ответа для email; load(email) читает из БД и
+        сериализует. Результат кэшируется, если за время чтения ничего не сброшено.
+        """
+        if not self._usable():
+            BOOKINGS_CACHE.inc("bypass")
+            return load(email)
+
+        with self._lock:
+            item = self._items.get(email)
+            if item is not None and time.monotonic() - item[1] < self.ttl:
+                self._items.move_to_end(email)
+                BOOKINGS_CACHE.inc("hit")
+                return item[0]
+            epoch = self._epoch
+
+        BOOKINGS_CACHE.inc("miss")
+        body = load(email)
+        with self._lock:
+            if epoch == self._epoch and (self._listener is None or self._listener.connected):
+                self._items[email] = (body, time.monotonic())
+                self._items.move_to_end(email)
+                while len(self._items) > self.max_entries:
+                    self._items.popitem(last=False)
+        return body
+
+    def invalidate(self, *emails, source="local"):
+        with self._lock:
+            self._epoch += 1
+            for email in emails:
+                if self._items.pop(email, None) is not None:
+                    BOOKINGS_CACHE_INVALIDATIONS.inc(source)
+
+    def _on_notify(self, email):
+        self.invalidate(email, source="notify")
+
+    def clear(self):
+        with self._lock:
+            self._epoch += 1
+            self._items.clear()
+
+    def stats(self):
+        return {
+            "entries": len(self._items),
+            "hits": BOOKINGS_CACHE.value("hit"),
+            "misses": BOOKINGS_CACHE.value("miss"),
+            "bypass": BOOKINGS_CACHE.value("bypass"),
+            "listener_connected": self._listener is None or self._listener.connected,
+        }
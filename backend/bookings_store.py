@@ -0,0 +1,179 @@
+"""
+Хранилище броней для старых эндпоинтов /book, /bookings, /search_booking.
+
+Вместо bookings.json (весь массив перезаписывался при каждой брони) —
+журнал bookings.jsonl: одна бронь = одна строка JSON, запись только в конец.
+
+- append() — O(1): одна запись write() в файл, открытый с O_APPEND,
+  под эксклюзивной блокировкой (flock) отдельного .lock-файла,
+  поэтому параллельные воркеры gunicorn не теряют записи;
+- читатели не берут блокировку: неполная последняя строка (запись ещё идёт)
+  и битые строки пропускаются, так что «половину файла» никто не видит;
+- compact() и clear() пишут новый файл во временный и атомарно
+  подменяют журнал через os.replace().
+
+При первом обращении старый bookings.json переносится в журнал.
+"""
+import json
+import os
+import tempfile
+import threading
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows: блокировка только между потоками одного процесса
+    fcntl = None
+
+# права нового журнала — как у os.open(..., 0o644) в append() с учётом umask
+_UMASK = os.umask(0)
+os.umask(_UMASK)
+LOG_MODE = 0o644 & ~_UMASK
+
+
+class BookingLog:
+    def __init__(self, path, legacy_path=None, fsync=False):
+        self.path = path
+        self.legacy_path = legacy_path
+        self.fsync = fsync
+        self.lock_path = path + ".lock"
+        self._thread_lock = threading.Lock()
+        self._migrated = False
+
+    # ------------------- Блокировки -------------------
+    @contextmanager
+    def _locked(self):
+        with self._thread_lock:
+            if fcntl is None:
+                yield
+                return
+            fd = os.open(self.lock_path, os.O_RDWR | os.O_CREAT, 0o644)
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX)
+                yield
+            finally:
+                os.close(fd)  # закрытие снимает flock
+
+    def _ensure_migrated(self):
+        if self._migrated:
+            return
+        if not os.path.exists(self.path) and self.legacy_path and os.path.exists(self.legacy_path):
+            with self._locked():
+                if not os.path.exists(self.path):
+                    with open(self.legacy_path, "r", encoding="utf-8") as f:
+                        try:
+                            records = json.load(f)
+                        except ValueError:
+                            records = []
+                    self._write_atomic(records)
+        self._migrated = True
+
+    # ------------------- Запись -------------------
+    @staticmethod
+    def _encode(record):
+        return (json.dumps(record, ensure_ascii=False, separators=(",", ":")) + "\n").encode("utf-8")
+
+    def append(self, record):
+        """Дописывает одну бронь в конец журнала."""
+        self._ensure_migrated()
+        line = self._encode(record)
+        with self._locked():
+            fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+            try:
+                view = memoryview(line)
+                while view:
+                    written = os.write(fd, view)
+                    view = view[written:]
+                if self.fsync:
+                    os.fsync(fd)
+            finally:
+                os.close(fd)
+
+    def _write_atomic(self, records):
+        directory = os.path.dirname(os.path.abspath(self.path))
+        fd, tmp_path = tempfile.mkstemp(prefix=".bookings-", suffix=".tmp", dir=directory)
+        try:
+            # mkstemp создаёт файл с 0600, а os.replace сохранит эти права журналу
+            try:
+                mode = os.stat(self.path).st_mode & 0o777
+            except FileNotFoundError:
+                mode = LOG_MODE
+            if hasattr(os, "fchmod"):  # нет в Windows
+                os.fchmod(fd, mode)
+            with os.fdopen(fd, "wb") as f:
+                for record in records:
+                    f.write(self._encode(record))
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+            raise
+
+    def clear(self):
+        """Удаляет все брони (атомарная подмена пустым журналом)."""
+        self._migrated = True
+        with self._locked():
+            self._write_atomic([])
+
+    def compact(self):
+        """
+        Переписывает журнал без битых и недописанных строк.
+        Возвращает количество сохранённых броней.
+        """
+        self._ensure_migrated()
+        with self._locked():
+            records = list(self.iter_records())
+            self._write_atomic(records)
+        return len(records)
+
+    # ------------------- Чтение -------------------
+    def iter_records(self):
+        """Потоково отдаёт брони в порядке добавления."""
+        self._ensure_migrated()
+        try:
+            f = open(self.path, "rb")
+        except FileNotFoundError:
+            return
+        with f:
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break  # запись ещё не завершена
+                try:
+                    yield json.loads(line)
+                except ValueError:
+                    continue
+
+    def read_since(self, offset=0, identity=None):
+        """
+        Дочитывает брони, добавленные после позиции offset.
+        identity — (st_dev, st_ino) файла с прошлого вызова; если журнал
+        был подменён (clear/compact), чтение начинается с начала.
+        Возвращает (records, offset, identity, reset).
+        """
+        self._ensure_migrated()
+        try:
+            f = open(self.path, "rb")
+        except FileNotFoundError:
+            return [], 0, None, identity is not None
+        with f:
+            st = os.fstat(f.fileno())
+            current = (st.st_dev, st.st_ino)
+            reset = current != identity or st.st_size < offset
+            if reset:
+                offset = 0
+            f.seek(offset)
+            records = []
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break
+                offset += len(line)
+                try:
+                    records.append(json.loads(line))
+                except ValueError:
+                    continue
+        return records, offset, current, reset
+
+    def count(self):
+        return sum(1 for _ in self.iter_records())
@@ -0,0 +1,114 @@
+"""
+Сжатие ответов по Accept-Encoding (brotli или gzip).
+
+init_compression(app) вешает after_request: JSON и текстовые ответы больше
+COMPRESS_MIN_SIZE (1024 байт) сжимаются, если клиент это принимает.
+Brotli — если установлен пакет brotli, иначе только gzip. Уровни подобраны
+под сжатие на каждый запрос: gzip COMPRESS_LEVEL (6), brotli BROTLI_QUALITY (4).
+Потоковые ответы (выгрузка /admin/bookings) сжимаются по мере отдачи.
+
+Не сжимаются: ответы с Content-Encoding (готовые сжатые варианты, например
+меню — precompress()), файлы (static, картинки), 204/206/304, HEAD.
+Сильный ETag сжатого ответа получает суффикс кодировки ("…-br", "…-gzip"):
+разные байты — разные ETag; etag_matches() учитывает суффиксы.
+
+COMPRESS=0 — выключить (если сжимает прокси перед приложением).
+"""
+import gzip
+import os
+import zlib
+
+from flask import request
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+COMPRESSIBLE = ("application/json", "text/", "application/javascript", "image/svg+xml")
+ENCODINGS = ("br", "gzip") if brotli is not None else ("gzip",)
+
+
+def negotiate(accept_encodings):
+    """Лучшая из поддерживаемых кодировок для Accept-Encoding (q=0 — запрет) или None."""
+    best = accept_encodings.best_match(ENCODINGS)
+    return best if best and accept_encodings[best] > 0 else None
+
+
+def compress(data, encoding, level=None):
+    """Сжимает байты; level — уровень gzip или quality brotli (None — для ответа на лету)."""
+    if encoding == "br":
+        quality = int(os.getenv("BROTLI_QUALITY", "4")) if level is None else level
+        return brotli.compress(data, quality=quality)
+    level = int(os.getenv("COMPRESS_LEVEL", "6")) if level is None else level
+    return gzip.compress(data, compresslevel=level, mtime=0)
+
+
+def precompress(data):
+    """Все варианты максимального сжатия — для редко меняющихся ответов (меню)."""
+    return {encoding: compress(data, encoding, level=11 if encoding == "br" else 9)
+            for encoding in ENCODINGS}
+
+
+def etag_matches(if_none_match, etag):
+    """If-None-Match совпадает с etag или с его сжатым вариантом."""
+    return any(if_none_match.contains_weak(tag)
+               for tag in (etag,) + tuple("%s-%s" % (etag, encoding) for encoding in ENCODINGS))
+
+
+def set_encoding(response, encoding):
+    response.headers["Content-Encoding"] = encoding
+    response.vary.add("Accept-Encoding")
+    etag, weak = response.get_etag()
+    if etag and not weak:
+        response.set_etag("%s-%s" % (etag, encoding))
+
+
+def _stream(chunks, encoding):
+    if encoding == "br":
+        compressor = brotli.Compressor(quality=int(os.getenv("BROTLI_QUALITY", "4")))
+        for chunk in chunks:
+            data = compressor.process(chunk.encode("utf-8") if isinstance(chunk, str) else chunk)
+            data += compressor.flush()
+            if data:
+                yield data
+        yield compressor.finish()
+        return
+    compressor = zlib.compressobj(int(os.getenv("COMPRESS_LEVEL", "6")), zlib.DEFLATED, 31)
+    for chunk in chunks:
+        data = compressor.compress(chunk.encode("utf-8") if isinstance(chunk, str) else chunk)
+        data += compressor.flush(zlib.Z_SYNC_FLUSH)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def _compress_response(response):
+    if (request.method == "HEAD" or response.status_code in (204, 206, 304)
+            or response.status_code < 200 or response.direct_passthrough
+            or "Content-Encoding" in response.headers
+            or not (response.mimetype or "").startswith(COMPRESSIBLE)):
+        return response
+    # ответ зависит от Accept-Encoding, даже если в этот раз не сжат
+    response.vary.add("Accept-Encoding")
+    encoding = negotiate(request.accept_encodings)
+    if encoding is None:
+        return response
+
+    if response.is_streamed:
+        response.response = _stream(response.response, encoding)
+        response.headers.pop("Content-Length", None)
+        set_encoding(response, encoding)
+        return response
+
+    data = response.get_data()
+    if len(data) < int(os.getenv("COMPRESS_MIN_SIZE", "1024")):
+        return response
+    response.set_data(compress(data, encoding))
+    set_encoding(response, encoding)
+    return response
+
+
+def init_compression(app):
+    if os.getenv("COMPRESS", "1") != "0":
+        app.after_request(_compress_response)
@@ -0,0 +1,317 @@
+"""
+Пул соединений PostgreSQL.
+
+Раньше каждый обработчик открывал новое соединение (TCP + TLS + старт
+backend-процесса Postgres) и закрывал его после запроса. Теперь у каждого
+воркера gunicorn есть свой пул: соединения переиспользуются, а при
+исчерпании пула запрос ждёт освобождения соединения (с таймаутом).
+
+Использование:
+
+    with db_connection() as conn:
+        cur = conn.cursor()
+        cur.execute(...)
+
+При выходе из блока транзакция фиксируется, при исключении — откатывается,
+а соединение в любом случае возвращается в пул.
+"""
+import logging
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+import psycopg2
+import psycopg2.extensions
+
+from metrics import DB_QUERY_LATENCY, sql_operation
+
+log = logging.getLogger(__name__)
+
+
+def _env_int(name, default):
+    try:
+        return int(os.getenv(name, default))
+    except (TypeError, ValueError):
+        return default
+
+
+def _env_float(name, default):
+    try:
+        return float(os.getenv(name, default))
+    except (TypeError, ValueError):
+        return default
+
+
+def db_config():
+    """Параметры подключения из окружения (.env)."""
+    return {
+        "dbname": os.getenv("DB_NAME"),
+        "user": os.getenv("DB_USER"),
+        "password": os.getenv("DB_PASSWORD"),
+        "host": os.getenv("DB_HOST"),
+        "port": os.getenv("DB_PORT"),
+        "sslmode": os.getenv("DB_SSLMODE", "require"),
+    }
+
+
+# ------------------- Замер запросов -------------------
+class _TimedCursorMixin:
+    """Время каждого execute() попадает в db_query_duration_seconds (metrics.py)."""
+
+    def execute(self, query, vars=None):
+        started = time.perf_counter()
+        try:
+            return super().execute(query, vars)
+        finally:
+            DB_QUERY_LATENCY.observe(time.perf_counter() - started, sql_operation(query))
+
+    def executemany(self, query, vars_list):
+        started = time.perf_counter()
+        try:
+            return super().executemany(query, vars_list)
+        finally:
+            DB_QUERY_LATENCY.observe(time.perf_counter() - started, sql_operation(query))
+
+
+_timed_cursor_classes = {}
+
+
+def _timed_cursor_class(factory):
+    cls = _timed_cursor_classes.get(factory)
+    if cls is None:
+        cls = type("Timed" + factory.__name__, (_TimedCursorMixin, factory), {})
+        _timed_cursor_classes[factory] = cls
+    return cls
+
+
+class TimedConnection(psycopg2.extensions.connection):
+    """Соединение, курсоры которого (любого cursor_factory) замеряют запросы."""
+
+    def cursor(self, *args, **kwargs):
+        factory = kwargs.get("cursor_factory") or self.cursor_factory or psycopg2.extensions.cursor
+        kwargs["cursor_factory"] = _timed_cursor_class(factory)
+        return super().cursor(*args, **kwargs)
+
+
+class PoolTimeout(Exception):
+    """Не дождались свободного соединения за DB_POOL_TIMEOUT секунд."""
+
+
+class ConnectionPool:
+    """
+    Потокобезопасный пул соединений psycopg2 с ограничением размера.
+
+    - minconn соединений открываются заранее, не больше maxconn всего;
+    - при выдаче соединение проверяется: закрытые пересоздаются, а давно
+      простаивавшие (дольше check_idle секунд) пингуются через SELECT 1;
+    - счётчики (checkouts, waits, wait_time, reconnects) доступны через stats().
+    """
+
+    def __init__(self, minconn=1, maxconn=10, timeout=10.0, check_idle=30.0, **conn_kwargs):
+        if maxconn < 1 or minconn < 0 or minconn > maxconn:
+            raise ValueError("Некорректные размеры пула: min=%s max=%s" % (minconn, maxconn))
+        self.minconn = minconn
+        self.maxconn = maxconn
+        self.timeout = timeout
+        self.check_idle = check_idle
+        self._conn_kwargs = conn_kwargs
+        self._idle = deque()          # (conn, время возврата в пул)
+        self._size = 0                # открыто соединений (в пуле + выданных)
+        self._cond = threading.Condition()
+        self._closed = False
+
+        self.checkouts = 0
+        self.waits = 0
+        self.wait_time = 0.0
+        self.reconnects = 0
+        self.timeouts = 0
+
+        for _ in range(minconn):
+            try:
+                conn = self._connect()
+            except psycopg2.Error as e:
+                log.warning("db pool prefill error: %s", e)
+                break
+            self._size += 1
+            self._idle.append((conn, time.monotonic()))
+
+    def _connect(self):
+        return psycopg2.connect(**self._conn_kwargs)
+
+    def _is_alive(self, conn, idle_since):
+        if conn.closed:
+            return False
+        if time.monotonic() - idle_since < self.check_idle:
+            return True
+        try:
+            cur = conn.cursor()
+            cur.execute("SELECT 1")
+            cur.close()
+            conn.rollback()
+            return True
+        except psycopg2.Error:
+            return False
+
+    def getconn(self):
+        deadline = None
+        with self._cond:
+            while True:
+                if self._closed:
+                    raise psycopg2.InterfaceError("connection pool is closed")
+                if self._idle:
+                    conn, idle_since = self._idle.pop()
+                    break
+                if self._size < self.maxconn:
+                    self._size += 1
+                    conn, idle_since = None, None
+                    break
+                # пул исчерпан — ждём возврата соединения
+                if deadline is None:
+                    self.waits += 1
+                    started = time.monotonic()
+                    deadline = started + self.timeout
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self.timeouts += 1
+                    self.wait_time += time.monotonic() - started
+                    raise PoolTimeout("Нет свободных соединений с БД")
+                self._cond.wait(remaining)
+            if deadline is not None:
+                self.wait_time += time.monotonic() - started
+            self.checkouts += 1
+
+        # подключение и проверка — вне блокировки, чтобы не держать остальных
+        try:
+            if conn is None:
+                return self._connect()
+            if self._is_alive(conn, idle_since):
+                return conn
+            self._discard(conn)
+            conn = self._connect()
+            with self._cond:
+                self.reconnects += 1
+            return conn
+        except BaseException:
+            with self._cond:
+                self._size -= 1
+                self._cond.notify()
+            raise
+
+    def putconn(self, conn, broken=False):
+        if not broken and not conn.closed:
+            status = conn.info.transaction_status
+            if status != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+                try:
+                    conn.rollback()
+                except psycopg2.Error:
+                    broken = True
+        with self._cond:
+            if broken or conn.closed or self._closed:
+                self._size -= 1
+                self._discard(conn)
+            else:
+                self._idle.append((conn, time.monotonic()))
+            self._cond.notify()
+
+    @staticmethod
+    def _discard(conn):
+        try:
+            conn.close()
+        except psycopg2.Error:
+            pass
+
+    @contextmanager
+    def connection(self):
+        conn = self.getconn()
+        try:
+            yield conn
+            if not conn.closed:
+                conn.commit()
+        except BaseException:
+            broken = bool(conn.closed)
+            if not broken:
+                try:
+                    conn.rollback()
+                except psycopg2.Error:
+                    broken = True
+            self.putconn(conn, broken=broken)
+            raise
+        else:
+            self.putconn(conn)
+
+    def closeall(self):
+        with self._cond:
+            self._closed = True
+            while self._idle:
+                conn, _ = self._idle.pop()
+                self._size -= 1
+                self._discard(conn)
+            self._cond.notify_all()
+
+    def stats(self):
+        with self._cond:
+            return {
+                "min": self.minconn,
+                "max": self.maxconn,
+                "size": self._size,
+                "idle": len(self._idle),
+                "in_use": self._size - len(self._idle),
+                "checkouts": self.checkouts,
+                "waits": self.waits,
+                "wait_time": round(self.wait_time, 6),
+                "timeouts": self.timeouts,
+                "reconnects": self.reconnects,
+            }
+
+
+# ------------------- Пул текущего процесса -------------------
+_pool = None
+_pool_pid = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    """
+    Возвращает пул текущего процесса. Создаётся при первом обращении,
+    а после fork (воркеры gunicorn) — заново, чтобы процессы не делили сокеты.
+    """
+    global _pool, _pool_pid
+    pid = os.getpid()
+    if _pool is not None and _pool_pid == pid:
+        return _pool
+    with _pool_lock:
+        if _pool is None or _pool_pid != pid:
+            _pool = ConnectionPool(
+                minconn=_env_int("DB_POOL_MIN", 1),
+                maxconn=_env_int("DB_POOL_MAX", 10),
+                timeout=_env_float("DB_POOL_TIMEOUT", 10.0),
+                check_idle=_env_float("DB_POOL_CHECK_IDLE", 30.0),
+                connection_factory=TimedConnection,
+                **db_config()
+            )
+            _pool_pid = pid
+    return _pool
+
+
+def current_pool_stats():
+    """Счётчики пула, если он уже создан в этом процессе (для /metrics; пул не создаёт)."""
+    pool = _pool
+    if pool is None or _pool_pid != os.getpid():
+        return None
+    return pool.stats()
+
+
+def db_connection():
+    """Контекстный менеджер: соединение из пула текущего процесса."""
+    return get_pool().connection()
+
+
+def close_pool():
+    global _pool, _pool_pid
+    with _pool_lock:
+        if _pool is not None and _pool_pid == os.getpid():
+            _pool.closeall()
+        _pool = None
+        _pool_pid = None
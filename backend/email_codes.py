@@ -0,0 +1,133 @@
+"""
+Коды подтверждения email.
+
+Раньше email_codes только росла: каждая попытка регистрации добавляла строку,
+а /verify-email искал последнюю через ORDER BY id DESC. Теперь (миграция 007):
+
+- у email не больше одной строки (уникальный индекс), новый код заменяет старый (upsert);
+- у кода есть срок жизни expires_at (EMAIL_CODE_TTL_MINUTES, по умолчанию 15);
+- успешная проверка удаляет код, истёкший код удаляется при попытке проверки;
+- просроченные коды, которые никто не проверил, удаляет purge_expired():
+  фоновый поток в каждом воркере раз в EMAIL_CODE_PURGE_MINUTES (60), но
+  выполняет чистку только один воркер — под pg_try_advisory_xact_lock.
+  Вручную / из cron: python email_codes.py purge
+
+Проверка — один поиск по уникальному индексу email, её время не зависит от числа регистраций.
+"""
+import hmac
+import logging
+import os
+import secrets
+import sys
+import threading
+from datetime import timedelta
+
+from db import db_connection
+
+log = logging.getLogger(__name__)
+
+PURGE_LOCK_ID = 71_2025_002
+
+
+def code_ttl():
+    return timedelta(minutes=int(os.getenv("EMAIL_CODE_TTL_MINUTES", "15")))
+
+
+def new_code():
+    return "%06d" % (100000 + secrets.randbelow(900000))
+
+
+def store_code(cur, email):
+    """Создаёт или заменяет код для email. Возвращает код; коммит — на вызывающем."""
+    start_purger()
+    code = new_code()
+    cur.execute("""
+        INSERT INTO email_codes (email, code, created_at, expires_at)
+        VALUES (%s, %s, NOW(), NOW() + %s)
+        ON CONFLICT (email) DO UPDATE
+        SET code = EXCLUDED.code, created_at = EXCLUDED.created_at, expires_at = EXCLUDED.expires_at
+    """, (email, code, code_ttl()))
+    return code
+
+
+def consume_code(cur, email, code):
+    """
+    Проверяет код. Возвращает "ok" (код удалён), "not_found", "expired" (удалён)
+    или "mismatch". Коммит — на вызывающем.
+    """
+    cur.execute("""
+        SELECT code, expires_at <= NOW() FROM email_codes
+        WHERE email = %s
+        FOR UPDATE
+    """, (email,))
+    row = cur.fetchone()
+    if row is None:
+        return "not_found"
+    stored, expired = row
+    if expired:
+        cur.execute("DELETE FROM email_codes WHERE email = %s", (email,))
+        return "expired"
+    if not hmac.compare_digest(stored.encode(), str(code).encode()):
+        return "mismatch"
+    cur.execute("DELETE FROM email_codes WHERE email = %s", (email,))
+    return "ok"
+
+
+def purge_expired(conn):
+    """
+    Удаляет просроченные коды. Если чистку уже выполняет другой процесс,
+    возвращает None, иначе число удалённых строк.
+    """
+    cur = conn.cursor()
+    cur.execute("SELECT pg_try_advisory_xact_lock(%s)", (PURGE_LOCK_ID,))
+    if not cur.fetchone()[0]:
+        return None
+    cur.execute("DELETE FROM email_codes WHERE expires_at <= NOW()")
+    return cur.rowcount
+
+
+# ------------------- Периодическая чистка -------------------
+_purger = None
+_purger_pid = None
+_purger_lock = threading.Lock()
+
+
+def _purge_loop(interval, stop):
+    while not stop.wait(interval):
+        try:
+            with db_connection() as conn:
+                deleted = purge_expired(conn)
+            if deleted:
+                log.info("purged %s", deleted)
+        except Exception as e:
+            log.warning("purge failed: %s", e)
+
+
+def start_purger():
+    """Запускает фоновую чистку в текущем процессе (один раз; после fork — заново)."""
+    global _purger, _purger_pid
+    pid = os.getpid()
+    if _purger is not None and _purger_pid == pid:
+        return _purger
+    with _purger_lock:
+        if _purger is None or _purger_pid != pid:
+            interval = 60 * float(os.getenv("EMAIL_CODE_PURGE_MINUTES", "60"))
+            stop = threading.Event()
+            thread = threading.Thread(target=_purge_loop, args=(interval, stop),
+                                      name="email-codes-purge", daemon=True)
+            thread.stop = stop
+            thread.start()
+            _purger, _purger_pid = thread, pid
+    return _purger
+
+
+if __name__ == "__main__":
+    from dotenv import load_dotenv
+
+    load_dotenv()
+    if len(sys.argv) < 2 or sys.argv[1] != "purge":
+        print("usage: python email_codes.py purge")
+        sys.exit(2)
+    with db_connection() as conn:
+        deleted = purge_expired(conn)
+    print("purged:", "locked by another process" if deleted is None else deleted)
@@ -0,0 +1,39 @@
+"""
+Асинхронный режим: то же приложение на gevent.
+
+В синхронном gunicorn каждый запрос держит целый воркер, пока ждёт Postgres,
+SMTP или Google (обмен кода на токен, userinfo). Здесь ввод-вывод кооперативный:
+
+- gevent.monkey делает неблокирующими сокеты, ssl, select, time.sleep и
+  threading — а значит smtplib (mailer.py), requests/authlib (OAuth) и
+  фоновые потоки (почта, LISTEN, лог) становятся гринлетами;
+- psycogreen переключает psycopg2 в асинхронный режим с ожиданием через gevent,
+  поэтому запросы к БД тоже не блокируют процесс.
+
+Маршруты и ответы те же, что в app.py — это тот же объект Flask.
+Один процесс держит тысячи одновременных запросов (ограничение —
+--worker-connections и DB_POOL_MAX для тех, кому нужна БД):
+
+    gunicorn -k gevent --worker-connections 2000 -w 2 gevent_app:app
+
+Локально без gunicorn: python gevent_app.py
+"""
+from gevent import monkey
+
+monkey.patch_all()
+
+from psycogreen.gevent import patch_psycopg  # noqa: E402
+
+patch_psycopg()
+
+import os  # noqa: E402
+
+from app import app  # noqa: E402,F401
+
+
+if __name__ == "__main__":
+    from gevent.pywsgi import WSGIServer
+
+    port = int(os.getenv("PORT", "5000"))
+    print("Сервер (gevent) запущен: http://127.0.0.1:%d" % port)
+    WSGIServer(("0.0.0.0", port), app, log=None).serve_forever()
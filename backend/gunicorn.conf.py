@@ -0,0 +1,30 @@
+"""
+Настройки gunicorn: gunicorn -c gunicorn.conf.py app:app
+(gevent: gunicorn -c gunicorn.conf.py -k gevent gevent_app:app).
+
+- preload_app — приложение импортируется один раз в мастере, воркеры получают
+  его через fork готовым (код и страницы памяти общие). Импорт app.py ничего
+  не подключает (create_app), поэтому соединений и потоков, которые сломались
+  бы после fork, у мастера нет;
+- post_worker_init — warm_up() в каждом воркере до приёма запросов: пул БД,
+  LISTEN, меню (со сжатием), discovery/JWKS Google, почта. Первый запрос
+  к воркеру обслуживается так же быстро, как остальные.
+
+Переменные: PORT (5000), WEB_CONCURRENCY (2), GUNICORN_WORKER_CLASS (sync),
+GUNICORN_PRELOAD=0 — без предзагрузки, WARMUP=0 — без прогрева.
+ADMIN_TOKEN обязателен для /admin/*: без него эти маршруты отвечают 503.
+"""
+import os
+
+bind = "0.0.0.0:%s" % os.getenv("PORT", "5000")
+workers = int(os.getenv("WEB_CONCURRENCY", "2"))
+worker_class = os.getenv("GUNICORN_WORKER_CLASS", "sync")
+preload_app = os.getenv("GUNICORN_PRELOAD", "1") != "0"
+
+
+def post_worker_init(worker):
+    # после fork и после monkey.patch_all() gevent-воркера: ресурсы принадлежат воркеру
+    if os.getenv("WARMUP", "1") == "0":
+        return
+    from app import warm_up
+    warm_up(worker.wsgi)
@@ -0,0 +1,242 @@
+"""
+Хэширование паролей в отдельном пуле процессов.
+
+generate_password_hash / check_password_hash — намеренно медленные KDF
+(scrypt по умолчанию, ~0.1–0.2 с). Выполняясь в потоке запроса, пачка входов
+занимала все воркеры gunicorn, и /menu ждал в очереди за ними. Теперь:
+
+- KDF считается в ProcessPoolExecutor (HASH_WORKERS процессов);
+- одновременно принимается не больше HASH_MAX_PENDING операций — остальные
+  сразу получают HashPoolBusy (в app.py это 503 с Retry-After), а не копятся;
+- метод и стоимость — PASSWORD_HASH_METHOD (например "scrypt:65536:8:1" или
+  "pbkdf2:sha256:1000000"); если при входе оказалось, что пароль захэширован
+  другим методом, новый хэш считается в фоне и записывается в users (needs_rehash);
+- если процесс пула умер (например, OOM), пул пересоздаётся, а запрос
+  получает HashPoolBusy, как при переполнении;
+- метрики: password_hash_operations_total, password_hash_queue_seconds,
+  password_hash_duration_seconds, password_hash_in_flight.
+
+Разгружает воркеры это только в gthread/gevent: пока KDF считается в пуле,
+поток или гринлет воркера обслуживает другие запросы. В sync-воркере gunicorn
+запрос по-прежнему ждёт в future.result(), и воркер занят так же, как раньше;
+остаются только ограничение очереди и быстрый 503.
+"""
+import logging
+import multiprocessing
+import os
+import queue
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeout
+from concurrent.futures.process import BrokenProcessPool
+
+from werkzeug.security import DEFAULT_PBKDF2_ITERATIONS, check_password_hash, generate_password_hash
+
+from metrics import REGISTRY, Counter, Histogram
+
+log = logging.getLogger(__name__)
+
+HASH_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+HASH_OPERATIONS = REGISTRY.register(Counter(
+    "password_hash_operations_total", "Операции хэширования паролей по результату",
+    ("operation", "result")))
+HASH_QUEUE_TIME = REGISTRY.register(Histogram(
+    "password_hash_queue_seconds", "Ожидание свободного процесса пула хэширования",
+    ("operation",), buckets=HASH_BUCKETS))
+HASH_DURATION = REGISTRY.register(Histogram(
+    "password_hash_duration_seconds", "Время KDF в процессе пула", ("operation",), buckets=HASH_BUCKETS))
+
+
+class HashPoolBusy(Exception):
+    """Пул хэширования переполнен или не ответил вовремя."""
+
+
+def normalize_method(method):
+    """Полная строка метода, как её записывает werkzeug: "scrypt" -> "scrypt:32768:8:1"."""
+    name, *args = method.split(":")
+    if name == "scrypt":
+        n = int(args[0]) if len(args) > 0 else 2 ** 15
+        r = int(args[1]) if len(args) > 1 else 8
+        p = int(args[2]) if len(args) > 2 else 1
+        return "scrypt:%d:%d:%d" % (n, r, p)
+    if name == "pbkdf2":
+        hash_name = args[0] if len(args) > 0 else "sha256"
+        iterations = int(args[1]) if len(args) > 1 else DEFAULT_PBKDF2_ITERATIONS
+        return "pbkdf2:%s:%d" % (hash_name, iterations)
+    raise ValueError("Неизвестный метод хэширования: %s" % method)
+
+
+# ------------------- Функции для процессов пула -------------------
+def _timed_generate(password, method, submitted):
+    started = time.time()
+    result = generate_password_hash(password, method=method)
+    return result, started - submitted, time.time() - started
+
+
+def _timed_check(pwhash, password, submitted):
+    started = time.time()
+    result = check_password_hash(pwhash, password)
+    return result, started - submitted, time.time() - started
+
+
+class PasswordHasher:
+    def __init__(self, method=None, workers=None, max_pending=None, timeout=None):
+        self.method = normalize_method(method or os.getenv("PASSWORD_HASH_METHOD", "scrypt"))
+        self.workers = workers or int(os.getenv("HASH_WORKERS", str(min(4, os.cpu_count() or 1))))
+        self.max_pending = max_pending or int(os.getenv("HASH_MAX_PENDING", str(self.workers * 4)))
+        self.timeout = timeout or float(os.getenv("HASH_TIMEOUT", "10"))
+        self._slots = threading.BoundedSemaphore(self.max_pending)
+        self.in_flight = 0
+        self._lock = threading.Lock()
+        self.restarts = 0
+        self._executor = self._new_executor()
+        # запись перехэшированных паролей — в своём потоке, а не в служебном потоке пула
+        self._rehash_queue = queue.Queue(maxsize=self.max_pending)
+        self._rehash_thread = None
+
+    def _new_executor(self):
+        # forkserver: дочерние процессы не наследуют потоки воркера (почта, LISTEN, лог)
+        methods = multiprocessing.get_all_start_methods()
+        context = multiprocessing.get_context("forkserver" if "forkserver" in methods else "spawn")
+        return ProcessPoolExecutor(max_workers=self.workers, mp_context=context)
+
+    def _restart(self, broken, operation):
+        """Пул сломан (процесс убит): создаём новый, если этого ещё не сделал другой поток."""
+        HASH_OPERATIONS.inc(operation, "broken")
+        with self._lock:
+            if self._executor is not broken:
+                return
+            self._executor = self._new_executor()
+            self.restarts += 1
+        log.warning("process pool broken, restarted (%d)", self.restarts)
+        broken.shutdown(wait=False, cancel_futures=True)
+
+    def _submit(self, operation, fn, *args):
+        if not self._slots.acquire(blocking=False):
+            HASH_OPERATIONS.inc(operation, "rejected")
+            raise HashPoolBusy("Пул хэширования паролей занят")
+        with self._lock:
+            self.in_flight += 1
+        executor = self._executor
+        try:
+            future = executor.submit(fn, *args, time.time())
+        except BrokenProcessPool:
+            self._release()
+            self._restart(executor, operation)
+            raise HashPoolBusy("Пул хэширования паролей перезапускается")
+        except BaseException:
+            self._release()
+            raise
+        future.executor = executor
+        future.add_done_callback(lambda f: self._done(operation, f))
+        return future
+
+    def _release(self):
+        with self._lock:
+            self.in_flight -= 1
+        self._slots.release()
+
+    def _done(self, operation, future):
+        # слот освобождается, только когда процесс пула действительно закончил,
+        # даже если запрос уже ушёл с таймаутом
+        self._release()
+        if future.cancelled() or future.exception() is not None:
+            HASH_OPERATIONS.inc(operation, "error")
+            return
+        _, queued, duration = future.result()
+        HASH_QUEUE_TIME.observe(max(queued, 0.0), operation)
+        HASH_DURATION.observe(duration, operation)
+        HASH_OPERATIONS.inc(operation, "ok")
+
+    def _wait(self, operation, future):
+        try:
+            return future.result(timeout=self.timeout)[0]
+        except FutureTimeout:
+            HASH_OPERATIONS.inc(operation, "timeout")
+            raise HashPoolBusy("Хэширование пароля не уложилось в %s с" % self.timeout)
+        except BrokenProcessPool:
+            self._restart(future.executor, operation)
+            raise HashPoolBusy("Пул хэширования паролей перезапускается")
+
+    def hash(self, password):
+        return self._wait("hash", self._submit("hash", _timed_generate, password, self.method))
+
+    def check(self, pwhash, password):
+        if not pwhash or not password:
+            return False
+        return self._wait("check", self._submit("check", _timed_check, pwhash, password))
+
+    def needs_rehash(self, pwhash):
+        return bool(pwhash) and pwhash.split("$", 1)[0] != self.method
+
+    def rehash_async(self, password, on_done):
+        """
+        Новый хэш в фоне (после успешного входа со старым методом); on_done(new_hash)
+        вызывается из потока password-rehash, а не из служебного потока пула: запись
+        в БД там задержала бы результаты всех остальных операций. Если пул или
+        очередь записи заняты — просто пропускаем, перехэшируем при следующем входе.
+        """
+        try:
+            future = self._submit("rehash", _timed_generate, password, self.method)
+        except HashPoolBusy:
+            return None
+
+        def callback(f):
+            if not f.cancelled() and f.exception() is None:
+                try:
+                    self._rehash_queue.put_nowait((on_done, f.result()[0]))
+                except queue.Full:
+                    return
+                self._start_rehash_thread()
+        future.add_done_callback(callback)
+        return future
+
+    def _start_rehash_thread(self):
+        with self._lock:
+            if self._rehash_thread is None:
+                self._rehash_thread = threading.Thread(target=self._run_rehash, name="password-rehash",
+                                                       daemon=True)
+                self._rehash_thread.start()
+
+    def _run_rehash(self):
+        while True:
+            on_done, new_hash = self._rehash_queue.get()
+            try:
+                on_done(new_hash)
+            except Exception as e:
+                log.warning("rehash failed: %s", e)
+
+    def stats(self):
+        return {"workers": self.workers, "max_pending": self.max_pending, "in_flight": self.in_flight,
+                "restarts": self.restarts}
+
+    def shutdown(self):
+        self._executor.shutdown(wait=True)
+
+
+# ------------------- Пул текущего процесса -------------------
+_hasher = None
+_hasher_pid = None
+_hasher_lock = threading.Lock()
+
+
+def get_hasher():
+    """Пул процесса; создаётся при первом обращении (после fork воркера gunicorn)."""
+    global _hasher, _hasher_pid
+    pid = os.getpid()
+    if _hasher is not None and _hasher_pid == pid:
+        return _hasher
+    with _hasher_lock:
+        if _hasher is None or _hasher_pid != pid:
+            _hasher = PasswordHasher()
+            _hasher_pid = pid
+    return _hasher
+
+
+def current_hasher_stats():
+    hasher = _hasher
+    if hasher is None or _hasher_pid != os.getpid():
+        return None
+    return hasher.stats()
@@ -0,0 +1,272 @@
+"""
+Оптимизированные варианты картинок блюд.
+
+Из static/images/*.png делаются уменьшенные копии в WebP (и AVIF, если
+Pillow его поддерживает) нескольких ширин. Имя файла содержит хэш
+содержимого исходника и параметров, поэтому URL меняется вместе с картинкой,
+и её можно кэшировать навсегда:
+
+    /img/ramen-320w.3f9a1c2b7e.webp   Cache-Control: public, max-age=31536000, immutable
+
+Варианты собираются только при деплое: `python images.py build`. Воркеры
+их не строят и манифест не пишут — только читают variants/manifest.json.
+Если у картинки вариантов нет (или исходник изменился после сборки), блюдо
+отдаётся без srcset. Манифест меняется только сборкой, поэтому и ETag меню
+меняется только на деплое (кэш меню зависит от манифеста, см. MenuCache depends).
+Две сборки одновременно не перетрут записи друг друга: манифест
+перечитывается и дописывается под flock.
+"""
+import hashlib
+import json
+import logging
+import os
+import re
+import sys
+import tempfile
+import threading
+from contextlib import contextmanager
+
+from flask import Blueprint, abort, send_from_directory
+from PIL import Image, features
+
+try:
+    import fcntl
+except ImportError:  # Windows: без блокировки между процессами
+    fcntl = None
+
+log = logging.getLogger(__name__)
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+SOURCE_DIR = os.path.join(BASE_DIR, "static", "images")
+VARIANT_DIR = os.path.join(SOURCE_DIR, "variants")
+VARIANT_URL = "/img/"
+
+WIDTHS = (160, 320, 640, 1024)
+QUALITY = {"webp": 80, "avif": 60}
+ONE_YEAR = 365 * 24 * 3600
+# меняется вместе с правилами сборки — старые варианты пересобираются
+BUILD_VERSION = 2
+
+# Порядок важен: фронтенд перечисляет <source> от лучшего формата к худшему
+FORMATS = [fmt for fmt in ("avif", "webp") if features.check(fmt)]
+# имя варианта из _build(): <stem>-<ширина>w.<10 hex>.<формат>
+VARIANT_RE = re.compile(r"^.+-\d+w\.(?P<etag>[0-9a-f]{10})\.(?P<format>[a-z]+)$")
+
+
+def _atomic_write(path, write):
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            write(f)
+        os.replace(tmp, path)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.unlink(tmp)
+        raise
+
+
+class ImagePipeline:
+    def __init__(self, source_dir=SOURCE_DIR, variant_dir=VARIANT_DIR,
+                 widths=WIDTHS, formats=None):
+        self.source_dir = source_dir
+        self.variant_dir = variant_dir
+        self.widths = widths
+        self.formats = FORMATS if formats is None else formats
+        self.manifest_path = os.path.join(variant_dir, "manifest.json")
+        self._manifest = None
+        self._manifest_key = None
+        self._lock = threading.Lock()
+
+    # ------------------- Манифест -------------------
+    def _stat_manifest(self):
+        try:
+            st = os.stat(self.manifest_path)
+            return (st.st_mtime_ns, st.st_size)
+        except FileNotFoundError:
+            return None
+
+    def _load_manifest(self):
+        # манифест могли обновить другой воркер или `python images.py build`
+        key = self._stat_manifest()
+        if self._manifest is None or key != self._manifest_key:
+            try:
+                with open(self.manifest_path, "r", encoding="utf-8") as f:
+                    self._manifest = json.load(f)
+            except (FileNotFoundError, ValueError):
+                self._manifest = {}
+            self._manifest_key = key
+        return self._manifest
+
+    @contextmanager
+    def _manifest_locked(self):
+        """Блокировка манифеста между процессами (параллельные сборки)."""
+        with self._lock:
+            if fcntl is None:
+                yield
+                return
+            os.makedirs(self.variant_dir, exist_ok=True)
+            fd = os.open(self.manifest_path + ".lock", os.O_RDWR | os.O_CREAT, 0o644)
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX)
+                yield
+            finally:
+                os.close(fd)
+
+    def _save_manifest(self):
+        data = json.dumps(self._manifest, ensure_ascii=False, indent=2, sort_keys=True).encode("utf-8")
+        _atomic_write(self.manifest_path, lambda f: f.write(data))
+        self._manifest_key = self._stat_manifest()
+
+    def _fresh(self, entry, st):
+        return (entry and entry["mtime_ns"] == st.st_mtime_ns and entry["size"] == st.st_size
+                and entry.get("formats") == self.formats and entry.get("version") == BUILD_VERSION
+                and all(os.path.exists(os.path.join(self.variant_dir, v["file"])) for v in entry["variants"]))
+
+    # ------------------- Генерация -------------------
+    def ensure(self, name):
+        """
+        Возвращает запись манифеста для исходника name (например "ramen.png"),
+        при необходимости создавая варианты. None — исходника нет.
+        Манифест перечитывается под блокировкой, поэтому записи, добавленные
+        другой сборкой, не теряются.
+        """
+        source = os.path.join(self.source_dir, name)
+        try:
+            st = os.stat(source)
+        except (FileNotFoundError, NotADirectoryError):
+            return None
+        with self._manifest_locked():
+            self._manifest = None
+            manifest = self._load_manifest()
+            entry = manifest.get(name)
+            if self._fresh(entry, st):
+                return entry
+            entry = self._build(name, source, st)
+            manifest[name] = entry
+            self._save_manifest()
+            return entry
+
+    def _build(self, name, source, st):
+        os.makedirs(self.variant_dir, exist_ok=True)
+        with open(source, "rb") as f:
+            digest = hashlib.sha256(f.read()).hexdigest()
+        stem = os.path.splitext(name)[0]
+
+        with Image.open(source) as img:
+            img.load()
+            # LA, PA и палитра/RGB с прозрачным цветом (tRNS) — с альфа-каналом
+            alpha = img.mode in ("RGBA", "LA", "PA") or "transparency" in img.info
+            if img.mode != ("RGBA" if alpha else "RGB"):
+                img = img.convert("RGBA" if alpha else "RGB")
+            src_w, src_h = img.size
+            widths = [w for w in self.widths if w < src_w] + [min(src_w, max(self.widths))]
+            widths = sorted(set(widths))
+
+            variants = []
+            for fmt in self.formats:
+                for width in widths:
+                    params = "%s:%s:%d:%d:%d" % (digest, fmt, width, QUALITY[fmt], BUILD_VERSION)
+                    tag = hashlib.sha256(params.encode()).hexdigest()[:10]
+                    filename = "%s-%dw.%s.%s" % (stem, width, tag, fmt)
+                    path = os.path.join(self.variant_dir, filename)
+                    if not os.path.exists(path):
+                        height = round(src_h * width / src_w)
+                        resized = img.resize((width, height), Image.LANCZOS) if width != src_w else img
+                        _atomic_write(path, lambda f: resized.save(f, fmt.upper(), quality=QUALITY[fmt]))
+                    variants.append({"format": fmt, "width": width, "file": filename, "etag": tag})
+
+        return {
+            "mtime_ns": st.st_mtime_ns,
+            "size": st.st_size,
+            "sha256": digest,
+            "width": src_w,
+            "height": src_h,
+            "formats": self.formats,
+            "version": BUILD_VERSION,
+            "variants": variants,
+        }
+
+    def lookup(self, name):
+        """Запись манифеста, только если варианты уже собраны и актуальны; сам ничего не строит."""
+        try:
+            st = os.stat(os.path.join(self.source_dir, name))
+        except (FileNotFoundError, NotADirectoryError):
+            return None
+        with self._lock:
+            entry = self._load_manifest().get(name)
+        if self._fresh(entry, st):
+            return entry
+        log.info("no variants for %s, run: python images.py build", name)
+        return None
+
+    def build_all(self):
+        built = {}
+        for name in sorted(os.listdir(self.source_dir)):
+            if name.lower().endswith((".png", ".jpg", ".jpeg")):
+                built[name] = self.ensure(name)
+        return built
+
+    # ------------------- Для API меню -------------------
+    def srcset(self, img_path, base_url=""):
+        """
+        img_path — путь из menu.json ("/static/images/ramen.png").
+        Возвращает {"avif": "url 160w, url 320w", "webp": "..."} или None,
+        если варианты не собраны.
+        """
+        prefix = "/static/images/"
+        if not img_path or not img_path.startswith(prefix):
+            return None
+        entry = self.lookup(img_path[len(prefix):])
+        if not entry:
+            return None
+        result = {}
+        for v in entry["variants"]:
+            url = "%s%s%s %dw" % (base_url, VARIANT_URL, v["file"], v["width"])
+            result.setdefault(v["format"], []).append(url)
+        return {fmt: ", ".join(urls) for fmt, urls in result.items()}
+
+    def etag_for(self, filename):
+        """
+        ETag варианта — хэш из имени файла, ничего не читаем с диска.
+        None, если имя не похоже на вариант (манифест, его .lock, временные файлы).
+        """
+        match = VARIANT_RE.match(filename)
+        if not match or match.group("format") not in self.formats:
+            return None
+        return match.group("etag")
+
+
+pipeline = ImagePipeline()
+
+
+def add_srcsets(menu_data, base_url=""):
+    """Добавляет блюдам поле "srcset" (оба формата menu.json: плоский и по категориям)."""
+    for entry in menu_data:
+        for dish in entry.get("items", [entry]):
+            srcset = pipeline.srcset(dish.get("img"), base_url)
+            if srcset:
+                dish["srcset"] = srcset
+    return menu_data
+
+
+# ------------------- Раздача вариантов -------------------
+images_api = Blueprint("images_api", __name__)
+
+
+@images_api.route(VARIANT_URL + "<path:filename>")
+def serve_variant(filename):
+    etag = pipeline.etag_for(filename)
+    if not etag:
+        abort(404)
+    response = send_from_directory(pipeline.variant_dir, filename, etag=etag, max_age=ONE_YEAR)
+    response.cache_control.public = True
+    response.cache_control.immutable = True
+    return response
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2 or sys.argv[1] != "build":
+        print("usage: python images.py build")
+        sys.exit(2)
+    for name, entry in pipeline.build_all().items():
+        print("%-24s %s" % (name, ", ".join(v["file"] for v in entry["variants"])))
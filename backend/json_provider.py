@@ -0,0 +1,79 @@
+"""
+JSON-провайдер Flask на orjson.
+
+jsonify и app.json.dumps по умолчанию идут через stdlib json — для больших
+ответов (/admin/bookings, брони пользователя) это заметная доля времени запроса.
+OrjsonProvider — замена DefaultJSONProvider с тем же результатом для клиента:
+
+- date/datetime — как у Flask (HTTP-дата), Decimal и UUID — строкой,
+  dataclass — словарём: те же правила, что в flask.json.provider;
+- массивы Postgres (psycopg2 отдаёт их списками) и строки RealDictCursor
+  (подкласс dict) orjson сериализует сам;
+- ключи сортируются (sort_keys), нестроковые ключи приводятся к строке;
+- кириллица не экранируется (\\uXXXX) — это тот же JSON, но короче.
+
+Выбор — JSON_PROVIDER=orjson|stdlib; без установленного orjson — stdlib.
+"""
+import logging
+import os
+from datetime import date, datetime, timezone
+
+from flask.json.provider import DefaultJSONProvider, _default
+
+log = logging.getLogger(__name__)
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+_DAYS = ("Mon", "Tue", "Wed", "Thu", "Fri", "Sat", "Sun")
+_MONTHS = ("", "Jan", "Feb", "Mar", "Apr", "May", "Jun", "Jul", "Aug", "Sep", "Oct", "Nov", "Dec")
+
+
+def _orjson_default(o):
+    # orjson сам пишет даты в ISO 8601, а Flask — HTTP-датой (werkzeug.http.http_date);
+    # формат оставляем как был, но без email.utils — в выгрузке броней дат тысячи
+    if isinstance(o, date):
+        if isinstance(o, datetime):
+            if o.tzinfo is not None:
+                o = o.astimezone(timezone.utc)
+            clock = "%02d:%02d:%02d" % (o.hour, o.minute, o.second)
+        else:
+            clock = "00:00:00"
+        return "%s, %02d %s %04d %s GMT" % (_DAYS[o.weekday()], o.day, _MONTHS[o.month], o.year, clock)
+    return _default(o)
+
+
+class OrjsonProvider(DefaultJSONProvider):
+    def _options(self, indent=False):
+        options = orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_PASSTHROUGH_DATACLASS
+        if self.sort_keys:
+            options |= orjson.OPT_SORT_KEYS
+        if indent:
+            options |= orjson.OPT_INDENT_2
+        return options
+
+    def dumps_bytes(self, obj, indent=False):
+        return orjson.dumps(obj, default=_orjson_default, option=self._options(indent))
+
+    def dumps(self, obj, **kwargs):
+        return self.dumps_bytes(obj, indent=bool(kwargs.get("indent"))).decode("utf-8")
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        indent = (self.compact is None and self._app.debug) or self.compact is False
+        return self._app.response_class(self.dumps_bytes(obj, indent) + b"\n", mimetype=self.mimetype)
+
+
+def make_json_provider(app, name=None):
+    name = name or os.getenv("JSON_PROVIDER", "orjson")
+    if name == "orjson" and orjson is not None:
+        return OrjsonProvider(app)
+    if name == "orjson":
+        log.warning("orjson не установлен, используется stdlib json")
+    return DefaultJSONProvider(app)
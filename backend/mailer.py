@@ -0,0 +1,330 @@
+"""
+Фоновая отправка писем.
+
+Раньше код подтверждения отправлялся прямо в обработчике /register:
+подключение к smtp.gmail.com, STARTTLS и login занимали воркер на секунды.
+Теперь письмо ставится в ограниченную очередь, а несколько потоков-отправителей
+держат уже авторизованные SMTP-сессии и переиспользуют их.
+
+- submit() сразу возвращает задание (id для опроса статуса) или бросает
+  MailQueueFull, если очередь переполнена;
+- статус задания (queued -> sending -> sent | failed) пишется в таблицу
+  email_jobs (миграция 012), поэтому status() находит задание из любого
+  воркера, а не только из того, чья очередь его отправляет. Записи старше
+  MAIL_JOB_KEEP_HOURS (24) удаляют сами потоки-отправители в простое;
+- неудачная отправка повторяется с экспоненциальной задержкой;
+- stats() — глубина очереди, отправлено/ошибок/повторов, время отправки.
+
+Настройки: SMTP_HOST, SMTP_PORT, SMTP_STARTTLS, MAIL_WORKERS, MAIL_QUEUE_SIZE,
+MAIL_MAX_ATTEMPTS, MAIL_JOB_KEEP_HOURS, EMAIL_SENDER, EMAIL_PASSWORD.
+"""
+import logging
+import os
+import queue
+import smtplib
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+from db import db_connection
+from metrics import EMAIL_CONNECT_LATENCY, EMAIL_SEND_LATENCY
+
+log = logging.getLogger(__name__)
+
+# Ошибки, после которых повтор бессмысленен (адрес отклонён и т.п.)
+PERMANENT_ERRORS = (smtplib.SMTPRecipientsRefused, smtplib.SMTPSenderRefused)
+
+
+class MailQueueFull(Exception):
+    """Очередь писем переполнена."""
+
+
+class EmailJob:
+    def __init__(self, message):
+        self.id = uuid.uuid4().hex
+        self.message = message
+        self.status = "queued"   # queued -> sending -> sent | failed
+        self.attempts = 0
+        self.error = None
+        self.created_at = time.time()
+        self.finished_at = None
+
+    def to_dict(self):
+        return {
+            "id": self.id,
+            "status": self.status,
+            "attempts": self.attempts,
+            "error": self.error,
+        }
+
+
+class PgJobStore:
+    """
+    Статусы заданий в email_jobs — общие для всех воркеров.
+    Ошибка БД не мешает отправке: письмо уйдёт, статус просто не обновится.
+    """
+
+    def __init__(self, keep_hours=24, purge_interval=3600.0):
+        self.keep_hours = keep_hours
+        self.purge_interval = purge_interval
+        self._purged_at = None
+
+    def save(self, job):
+        try:
+            with db_connection() as conn:
+                conn.cursor().execute("""
+                    INSERT INTO email_jobs (id, status, attempts, error)
+                    VALUES (%s, %s, %s, %s)
+                    ON CONFLICT (id) DO UPDATE
+                    SET status = EXCLUDED.status, attempts = EXCLUDED.attempts,
+                        error = EXCLUDED.error, updated_at = NOW()
+                """, (job.id, job.status, job.attempts, job.error))
+        except Exception as e:
+            log.warning("job %s: status not saved: %s", job.id, e)
+
+    def load(self, job_id):
+        with db_connection() as conn:
+            cur = conn.cursor()
+            cur.execute("SELECT id, status, attempts, error FROM email_jobs WHERE id = %s", (job_id,))
+            row = cur.fetchone()
+        return dict(zip(("id", "status", "attempts", "error"), row)) if row else None
+
+    def purge(self):
+        """Удаляет старые задания; не чаще раза в purge_interval на процесс."""
+        if self._purged_at is not None and time.monotonic() - self._purged_at < self.purge_interval:
+            return
+        self._purged_at = time.monotonic()
+        try:
+            with db_connection() as conn:
+                conn.cursor().execute("DELETE FROM email_jobs WHERE created_at < NOW() - %s::interval",
+                                      ("%d hours" % self.keep_hours,))
+        except Exception as e:
+            log.warning("purge failed: %s", e)
+
+
+class Mailer:
+    def __init__(self, host, port, sender, password=None, starttls=True, workers=2,
+                 queue_size=1000, max_attempts=4, backoff=1.0, idle_timeout=60.0,
+                 timeout=30.0, keep_jobs=10000, store=None):
+        self.host = host
+        self.port = port
+        self.sender = sender
+        self.password = password
+        self.starttls = starttls
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self.idle_timeout = idle_timeout
+        self.timeout = timeout
+        self.keep_jobs = keep_jobs
+        # без store статусы видны только в этом процессе (бенчмарки, тесты)
+        self.store = store
+
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._jobs = OrderedDict()
+        self._jobs_lock = threading.Lock()
+        self._stopping = threading.Event()
+        self._stats_lock = threading.Lock()
+
+        self.sent = 0
+        self.failed = 0
+        self.retries = 0
+        self.connects = 0
+        self.send_time = 0.0      # суммарное время успешных отправок
+        self.last_send_time = None
+
+        self._threads = []
+        for i in range(workers):
+            t = threading.Thread(target=self._run, name="mailer-%d" % i, daemon=True)
+            t.start()
+            self._threads.append(t)
+
+    # ------------------- API -------------------
+    def submit(self, message):
+        job = EmailJob(message)
+        with self._jobs_lock:
+            self._jobs[job.id] = job
+            while len(self._jobs) > self.keep_jobs:
+                self._jobs.popitem(last=False)
+        # до постановки в очередь: иначе "queued" мог бы перезаписать "sending"
+        self._save(job)
+        try:
+            self._queue.put_nowait(job)
+        except queue.Full:
+            with self._jobs_lock:
+                self._jobs.pop(job.id, None)
+            job.status, job.error = "failed", "queue full"
+            self._save(job)
+            raise MailQueueFull("Очередь писем переполнена")
+        return job
+
+    def status(self, job_id):
+        """Статус задания этого процесса или, если есть store, любого воркера."""
+        with self._jobs_lock:
+            job = self._jobs.get(job_id)
+        if job:
+            return job.to_dict()
+        return self.store.load(job_id) if self.store else None
+
+    def _save(self, job):
+        if self.store:
+            self.store.save(job)
+
+    def stats(self):
+        return {
+            "queue_depth": self._queue.qsize(),
+            "workers": len(self._threads),
+            "sent": self.sent,
+            "failed": self.failed,
+            "retries": self.retries,
+            "connects": self.connects,
+            "avg_send_time": round(self.send_time / self.sent, 6) if self.sent else None,
+            "last_send_time": self.last_send_time,
+        }
+
+    def join(self, timeout=None):
+        """Ждёт, пока очередь опустеет (для тестов и бенчмарков)."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while self._queue.unfinished_tasks:
+            if deadline is not None and time.monotonic() > deadline:
+                return False
+            time.sleep(0.01)
+        return True
+
+    def stop(self):
+        self._stopping.set()
+        for t in self._threads:
+            t.join(timeout=self.timeout)
+
+    # ------------------- Потоки-отправители -------------------
+    def _connect(self):
+        started = time.perf_counter()
+        server = smtplib.SMTP(self.host, self.port, timeout=self.timeout)
+        try:
+            if self.starttls:
+                server.starttls()
+            if self.password:
+                server.login(self.sender, self.password)
+        except BaseException:
+            server.close()
+            raise
+        EMAIL_CONNECT_LATENCY.observe(time.perf_counter() - started)
+        with self._stats_lock:
+            self.connects += 1
+        return server
+
+    @staticmethod
+    def _close(server):
+        if server is None:
+            return
+        try:
+            server.quit()
+        except (smtplib.SMTPException, OSError):
+            server.close()
+
+    def _run(self):
+        server = None
+        last_used = 0.0
+        while not self._stopping.is_set():
+            try:
+                job = self._queue.get(timeout=1.0)
+            except queue.Empty:
+                # сервер сам закроет простаивающую сессию — закроем раньше
+                if server is not None and time.monotonic() - last_used > self.idle_timeout:
+                    self._close(server)
+                    server = None
+                if self.store:
+                    self.store.purge()
+                continue
+            try:
+                server = self._deliver(job, server)
+            finally:
+                last_used = time.monotonic()
+                self._queue.task_done()
+        self._close(server)
+
+    def _deliver(self, job, server):
+        job.status = "sending"
+        self._save(job)
+        while True:
+            job.attempts += 1
+            started = time.perf_counter()
+            try:
+                if server is None:
+                    server = self._connect()
+                sending = time.perf_counter()
+                server.send_message(job.message)
+            except PERMANENT_ERRORS as e:
+                EMAIL_SEND_LATENCY.observe(time.perf_counter() - sending, "rejected")
+                return self._finish(job, server, error=e)
+            except (smtplib.SMTPException, OSError) as e:
+                if server is not None:
+                    EMAIL_SEND_LATENCY.observe(time.perf_counter() - sending, "error")
+                # сессия могла протухнуть — переподключаемся при следующей попытке
+                self._close(server)
+                server = None
+                if job.attempts >= self.max_attempts:
+                    return self._finish(job, server, error=e)
+                with self._stats_lock:
+                    self.retries += 1
+                if self._stopping.wait(self.backoff * 2 ** (job.attempts - 1)):
+                    return self._finish(job, server, error=e)
+                continue
+            elapsed = time.perf_counter() - started
+            EMAIL_SEND_LATENCY.observe(time.perf_counter() - sending, "sent")
+            with self._stats_lock:
+                self.sent += 1
+                self.send_time += elapsed
+                self.last_send_time = round(elapsed, 6)
+            return self._finish(job, server)
+
+    def _finish(self, job, server, error=None):
+        job.finished_at = time.time()
+        job.message = None
+        if error is None:
+            job.status = "sent"
+        else:
+            job.status = "failed"
+            job.error = str(error)
+            with self._stats_lock:
+                self.failed += 1
+            log.warning("send failed: %s", error)
+        self._save(job)
+        return server
+
+
+# ------------------- Очередь текущего процесса -------------------
+_mailer = None
+_mailer_pid = None
+_mailer_lock = threading.Lock()
+
+
+def current_mailer_stats():
+    """Счётчики очереди, если она уже запущена в этом процессе (для /metrics)."""
+    mailer = _mailer
+    if mailer is None or _mailer_pid != os.getpid():
+        return None
+    return mailer.stats()
+
+
+def get_mailer():
+    """Очередь писем процесса; потоки не переживают fork, поэтому создаём после него."""
+    global _mailer, _mailer_pid
+    pid = os.getpid()
+    if _mailer is not None and _mailer_pid == pid:
+        return _mailer
+    with _mailer_lock:
+        if _mailer is None or _mailer_pid != pid:
+            _mailer = Mailer(
+                host=os.getenv("SMTP_HOST", "smtp.gmail.com"),
+                port=int(os.getenv("SMTP_PORT", "587")),
+                sender=os.getenv("EMAIL_SENDER"),
+                password=os.getenv("EMAIL_PASSWORD"),
+                starttls=os.getenv("SMTP_STARTTLS", "1") not in ("0", "false"),
+                workers=int(os.getenv("MAIL_WORKERS", "2")),
+                queue_size=int(os.getenv("MAIL_QUEUE_SIZE", "1000")),
+                max_attempts=int(os.getenv("MAIL_MAX_ATTEMPTS", "4")),
+                store=PgJobStore(keep_hours=int(os.getenv("MAIL_JOB_KEEP_HOURS", "24"))),
+            )
+            _mailer_pid = pid
+    return _mailer
@@ -1,11 +1,15 @@
-from flask import Blueprint, jsonify, request
+from flask import Blueprint, current_app
 import json
 import os
+from menu_cache import MenuCache, menu_response
+from menu_store import MenuDbCache
+from images import add_srcsets, pipeline as image_pipeline
+from metrics import REGISTRY, GaugeCallback
+from notify import get_listener
 
 menu_api = Blueprint("menu_api", __name__)
 
-MENU_FILE = "menu.json"
-BACKEND_URL = "https://asiancafebackend.onrender.com"
+MENU_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "menu.json")
 
 # ------------------- Инициализация меню -------------------
 def init_menu():
@@ -102,17 +106,29 @@ def init_menu():
         with open(MENU_FILE, "w", encoding="utf-8") as f:
             json.dump(menu_data, f, ensure_ascii=False, indent=4)
 
+# ------------------- Меню (кэш в памяти + ETag) -------------------
+# к каждому блюду добавляется srcset с вариантами картинки (images.py)
+menu_file_cache = MenuCache(MENU_FILE, transform=add_srcsets,
+                            depends=[image_pipeline.manifest_path])
+# источник — таблица menu, сброс по NOTIFY menu_changed (menu_store.py);
+# пока таблица пуста или БД недоступна — menu.json. Подписка на NOTIFY и
+# первый запрос к БД — при первом get(), не при импорте
+menu_db_cache = MenuDbCache(get_listener, transform=add_srcsets,
+                            depends=[image_pipeline.manifest_path], fallback=menu_file_cache)
+REGISTRY.register(GaugeCallback("menu_cache", "Кэш меню из БД", menu_db_cache.stats))
+
+
+def menu_source():
+    """Кэш меню по MENU_SOURCE приложения: db (по умолчанию) или file — только menu.json."""
+    if current_app.config.get("MENU_SOURCE") == "file":
+        return menu_file_cache
+    return menu_db_cache
+
 # ------------------- Получить всё меню (группами) -------------------
+@menu_api.route("/menu", methods=["GET"])
 @menu_api.route("/api/menu", methods=["GET"])
 def get_menu():
     if not os.path.exists(MENU_FILE):
         init_menu()
 
-    with open(MENU_FILE, "r", encoding="utf-8") as f:
-        menu_data = json.load(f)
-
-    for dish in menu_data:
-        # dish["img"] = "/static/images/filename.png"
-        dish["img"] = BACKEND_URL + dish["img"]
-
-    return jsonify(menu_data)
+    return menu_response(menu_source())
@@ -0,0 +1,102 @@
+"""
+Кэш меню в памяти процесса.
+
+menu.json почти никогда не меняется, а /menu — самый частый запрос.
+Поэтому файл читается и сериализуется один раз; повторная загрузка
+происходит только когда меняется mtime или размер файла.
+Ответ отдаётся с сильным ETag, на If-None-Match отвечаем 304.
+Сжатые варианты (brotli, gzip) строятся тогда же, один раз (compression.py).
+"""
+import hashlib
+import json
+import os
+import threading
+
+from flask import Response, request
+
+from compression import etag_matches, negotiate, precompress
+
+
+class MenuEntry:
+    def __init__(self, data, body, etag, encoded=None):
+        self.data = data      # разобранное меню (после transform)
+        self.body = body      # готовые байты JSON-ответа
+        self.etag = etag      # сильный ETag (без кавычек)
+        self.encoded = encoded or {}  # кодировка -> сжатые байты
+
+
+class MenuCache:
+    """
+    path      — путь к json-файлу меню;
+    transform — необязательная функция, применяемая к меню один раз
+                при загрузке (например, добавить абсолютные URL картинок);
+    depends   — другие файлы, от которых зависит результат transform
+                (их изменение тоже приводит к перезагрузке).
+    """
+
+    def __init__(self, path, transform=None, depends=()):
+        self.path = path
+        self.transform = transform
+        self.depends = tuple(depends)
+        self._key = None
+        self._entry = None
+        self._lock = threading.Lock()
+        self.loads = 0
+
+    def _stat_key(self):
+        st = os.stat(self.path)
+        return ((st.st_mtime_ns, st.st_size),) + self._depends_key()
+
+    def _depends_key(self):
+        key = []
+        for path in self.depends:
+            try:
+                st = os.stat(path)
+            except FileNotFoundError:
+                key.append(None)
+                continue
+            key.append((st.st_mtime_ns, st.st_size))
+        return tuple(key)
+
+    def get(self):
+        key = self._stat_key()
+        entry = self._entry
+        if entry is not None and key == self._key:
+            return entry
+        with self._lock:
+            if self._entry is None or key != self._key:
+                self._entry = self._load()
+                self._key = key
+                self.loads += 1
+            return self._entry
+
+    def _load(self):
+        with open(self.path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        return self._entry_for(data)
+
+    def _entry_for(self, data):
+        if self.transform is not None:
+            data = self.transform(data)
+        body = json.dumps(data, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+        etag = hashlib.sha256(body).hexdigest()[:32]
+        return MenuEntry(data, body, etag, precompress(body))
+
+
+def menu_response(cache):
+    """Ответ Flask из кэша: 304 при совпадении If-None-Match, иначе готовое тело."""
+    entry = cache.get()
+    encoding = negotiate(request.accept_encodings)
+    body = entry.encoded.get(encoding)
+    etag = entry.etag if body is None else "%s-%s" % (entry.etag, encoding)
+    if etag_matches(request.if_none_match, entry.etag):
+        response = Response(status=304)
+    else:
+        response = Response(body or entry.body, mimetype="application/json")
+        if body is not None:
+            response.headers["Content-Encoding"] = encoding
+    response.vary.add("Accept-Encoding")
+    response.set_etag(etag)
+    # браузер и CDN могут хранить копию, но обязаны перепроверять её по ETag
+    response.headers["Cache-Control"] = "public, no-cache"
+    return response
@@ -0,0 +1,292 @@
+"""
+Меню в PostgreSQL (таблица menu) и его кэш в памяти воркера.
+
+Раньше меню жило только в menu.json: чтобы поменять цену, файл правили на
+каждом инстансе. Теперь источник — таблица menu (миграция 008), правится через
+/admin/menu, а /menu отдаётся из кэша процесса без обращения к БД:
+
+- готовый JSON и ETag строятся один раз (MenuCache из menu_cache.py);
+- любое изменение таблицы (триггер, миграция 008) шлёт NOTIFY menu_changed,
+  и каждый воркер перечитывает меню при следующем запросе (notify.py);
+- пока соединение LISTEN не установлено, меню перечитывается не чаще раза
+  в MENU_STALE_SECONDS (1 с) — изменения всё равно доходят за секунду;
+- если таблица пуста (меню ещё не импортировано) — отдаётся menu.json;
+  если БД недоступна — последнее загруженное меню (или menu.json),
+  следующая попытка через MENU_RETRY_SECONDS (5 с).
+
+Импорт меню из файла (заменяет содержимое таблицы):
+
+    python menu_store.py import [menu.json]
+
+MENU_SOURCE=file — по-старому, только menu.json (локально без БД, бенчмарки).
+"""
+import hmac
+import json
+import logging
+import os
+import sys
+import time
+import weakref
+
+import psycopg2
+import psycopg2.extras
+from flask import Blueprint, abort, jsonify, make_response, request
+
+from db import PoolTimeout, db_connection
+from menu_cache import MenuCache, MenuEntry
+
+log = logging.getLogger(__name__)
+
+CHANNEL = "menu_changed"
+COLUMNS = ("id", "name", "category", "price", "description", "img", "position")
+
+# пустая таблица: отдаём запасной источник (menu.json)
+_EMPTY = MenuEntry(None, None, None)
+
+
+def load_menu(cur):
+    """Меню из БД в формате menu.json: [{"category", "items": [...]}], по position."""
+    cur.execute("SELECT id, name, category, price, description, img FROM menu ORDER BY position, id")
+    groups = {}
+    for item_id, name, category, price, description, img in cur.fetchall():
+        dish = {"id": item_id, "name": name, "price": price}
+        if description:
+            dish["desc"] = description
+        if img:
+            dish["img"] = img
+        groups.setdefault(category, []).append(dish)
+    return [{"category": category, "items": items} for category, items in groups.items()]
+
+
+def import_menu(cur, menu_data):
+    """Заменяет содержимое таблицы menu блюдами из menu.json (оба формата). Возвращает число блюд."""
+    rows = []
+    for entry in menu_data:
+        for dish in entry.get("items", [entry]):
+            rows.append((dish["name"], dish.get("category") or entry.get("category"), int(dish["price"]),
+                         dish.get("desc") or dish.get("description"), dish.get("img"), len(rows)))
+    cur.execute("DELETE FROM menu")
+    psycopg2.extras.execute_values(
+        cur, "INSERT INTO menu (name, category, price, description, img, position) VALUES %s", rows)
+    return len(rows)
+
+
+# ------------------- Кэш -------------------
+class MenuDbCache(MenuCache):
+    """
+    get_listener — функция, возвращающая NotifyListener процесса (notify.get_listener);
+    fallback     — MenuCache по menu.json на случай пустой таблицы или недоступной БД.
+    """
+
+    _instances = weakref.WeakSet()
+
+    def __init__(self, get_listener=None, transform=None, depends=(), fallback=None,
+                 stale_after=None, retry_after=None):
+        super().__init__(None, transform=transform, depends=depends)
+        self.get_listener = get_listener
+        self.fallback = fallback
+        self.stale_after = stale_after or float(os.getenv("MENU_STALE_SECONDS", "1"))
+        self.retry_after = retry_after or float(os.getenv("MENU_RETRY_SECONDS", "5"))
+        self._version = 0
+        self._listener = None
+        self._retry_at = 0.0
+        self.errors = 0
+        MenuDbCache._instances.add(self)
+
+    def invalidate(self):
+        self._version += 1
+
+    def _connected(self):
+        if self.get_listener is None:
+            return True
+        listener = self.get_listener()
+        if listener is not self._listener:
+            # первый запрос в процессе (или после fork) — подписываемся
+            with self._lock:
+                if listener is not self._listener:
+                    self._listener = listener
+                    self.invalidate()
+                    listener.subscribe(CHANNEL, lambda payload: self.invalidate(), self.invalidate)
+        return listener.connected
+
+    def _stat_key(self):
+        # версия меняется до чтения из БД, поэтому уведомление, пришедшее
+        # во время загрузки, приведёт к ещё одной загрузке, а не к устаревшему кэшу
+        connected = self._connected()
+        key = (self._version,)
+        if not connected:
+            key += (int(time.monotonic() // self.stale_after),)
+        return key + self._depends_key()
+
+    def _load(self):
+        with db_connection() as conn:
+            data = load_menu(conn.cursor())
+        if not data:
+            return _EMPTY
+        return self._entry_for(data)
+
+    def get(self):
+        if time.monotonic() < self._retry_at:
+            return self._serve(self._entry)
+        try:
+            return self._serve(super().get())
+        except (psycopg2.Error, PoolTimeout) as e:
+            log.warning("load failed: %s", e)
+            self.errors += 1
+            self._retry_at = time.monotonic() + self.retry_after
+            return self._serve(self._entry)
+
+    def _serve(self, entry):
+        if (entry is None or entry is _EMPTY) and self.fallback is not None:
+            return self.fallback.get()
+        return entry
+
+    def stats(self):
+        entry = self._entry
+        return {
+            "loads": self.loads,
+            "errors": self.errors,
+            "source": "file" if entry is None or entry is _EMPTY else "db",
+            "listener_connected": self._listener is None or self._listener.connected,
+        }
+
+
+def invalidate_caches():
+    """Сразу сбросить кэши этого процесса (остальные узнают по NOTIFY)."""
+    for cache in list(MenuDbCache._instances):
+        cache.invalidate()
+
+
+# ------------------- Админка меню -------------------
+# /admin/menu требует заголовок Authorization: Bearer <ADMIN_TOKEN>.
+# Без ADMIN_TOKEN админка закрыта (503); открыть её без токена можно только
+# явно, ADMIN_OPEN=1 — для локальной разработки и бенчмарков.
+menu_admin_api = Blueprint("menu_admin_api", __name__)
+
+
+@menu_admin_api.before_request
+def check_admin_token():
+    """
+    401 без верного токена, 503 если ADMIN_TOKEN не задан (и нет ADMIN_OPEN=1).
+    Годится и для других /admin-маршрутов.
+    """
+    if request.method == "OPTIONS":
+        return
+    token = os.getenv("ADMIN_TOKEN")
+    if not token:
+        if os.getenv("ADMIN_OPEN") == "1":
+            return
+        log.warning("ADMIN_TOKEN не задан, %s %s отклонён", request.method, request.path)
+        abort(make_response(jsonify({"error": "Админка отключена: не задан ADMIN_TOKEN"}), 503))
+    supplied = request.headers.get("Authorization", "")
+    if not hmac.compare_digest(supplied.encode(), ("Bearer " + token).encode()):
+        abort(401)
+
+
+def _parse_item(data, partial=False):
+    """Проверяет поля блюда. Возвращает (поля, ошибка)."""
+    if not isinstance(data, dict):
+        return None, "Ожидается JSON-объект"
+    fields = {}
+    for field in ("name", "category"):
+        if field in data or not partial:
+            value = data.get(field)
+            if not isinstance(value, str) or not value.strip():
+                return None, "Поле %s обязательно" % field
+            fields[field] = value.strip()
+    if "price" in data or not partial:
+        price = data.get("price")
+        if isinstance(price, bool) or not isinstance(price, int) or price < 0:
+            return None, "price — целое число не меньше 0"
+        fields["price"] = price
+    for field, column in (("desc", "description"), ("description", "description"), ("img", "img")):
+        if field in data:
+            value = data[field]
+            if value is not None and not isinstance(value, str):
+                return None, "Поле %s должно быть строкой" % field
+            fields[column] = value
+    if "position" in data:
+        if isinstance(data["position"], bool) or not isinstance(data["position"], int):
+            return None, "position — целое число"
+        fields["position"] = data["position"]
+    if partial and not fields:
+        return None, "Нет полей для изменения"
+    return fields, None
+
+
+def _item_json(row):
+    return dict(zip(COLUMNS, row))
+
+
+@menu_admin_api.route("/admin/menu", methods=["GET"])
+def admin_menu_list():
+    with db_connection() as conn:
+        cur = conn.cursor()
+        cur.execute("SELECT %s FROM menu ORDER BY position, id" % ", ".join(COLUMNS))
+        rows = cur.fetchall()
+    return jsonify([_item_json(row) for row in rows])
+
+
+@menu_admin_api.route("/admin/menu", methods=["POST"])
+def admin_menu_create():
+    fields, error = _parse_item(request.get_json(silent=True))
+    if error:
+        return jsonify({"error": error}), 400
+    with db_connection() as conn:
+        cur = conn.cursor()
+        if "position" not in fields:
+            # по умолчанию — в конец меню (и последним в своей категории)
+            cur.execute("SELECT COALESCE(MAX(position) + 1, 0) FROM menu")
+            fields["position"] = cur.fetchone()[0]
+        names = list(fields)
+        cur.execute("INSERT INTO menu (%s) VALUES (%s) RETURNING %s" % (
+            ", ".join(names), ", ".join(["%s"] * len(names)), ", ".join(COLUMNS)),
+            [fields[name] for name in names])
+        row = cur.fetchone()
+    invalidate_caches()
+    return jsonify(_item_json(row)), 201
+
+
+@menu_admin_api.route("/admin/menu/<int:item_id>", methods=["PUT", "PATCH"])
+def admin_menu_update(item_id):
+    fields, error = _parse_item(request.get_json(silent=True), partial=request.method == "PATCH")
+    if error:
+        return jsonify({"error": error}), 400
+    with db_connection() as conn:
+        cur = conn.cursor()
+        cur.execute("UPDATE menu SET %s, updated_at = NOW() WHERE id = %%s RETURNING %s" % (
+            ", ".join("%s = %%s" % name for name in fields), ", ".join(COLUMNS)),
+            list(fields.values()) + [item_id])
+        row = cur.fetchone()
+    if row is None:
+        return jsonify({"error": "Блюдо не найдено"}), 404
+    invalidate_caches()
+    return jsonify(_item_json(row))
+
+
+@menu_admin_api.route("/admin/menu/<int:item_id>", methods=["DELETE"])
+def admin_menu_delete(item_id):
+    with db_connection() as conn:
+        cur = conn.cursor()
+        cur.execute("DELETE FROM menu WHERE id = %s", (item_id,))
+        deleted = cur.rowcount
+    if not deleted:
+        return jsonify({"error": "Блюдо не найдено"}), 404
+    invalidate_caches()
+    return jsonify({"success": True})
+
+
+if __name__ == "__main__":
+    from dotenv import load_dotenv
+
+    load_dotenv()
+    if len(sys.argv) < 2 or sys.argv[1] != "import":
+        print("usage: python menu_store.py import [menu.json]")
+        sys.exit(2)
+    path = sys.argv[2] if len(sys.argv) > 2 else os.path.join(
+        os.path.dirname(os.path.abspath(__file__)), "menu.json")
+    with open(path, "r", encoding="utf-8") as f:
+        menu_data = json.load(f)
+    with db_connection() as conn:
+        count = import_menu(conn.cursor(), menu_data)
+    print("imported:", count)
@@ -0,0 +1,220 @@
+"""
+Метрики приложения в текстовом формате Prometheus (/metrics).
+
+- http_requests_total{endpoint,method,status} и
+  http_request_duration_seconds{endpoint,method} — по каждому маршруту;
+  endpoint — шаблон маршрута ("/reservation/confirm"), а не фактический путь,
+  чтобы число рядов было ограничено;
+- db_query_duration_seconds{operation} — каждый execute() курсора (db.py);
+- email_send_duration_seconds{result}, email_connect_duration_seconds — mailer.py;
+- gauges пула соединений и очереди писем — считываются в момент запроса /metrics.
+
+Запись в метрику — поиск в словаре, bisect по границам корзин и прибавление под
+блокировкой, поэтому инструментирование можно держать включённым в проде.
+Метрики хранятся в памяти процесса: у каждого воркера gunicorn свои значения.
+Если задан METRICS_TOKEN, /metrics требует заголовок Authorization: Bearer <token>.
+"""
+import hmac
+import logging
+import os
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+
+from flask import Blueprint, Response, abort, g, request
+
+log = logging.getLogger(__name__)
+
+# Границы корзин гистограмм, секунды
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SMTP_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names, values, extra=""):
+    pairs = ['%s="%s"' % (n, _escape(v)) for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{%s}" % ",".join(pairs) if pairs else ""
+
+
+def _number(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    def __init__(self, name, doc, labelnames=()):
+        self.name = name
+        self.doc = doc
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labelvalues, amount=1):
+        with self._lock:
+            self._values[labelvalues] = self._values.get(labelvalues, 0) + amount
+
+    def value(self, *labelvalues):
+        return self._values.get(labelvalues, 0)
+
+    def render(self):
+        lines = ["# HELP %s %s" % (self.name, self.doc), "# TYPE %s counter" % self.name]
+        with self._lock:
+            items = sorted(self._values.items())
+        for labelvalues, value in items:
+            lines.append("%s%s %s" % (self.name, _labels(self.labelnames, labelvalues), _number(value)))
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, doc, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.doc = doc
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._series = {}     # labelvalues -> [счётчики корзин..., +Inf, сумма]
+        self._lock = threading.Lock()
+
+    def observe(self, value, *labelvalues):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labelvalues)
+            if series is None:
+                series = self._series[labelvalues] = [0] * (len(self.buckets) + 1) + [0.0]
+            series[index] += 1
+            series[-1] += value
+
+    @contextmanager
+    def time(self, *labelvalues):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, *labelvalues)
+
+    def count(self, *labelvalues):
+        series = self._series.get(labelvalues)
+        return sum(series[:-1]) if series else 0
+
+    def render(self):
+        lines = ["# HELP %s %s" % (self.name, self.doc), "# TYPE %s histogram" % self.name]
+        with self._lock:
+            items = sorted((k, list(v)) for k, v in self._series.items())
+        for labelvalues, series in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), series):
+                cumulative += count
+                le = 'le="%s"' % _number(bound)
+                lines.append("%s_bucket%s %d" % (self.name, _labels(self.labelnames, labelvalues, le), cumulative))
+            labels = _labels(self.labelnames, labelvalues)
+            lines.append("%s_sum%s %s" % (self.name, labels, _number(series[-1])))
+            lines.append("%s_count%s %d" % (self.name, labels, cumulative))
+        return lines
+
+
+class GaugeCallback:
+    """Значения считываются функцией при каждом рендере: fn() -> {имя: число} или None."""
+
+    def __init__(self, prefix, doc, fn):
+        self.prefix = prefix
+        self.doc = doc
+        self.fn = fn
+
+    def render(self):
+        try:
+            values = self.fn()
+        except Exception as e:
+            log.warning("gauge %s failed: %s", self.prefix, e)
+            return []
+        lines = []
+        for key, value in sorted((values or {}).items()):
+            if isinstance(value, bool) or not isinstance(value, (int, float)):
+                continue
+            name = "%s_%s" % (self.prefix, key)
+            lines += ["# HELP %s %s: %s" % (name, self.doc, key), "# TYPE %s gauge" % name,
+                      "%s %s" % (name, _number(value))]
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def render(self):
+        lines = []
+        for metric in self._metrics:
+            lines += metric.render()
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+HTTP_REQUESTS = REGISTRY.register(Counter(
+    "http_requests_total", "HTTP-запросы по маршруту, методу и статусу",
+    ("endpoint", "method", "status")))
+HTTP_LATENCY = REGISTRY.register(Histogram(
+    "http_request_duration_seconds", "Время обработки запроса до отдачи ответа",
+    ("endpoint", "method")))
+DB_QUERY_LATENCY = REGISTRY.register(Histogram(
+    "db_query_duration_seconds", "Время выполнения SQL-запроса", ("operation",)))
+EMAIL_SEND_LATENCY = REGISTRY.register(Histogram(
+    "email_send_duration_seconds", "Отправка письма по уже открытой SMTP-сессии",
+    ("result",), buckets=SMTP_BUCKETS))
+EMAIL_CONNECT_LATENCY = REGISTRY.register(Histogram(
+    "email_connect_duration_seconds", "Подключение к SMTP: TCP, STARTTLS, login",
+    buckets=SMTP_BUCKETS))
+LOG_DROPPED = REGISTRY.register(Counter(
+    "log_records_dropped_total", "Записи лога, отброшенные из-за переполненной очереди"))
+
+SQL_OPERATIONS = {"SELECT", "INSERT", "UPDATE", "DELETE", "WITH", "BEGIN", "COMMIT", "ROLLBACK", "DECLARE"}
+
+
+def sql_operation(sql):
+    """Первое слово запроса — метка operation (без параметров и литералов)."""
+    if isinstance(sql, bytes):
+        sql = sql[:32].decode("utf-8", "replace")
+    elif not isinstance(sql, str):
+        return "other"
+    word = sql.lstrip()[:10].split(None, 1)
+    op = word[0].upper() if word else ""
+    return op if op in SQL_OPERATIONS else "other"
+
+
+# ------------------- Маршруты и хуки -------------------
+metrics_api = Blueprint("metrics_api", __name__)
+
+
+@metrics_api.before_app_request
+def _start_timer():
+    g.metrics_started = time.perf_counter()
+
+
+@metrics_api.after_app_request
+def _record_request(response):
+    started = g.pop("metrics_started", None)
+    if started is not None:
+        rule = request.url_rule
+        endpoint = rule.rule if rule is not None else "<unmatched>"
+        HTTP_LATENCY.observe(time.perf_counter() - started, endpoint, request.method)
+        HTTP_REQUESTS.inc(endpoint, request.method, str(response.status_code))
+    return response
+
+
+@metrics_api.route("/metrics", methods=["GET"])
+def metrics_endpoint():
+    token = os.getenv("METRICS_TOKEN")
+    if token:
+        supplied = request.headers.get("Authorization", "")
+        if not hmac.compare_digest(supplied.encode(), ("Bearer " + token).encode()):
+            abort(401)
+    return Response(REGISTRY.render(), mimetype="text/plain; version=0.0.4")
@@ -0,0 +1,642 @@
+"""
+Миграции схемы PostgreSQL.
+
+Раньше init_pg() выполнял CREATE TABLE IF NOT EXISTS при импорте app.py
+в каждом воркере. Теперь схема версионируется: применённые миграции
+записаны в schema_migrations, и запускаются только новые — отдельным шагом
+при деплое, а не при старте воркера:
+
+    python migrations.py upgrade   # применить новые миграции
+    python migrations.py status    # какие применены / ожидают
+    python migrations.py check     # EXPLAIN: используют ли горячие запросы индексы
+
+Новая миграция — новый элемент в конце MIGRATIONS со следующим номером.
+Уже применённые миграции не редактируются.
+"""
+import json
+import sys
+
+# Произвольная константа для pg_advisory_lock: два деплоя не применят миграции одновременно
+LOCK_ID = 71_2025_001
+
+MIGRATIONS = [
+    (1, "initial_schema", """
+        CREATE TABLE IF NOT EXISTS users (
+            id SERIAL PRIMARY KEY,
+            name TEXT,
+            email TEXT UNIQUE NOT NULL,
+            password TEXT,
+            verified BOOLEAN DEFAULT FALSE,
+            google_id TEXT
+        );
+
+        -- Коды подтверждения email
+        CREATE TABLE IF NOT EXISTS email_codes (
+            id SERIAL PRIMARY KEY,
+            email TEXT NOT NULL,
+            code TEXT NOT NULL,
+            created_at TIMESTAMP DEFAULT NOW()
+        );
+
+        CREATE TABLE IF NOT EXISTS menu (
+            id SERIAL PRIMARY KEY,
+            name TEXT NOT NULL,
+            price INTEGER NOT NULL,
+            category TEXT NOT NULL
+        );
+
+        CREATE TABLE IF NOT EXISTS reservations (
+            id SERIAL PRIMARY KEY,
+            user_email TEXT NOT NULL,
+            branch TEXT NOT NULL,
+            date DATE NOT NULL,
+            tables TEXT[] NOT NULL,
+            guests INTEGER NOT NULL,
+            notes TEXT,
+            menu_items TEXT[],
+            status TEXT DEFAULT 'pending',
+            created_at TIMESTAMP DEFAULT NOW()
+        );
+
+        CREATE TABLE IF NOT EXISTS table_usage (
+            id SERIAL PRIMARY KEY,
+            table_id TEXT NOT NULL,
+            branch TEXT NOT NULL,
+            date DATE NOT NULL,
+            used_seats INTEGER NOT NULL
+        );
+    """),
+    (2, "table_usage_occupancy_index", """
+        -- Индекс занятости: одна строка на стол активной брони (см. occupancy.py)
+        ALTER TABLE table_usage
+        ADD COLUMN IF NOT EXISTS reservation_id INTEGER REFERENCES reservations(id) ON DELETE CASCADE;
+        CREATE INDEX IF NOT EXISTS table_usage_branch_date_idx ON table_usage (branch, date);
+        CREATE INDEX IF NOT EXISTS table_usage_reservation_idx ON table_usage (reservation_id);
+
+        INSERT INTO table_usage (reservation_id, branch, date, table_id, used_seats)
+        SELECT DISTINCT r.id, r.branch, r.date, t.table_id, r.guests
+        FROM reservations r, unnest(r.tables) AS t(table_id)
+        WHERE r.status != 'cancelled' AND t.table_id IS NOT NULL
+          AND NOT EXISTS (SELECT 1 FROM table_usage);
+    """),
+    (3, "hot_query_indexes", """
+        -- /admin/bookings: keyset-пагинация
+        CREATE INDEX IF NOT EXISTS reservations_created_idx ON reservations (created_at DESC, id DESC);
+        -- брони филиала на дату
+        CREATE INDEX IF NOT EXISTS reservations_branch_date_idx ON reservations (branch, date);
+        -- /user/bookings
+        CREATE INDEX IF NOT EXISTS reservations_user_email_idx ON reservations (user_email, date DESC);
+        -- /verify-email: последний код по email
+        CREATE INDEX IF NOT EXISTS email_codes_email_idx ON email_codes (email, id DESC);
+    """),
+    (4, "table_usage_unique_slot", """
+        -- Стол на дату может занимать только одна бронь (см. occupancy.occupy).
+        -- Старые двойные брони: стол остаётся за самой ранней.
+        DELETE FROM table_usage WHERE reservation_id IS NULL;
+        DELETE FROM table_usage u USING table_usage d
+        WHERE u.branch = d.branch AND u.date = d.date AND u.table_id = d.table_id
+          AND (u.reservation_id > d.reservation_id
+               OR (u.reservation_id = d.reservation_id AND u.id > d.id));
+        CREATE UNIQUE INDEX IF NOT EXISTS table_usage_slot_key ON table_usage (branch, date, table_id);
+        -- (branch, date) покрывается префиксом уникального индекса
+        DROP INDEX IF EXISTS table_usage_branch_date_idx;
+    """),
+    (5, "server_sessions", """
+        -- Серверные сессии (sessions.py): в cookie только id
+        CREATE TABLE IF NOT EXISTS sessions (
+            id TEXT PRIMARY KEY,
+            data TEXT NOT NULL,
+            expires_at TIMESTAMPTZ NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS sessions_expires_idx ON sessions (expires_at);
+    """),
+    (6, "reservations_change_notify", """
+        -- NOTIFY bookings_changed <email> при любом изменении броней пользователя:
+        -- воркеры сбрасывают кэш /user/bookings (bookings_cache.py).
+        -- Уведомление уходит только после коммита, одинаковые — схлопываются.
+        CREATE OR REPLACE FUNCTION notify_bookings_changed() RETURNS trigger AS $$
+        BEGIN
+            IF TG_OP <> 'DELETE' THEN
+                PERFORM pg_notify('bookings_changed', NEW.user_email);
+            END IF;
+            IF TG_OP = 'DELETE' THEN
+                PERFORM pg_notify('bookings_changed', OLD.user_email);
+            ELSIF TG_OP = 'UPDATE' AND OLD.user_email IS DISTINCT FROM NEW.user_email THEN
+                PERFORM pg_notify('bookings_changed', OLD.user_email);
+            END IF;
+            RETURN NULL;
+        END
+        $$ LANGUAGE plpgsql;
+
+        DROP TRIGGER IF EXISTS reservations_notify ON reservations;
+        CREATE TRIGGER reservations_notify
+        AFTER INSERT OR UPDATE OR DELETE ON reservations
+        FOR EACH ROW EXECUTE FUNCTION notify_bookings_changed();
+    """),
+    (7, "email_codes_ttl", """
+        -- Один текущий код на email со сроком жизни (email_codes.py)
+        ALTER TABLE email_codes ADD COLUMN IF NOT EXISTS expires_at TIMESTAMPTZ;
+        DELETE FROM email_codes c USING email_codes newer
+        WHERE c.email = newer.email AND c.id < newer.id;
+        UPDATE email_codes SET expires_at = COALESCE(created_at, NOW()) + INTERVAL '15 minutes'
+        WHERE expires_at IS NULL;
+        ALTER TABLE email_codes ALTER COLUMN expires_at SET NOT NULL;
+        CREATE UNIQUE INDEX IF NOT EXISTS email_codes_email_key ON email_codes (email);
+        DROP INDEX IF EXISTS email_codes_email_idx;
+        -- периодическая чистка просроченных
+        CREATE INDEX IF NOT EXISTS email_codes_expires_idx ON email_codes (expires_at);
+    """),
+    (8, "menu_source_of_truth", """
+        -- Меню в БД (menu_store.py): описание, картинка, порядок показа
+        ALTER TABLE menu ADD COLUMN IF NOT EXISTS description TEXT;
+        ALTER TABLE menu ADD COLUMN IF NOT EXISTS img TEXT;
+        ALTER TABLE menu ADD COLUMN IF NOT EXISTS position INTEGER NOT NULL DEFAULT 0;
+        ALTER TABLE menu ADD COLUMN IF NOT EXISTS updated_at TIMESTAMPTZ NOT NULL DEFAULT NOW();
+
+        -- NOTIFY menu_changed после любого изменения: воркеры перечитывают меню.
+        -- Один раз на оператор — импорт всего меню даёт одно уведомление.
+        CREATE OR REPLACE FUNCTION notify_menu_changed() RETURNS trigger AS $$
+        BEGIN
+            PERFORM pg_notify('menu_changed', '');
+            RETURN NULL;
+        END
+        $$ LANGUAGE plpgsql;
+
+        DROP TRIGGER IF EXISTS menu_notify ON menu;
+        CREATE TRIGGER menu_notify
+        AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON menu
+        FOR EACH STATEMENT EXECUTE FUNCTION notify_menu_changed();
+    """),
+    (9, "users_google_id", """
+        -- Вход через Google: пользователь ищется по sub из id_token (oidc.py)
+        CREATE UNIQUE INDEX IF NOT EXISTS users_google_id_key ON users (google_id)
+        WHERE google_id IS NOT NULL;
+    """),
+    (10, "reservations_notify_per_statement", """
+        -- bookings_changed раз на оператор, а не на строку: массовая смена статуса
+        -- (/admin/reservations/status) и пакетная вставка вызывают триггер один раз,
+        -- по одному уведомлению на email. Таблицы переходов нельзя объявить у
+        -- триггера на несколько событий — отсюда три триггера с одной функцией.
+        CREATE OR REPLACE FUNCTION notify_bookings_changed_rows() RETURNS trigger AS $$
+        BEGIN
+            IF TG_OP = 'INSERT' THEN
+                PERFORM pg_notify('bookings_changed', e.user_email)
+                FROM (SELECT DISTINCT user_email FROM new_rows) e;
+            ELSIF TG_OP = 'UPDATE' THEN
+                PERFORM pg_notify('bookings_changed', e.user_email)
+                FROM (SELECT user_email FROM new_rows UNION SELECT user_email FROM old_rows) e;
+            ELSE
+                PERFORM pg_notify('bookings_changed', e.user_email)
+                FROM (SELECT DISTINCT user_email FROM old_rows) e;
+            END IF;
+            RETURN NULL;
+        END
+        $$ LANGUAGE plpgsql;
+
+        DROP TRIGGER IF EXISTS reservations_notify ON reservations;
+        DROP FUNCTION IF EXISTS notify_bookings_changed();
+        DROP TRIGGER IF EXISTS reservations_notify_insert ON reservations;
+        CREATE TRIGGER reservations_notify_insert
+        AFTER INSERT ON reservations REFERENCING NEW TABLE AS new_rows
+        FOR EACH STATEMENT EXECUTE FUNCTION notify_bookings_changed_rows();
+        DROP TRIGGER IF EXISTS reservations_notify_update ON reservations;
+        CREATE TRIGGER reservations_notify_update
+        AFTER UPDATE ON reservations REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+        FOR EACH STATEMENT EXECUTE FUNCTION notify_bookings_changed_rows();
+        DROP TRIGGER IF EXISTS reservations_notify_delete ON reservations;
+        CREATE TRIGGER reservations_notify_delete
+        AFTER DELETE ON reservations REFERENCING OLD TABLE AS old_rows
+        FOR EACH STATEMENT EXECUTE FUNCTION notify_bookings_changed_rows();
+    """),
+    (11, "reservations_stats", """
+        -- Агрегаты для /admin/stats (stats.py): отчёт не сканирует reservations.
+        -- Брони по статусам, гости и столы неотменённых броней — по дням
+        CREATE TABLE IF NOT EXISTS stats_daily (
+            branch TEXT NOT NULL,
+            date DATE NOT NULL,
+            pending INTEGER NOT NULL DEFAULT 0,
+            confirmed INTEGER NOT NULL DEFAULT 0,
+            cancelled INTEGER NOT NULL DEFAULT 0,
+            guests INTEGER NOT NULL DEFAULT 0,
+            tables INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (branch, date)
+        );
+        -- Столы и предзаказанные блюда неотменённых броней — по месяцам
+        CREATE TABLE IF NOT EXISTS stats_tables (
+            branch TEXT NOT NULL,
+            month DATE NOT NULL,
+            table_id TEXT NOT NULL,
+            bookings INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (branch, month, table_id)
+        );
+        CREATE TABLE IF NOT EXISTS stats_menu_items (
+            branch TEXT NOT NULL,
+            month DATE NOT NULL,
+            item TEXT NOT NULL,
+            orders INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (branch, month, item)
+        );
+
+        -- Запросы, которые прибавляют к агрегатам набор изменений: changes — SELECT
+        -- строк reservations с колонкой sign (+1 новая строка, -1 старая).
+        -- Один оператор — одна группировка на агрегат, а не обновление на строку.
+        CREATE OR REPLACE FUNCTION reservations_stats_sql(changes TEXT) RETURNS SETOF TEXT
+        LANGUAGE sql IMMUTABLE AS $fn$
+            SELECT format(q, changes) FROM unnest(ARRAY[
+                $q$
+                WITH c AS (%s)
+                INSERT INTO stats_daily AS s (branch, date, pending, confirmed, cancelled, guests, tables)
+                SELECT * FROM (
+                    SELECT branch, date,
+                        COALESCE(sum(sign) FILTER (WHERE status IS NULL
+                                 OR status NOT IN ('confirmed', 'cancelled')), 0) AS pending,
+                        COALESCE(sum(sign) FILTER (WHERE status = 'confirmed'), 0) AS confirmed,
+                        COALESCE(sum(sign) FILTER (WHERE status = 'cancelled'), 0) AS cancelled,
+                        COALESCE(sum(sign * guests) FILTER (WHERE status IS DISTINCT FROM 'cancelled'), 0) AS guests,
+                        COALESCE(sum(sign * cardinality(tables))
+                                 FILTER (WHERE status IS DISTINCT FROM 'cancelled'), 0) AS tables
+                    FROM c GROUP BY branch, date
+                ) d
+                WHERE (d.pending, d.confirmed, d.cancelled, d.guests, d.tables) <> (0, 0, 0, 0, 0)
+                ON CONFLICT (branch, date) DO UPDATE
+                SET pending = s.pending + EXCLUDED.pending, confirmed = s.confirmed + EXCLUDED.confirmed,
+                    cancelled = s.cancelled + EXCLUDED.cancelled, guests = s.guests + EXCLUDED.guests,
+                    tables = s.tables + EXCLUDED.tables
+                $q$,
+                $q$
+                WITH c AS (%s)
+                INSERT INTO stats_tables AS s (branch, month, table_id, bookings)
+                SELECT c.branch, date_trunc('month', c.date)::date, t.table_id, sum(c.sign)
+                FROM c, unnest(c.tables) AS t(table_id)
+                WHERE c.status IS DISTINCT FROM 'cancelled' AND t.table_id IS NOT NULL
+                GROUP BY 1, 2, 3
+                HAVING sum(c.sign) <> 0
+                ON CONFLICT (branch, month, table_id) DO UPDATE SET bookings = s.bookings + EXCLUDED.bookings
+                $q$,
+                $q$
+                WITH c AS (%s)
+                INSERT INTO stats_menu_items AS s (branch, month, item, orders)
+                SELECT c.branch, date_trunc('month', c.date)::date, m.item, sum(c.sign)
+                FROM c, unnest(c.menu_items) AS m(item)
+                WHERE c.status IS DISTINCT FROM 'cancelled' AND m.item <> ''
+                GROUP BY 1, 2, 3
+                HAVING sum(c.sign) <> 0
+                ON CONFLICT (branch, month, item) DO UPDATE SET orders = s.orders + EXCLUDED.orders
+                $q$
+            ]) AS q
+        $fn$;
+
+        -- Таблицы переходов видны только запросам самой триггерной функции,
+        -- поэтому запросы выполняются здесь, а reservations_stats_sql их только строит
+        CREATE OR REPLACE FUNCTION reservations_stats_apply() RETURNS trigger AS $$
+        DECLARE
+            q TEXT;
+        BEGIN
+            FOR q IN SELECT reservations_stats_sql(CASE TG_OP
+                WHEN 'INSERT' THEN 'SELECT n.*, 1 AS sign FROM new_rows n'
+                WHEN 'DELETE' THEN 'SELECT o.*, -1 AS sign FROM old_rows o'
+                ELSE 'SELECT n.*, 1 AS sign FROM new_rows n UNION ALL SELECT o.*, -1 FROM old_rows o'
+            END) LOOP
+                EXECUTE q;
+            END LOOP;
+            RETURN NULL;
+        END
+        $$ LANGUAGE plpgsql;
+
+        -- Полный пересчёт из reservations (python stats.py rebuild)
+        CREATE OR REPLACE FUNCTION reservations_stats_rebuild() RETURNS void AS $$
+        DECLARE
+            q TEXT;
+        BEGIN
+            DELETE FROM stats_daily;
+            DELETE FROM stats_tables;
+            DELETE FROM stats_menu_items;
+            FOR q IN SELECT reservations_stats_sql('SELECT r.*, 1 AS sign FROM reservations r') LOOP
+                EXECUTE q;
+            END LOOP;
+        END
+        $$ LANGUAGE plpgsql;
+
+        DROP TRIGGER IF EXISTS reservations_stats_insert ON reservations;
+        CREATE TRIGGER reservations_stats_insert
+        AFTER INSERT ON reservations REFERENCING NEW TABLE AS new_rows
+        FOR EACH STATEMENT EXECUTE FUNCTION reservations_stats_apply();
+        DROP TRIGGER IF EXISTS reservations_stats_update ON reservations;
+        CREATE TRIGGER reservations_stats_update
+        AFTER UPDATE ON reservations REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+        FOR EACH STATEMENT EXECUTE FUNCTION reservations_stats_apply();
+        DROP TRIGGER IF EXISTS reservations_stats_delete ON reservations;
+        CREATE TRIGGER reservations_stats_delete
+        AFTER DELETE ON reservations REFERENCING OLD TABLE AS old_rows
+        FOR EACH STATEMENT EXECUTE FUNCTION reservations_stats_apply();
+
+        -- триггеры уже держат блокировку reservations — пересчёт согласован с записью
+        SELECT reservations_stats_rebuild();
+    """),
+    (12, "email_jobs", """
+        -- Статус фоновой отправки писем (mailer.py): опрос
+        -- /register/email/status/<id> попадает в любой воркер, а очередь у каждого своя
+        CREATE TABLE IF NOT EXISTS email_jobs (
+            id TEXT PRIMARY KEY,
+            status TEXT NOT NULL,
+            attempts INTEGER NOT NULL DEFAULT 0,
+            error TEXT,
+            created_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+            updated_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+        );
+        CREATE INDEX IF NOT EXISTS email_jobs_created_idx ON email_jobs (created_at);
+    """),
+    (13, "reservations_stats_queue", """
+        -- Агрегаты /admin/stats больше не обновляются в транзакции брони: триггер
+        -- только дописывает изменения в очередь stats_changes (без конфликтов и
+        -- блокировок общих строк), а в stats_daily / stats_tables / stats_menu_items
+        -- их сворачивает reservations_stats_fold() — перед отчётом и по cron.
+        CREATE TABLE IF NOT EXISTS stats_changes (
+            id BIGSERIAL PRIMARY KEY,
+            branch TEXT NOT NULL,
+            date DATE NOT NULL,
+            status TEXT,
+            guests INTEGER,
+            tables TEXT[],
+            menu_items TEXT[],
+            sign SMALLINT NOT NULL
+        );
+
+        -- Как в 011, но строки вставляются в порядке ключа: upsert'ы всегда
+        -- берут блокировки строк агрегатов в одном порядке
+        CREATE OR REPLACE FUNCTION reservations_stats_sql(changes TEXT) RETURNS SETOF TEXT
+        LANGUAGE sql IMMUTABLE AS $fn$
+            SELECT format(q, changes) FROM unnest(ARRAY[
+                $q$
+                WITH c AS (%s)
+                INSERT INTO stats_daily AS s (branch, date, pending, confirmed, cancelled, guests, tables)
+                SELECT * FROM (
+                    SELECT branch, date,
+                        COALESCE(sum(sign) FILTER (WHERE status IS NULL
+                                 OR status NOT IN ('confirmed', 'cancelled')), 0) AS pending,
+                        COALESCE(sum(sign) FILTER (WHERE status = 'confirmed'), 0) AS confirmed,
+                        COALESCE(sum(sign) FILTER (WHERE status = 'cancelled'), 0) AS cancelled,
+                        COALESCE(sum(sign * guests) FILTER (WHERE status IS DISTINCT FROM 'cancelled'), 0) AS guests,
+                        COALESCE(sum(sign * cardinality(tables))
+                                 FILTER (WHERE status IS DISTINCT FROM 'cancelled'), 0) AS tables
+                    FROM c GROUP BY branch, date
+                ) d
+                WHERE (d.pending, d.confirmed, d.cancelled, d.guests, d.tables) <> (0, 0, 0, 0, 0)
+                ORDER BY d.branch, d.date
+                ON CONFLICT (branch, date) DO UPDATE
+                SET pending = s.pending + EXCLUDED.pending, confirmed = s.confirmed + EXCLUDED.confirmed,
+                    cancelled = s.cancelled + EXCLUDED.cancelled, guests = s.guests + EXCLUDED.guests,
+                    tables = s.tables + EXCLUDED.tables
+                $q$,
+                $q$
+                WITH c AS (%s)
+                INSERT INTO stats_tables AS s (branch, month, table_id, bookings)
+                SELECT c.branch, date_trunc('month', c.date)::date, t.table_id, sum(c.sign)
+                FROM c, unnest(c.tables) AS t(table_id)
+                WHERE c.status IS DISTINCT FROM 'cancelled' AND t.table_id IS NOT NULL
+                GROUP BY 1, 2, 3
+                HAVING sum(c.sign) <> 0
+                ORDER BY 1, 2, 3
+                ON CONFLICT (branch, month, table_id) DO UPDATE SET bookings = s.bookings + EXCLUDED.bookings
+                $q$,
+                $q$
+                WITH c AS (%s)
+                INSERT INTO stats_menu_items AS s (branch, month, item, orders)
+                SELECT c.branch, date_trunc('month', c.date)::date, m.item, sum(c.sign)
+                FROM c, unnest(c.menu_items) AS m(item)
+                WHERE c.status IS DISTINCT FROM 'cancelled' AND m.item <> ''
+                GROUP BY 1, 2, 3
+                HAVING sum(c.sign) <> 0
+                ORDER BY 1, 2, 3
+                ON CONFLICT (branch, month, item) DO UPDATE SET orders = s.orders + EXCLUDED.orders
+                $q$
+            ]) AS q
+        $fn$;
+
+        -- Триггеры из 011 остаются, меняется только функция: запись в очередь.
+        -- UPDATE, не затронувший полей агрегатов (например, notes), в очередь не попадает.
+        CREATE OR REPLACE FUNCTION reservations_stats_apply() RETURNS trigger AS $$
+        BEGIN
+            IF TG_OP = 'INSERT' THEN
+                INSERT INTO stats_changes (branch, date, status, guests, tables, menu_items, sign)
+                SELECT branch, date, status, guests, tables, menu_items, 1 FROM new_rows;
+            ELSIF TG_OP = 'DELETE' THEN
+                INSERT INTO stats_changes (branch, date, status, guests, tables, menu_items, sign)
+                SELECT branch, date, status, guests, tables, menu_items, -1 FROM old_rows;
+            ELSE
+                INSERT INTO stats_changes (branch, date, status, guests, tables, menu_items, sign)
+                SELECT x.* FROM new_rows n JOIN old_rows o USING (id),
+                    LATERAL (VALUES (n.branch, n.date, n.status, n.guests, n.tables, n.menu_items, 1),
+                                    (o.branch, o.date, o.status, o.guests, o.tables, o.menu_items, -1))
+                        AS x(branch, date, status, guests, tables, menu_items, sign)
+                WHERE (n.branch, n.date, n.status, n.guests, n.tables, n.menu_items)
+                      IS DISTINCT FROM (o.branch, o.date, o.status, o.guests, o.tables, o.menu_items);
+            END IF;
+            RETURN NULL;
+        END
+        $$ LANGUAGE plpgsql;
+
+        -- Сворачивает накопленные изменения в агрегаты; возвращает их число.
+        -- Свёртку выполняет один процесс за раз (advisory lock), поэтому
+        -- блокировки строк агрегатов не пересекаются и не взаимоблокируются.
+        CREATE OR REPLACE FUNCTION reservations_stats_fold() RETURNS INTEGER AS $$
+        DECLARE
+            q TEXT;
+            n INTEGER;
+        BEGIN
+            PERFORM pg_advisory_xact_lock(712025003);
+            DROP TABLE IF EXISTS stats_fold_batch;
+            CREATE TEMP TABLE stats_fold_batch ON COMMIT DROP AS
+                SELECT * FROM stats_changes WITH NO DATA;
+            WITH taken AS (DELETE FROM stats_changes RETURNING *)
+            INSERT INTO stats_fold_batch SELECT * FROM taken;
+            GET DIAGNOSTICS n = ROW_COUNT;
+            IF n > 0 THEN
+                FOR q IN SELECT reservations_stats_sql('SELECT * FROM stats_fold_batch') LOOP
+                    EXECUTE q;
+                END LOOP;
+            END IF;
+            DROP TABLE stats_fold_batch;
+            RETURN n;
+        END
+        $$ LANGUAGE plpgsql;
+
+        -- Полный пересчёт: очередь тоже очищается (её изменения уже в reservations)
+        CREATE OR REPLACE FUNCTION reservations_stats_rebuild() RETURNS void AS $$
+        DECLARE
+            q TEXT;
+        BEGIN
+            PERFORM pg_advisory_xact_lock(712025003);
+            DELETE FROM stats_changes;
+            DELETE FROM stats_daily;
+            DELETE FROM stats_tables;
+            DELETE FROM stats_menu_items;
+            FOR q IN SELECT reservations_stats_sql('SELECT r.*, 1 AS sign FROM reservations r') LOOP
+                EXECUTE q;
+            END LOOP;
+        END
+        $$ LANGUAGE plpgsql;
+    """),
+]
+
+# Горячие запросы приложения и индекс, который они должны использовать
+HOT_QUERIES = [
+    ("occupied", "table_usage_slot_key",
+     "SELECT DISTINCT table_id FROM table_usage WHERE branch = %s AND date = %s ORDER BY table_id",
+     ("Main", "2025-01-01")),
+    ("availability", "table_usage_slot_key",
+     "SELECT branch, date, array_agg(DISTINCT table_id) FROM table_usage"
+     " WHERE branch = ANY(%s) AND date BETWEEN %s AND %s GROUP BY branch, date ORDER BY branch, date",
+     (["Main"], "2025-01-01", "2025-03-31")),
+    ("cancel_release", "table_usage_reservation_idx",
+     "DELETE FROM table_usage WHERE reservation_id = ANY(%s)",
+     ([1, 2],)),
+    ("admin_status_filter", "reservations_branch_date_idx",
+     "SELECT id, status FROM reservations WHERE branch = %s AND date = %s"
+     " AND status = %s ORDER BY id FOR UPDATE",
+     ("Main", "2025-01-01", "pending")),
+    ("stats_daily", "stats_daily_pkey",
+     "SELECT branch, date, pending, confirmed, cancelled, guests, tables FROM stats_daily"
+     " WHERE branch = ANY(%s) AND date BETWEEN %s AND %s",
+     (["Main"], "2025-01-01", "2025-12-31")),
+    ("stats_tables", "stats_tables_pkey",
+     "SELECT branch, table_id, sum(bookings) FROM stats_tables"
+     " WHERE branch = ANY(%s) AND month BETWEEN %s AND %s GROUP BY branch, table_id",
+     (["Main"], "2025-01-01", "2025-12-01")),
+    ("branch_day_reservations", "reservations_branch_date_idx",
+     "SELECT tables FROM reservations WHERE branch = %s AND date = %s AND status != 'cancelled'",
+     ("Main", "2025-01-01")),
+    ("user_bookings", "reservations_user_email_idx",
+     "SELECT id, date, branch, guests, menu_items, status FROM reservations"
+     " WHERE user_email = %s ORDER BY date DESC",
+     ("guest@example.com",)),
+    ("admin_bookings_page", "reservations_created_idx",
+     "SELECT * FROM reservations ORDER BY created_at DESC, id DESC LIMIT %s",
+     (101,)),
+    ("verify_email", "email_codes_email_key",
+     "SELECT code, expires_at <= NOW() FROM email_codes WHERE email = %s FOR UPDATE",
+     ("guest@example.com",)),
+    ("purge_email_codes", "email_codes_expires_idx",
+     "DELETE FROM email_codes WHERE expires_at <= NOW()",
+     ()),
+    ("email_job_status", "email_jobs_pkey",
+     "SELECT id, status, attempts, error FROM email_jobs WHERE id = %s",
+     ("0" * 32,)),
+    ("purge_email_jobs", "email_jobs_created_idx",
+     "DELETE FROM email_jobs WHERE created_at < NOW() - %s::interval",
+     ("24 hours",)),
+    ("session", "sessions_pkey",
+     "SELECT data, expires_at FROM sessions WHERE id = %s AND expires_at > NOW()",
+     ("x" * 43,)),
+    ("google_login", "users_google_id_key",
+     "SELECT id, name, email FROM users WHERE google_id = %s",
+     ("1234567890",)),
+    ("login", "users_email_key",
+     "SELECT * FROM users WHERE email = %s",
+     ("guest@example.com",)),
+]
+
+
+def _ensure_version_table(cur):
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS schema_migrations (
+            version INTEGER PRIMARY KEY,
+            name TEXT NOT NULL,
+            applied_at TIMESTAMP DEFAULT NOW()
+        )
+    """)
+
+
+def applied_versions(conn):
+    cur = conn.cursor()
+    _ensure_version_table(cur)
+    cur.execute("SELECT version FROM schema_migrations")
+    versions = {row[0] for row in cur.fetchall()}
+    conn.commit()
+    return versions
+
+
+def pending(conn):
+    done = applied_versions(conn)
+    return [m for m in MIGRATIONS if m[0] not in done]
+
+
+def upgrade(conn):
+    """Применяет ожидающие миграции, каждую в своей транзакции. Возвращает их номера."""
+    cur = conn.cursor()
+    cur.execute("SELECT pg_advisory_lock(%s)", (LOCK_ID,))
+    try:
+        applied = []
+        for version, name, sql in pending(conn):
+            try:
+                cur.execute(sql)
+                cur.execute("INSERT INTO schema_migrations (version, name) VALUES (%s, %s)",
+                            (version, name))
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+            print("migration %03d_%s applied" % (version, name))
+            applied.append(version)
+        return applied
+    finally:
+        cur.execute("SELECT pg_advisory_unlock(%s)", (LOCK_ID,))
+        conn.commit()
+
+
+def _index_names(plan):
+    names = set()
+    if "Index Name" in plan:
+        names.add(plan["Index Name"])
+    for child in plan.get("Plans", ()):
+        names |= _index_names(child)
+    return names
+
+
+def check_indexes(conn):
+    """
+    Проверяет через EXPLAIN, что горячие запросы могут идти по своим индексам.
+    Последовательное сканирование запрещается (enable_seqscan = off), чтобы
+    результат не зависел от размера таблиц на тестовой базе.
+    Возвращает список (name, index, ok, used_indexes).
+    """
+    results = []
+    cur = conn.cursor()
+    try:
+        cur.execute("SET LOCAL enable_seqscan = off")
+        for name, index, sql, params in HOT_QUERIES:
+            cur.execute("EXPLAIN (FORMAT JSON) " + sql, params)
+            plan = cur.fetchone()[0]
+            if isinstance(plan, str):
+                plan = json.loads(plan)
+            used = _index_names(plan[0]["Plan"])
+            results.append((name, index, index in used, sorted(used)))
+    finally:
+        conn.rollback()
+    return results
+
+
+if __name__ == "__main__":
+    from dotenv import load_dotenv
+    from db import db_connection
+
+    load_dotenv()
+    command = sys.argv[1] if len(sys.argv) > 1 else "upgrade"
+
+    with db_connection() as conn:
+        if command == "upgrade":
+            applied = upgrade(conn)
+            print("applied: %s" % (applied or "nothing, schema is up to date"))
+        elif command == "status":
+            done = applied_versions(conn)
+            for version, name, _ in MIGRATIONS:
+                print("%03d_%s: %s" % (version, name, "applied" if version in done else "pending"))
+        elif command == "check":
+            failed = 0
+            for name, index, ok, used in check_indexes(conn):
+                failed += not ok
+                print("%-26s %-32s %s %s" % (name, index, "OK  " if ok else "MISS", used))
+            sys.exit(1 if failed else 0)
+        else:
+            print("usage: python migrations.py [upgrade|status|check]")
+            sys.exit(2)
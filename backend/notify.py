@@ -0,0 +1,161 @@
+"""
+Слушатель PostgreSQL LISTEN/NOTIFY для сброса кэшей во всех воркерах.
+
+У каждого процесса gunicorn свои кэши в памяти. Когда данные меняются
+(триггер или код вызывает pg_notify(канал, payload)), Postgres доставляет
+уведомление после коммита всем слушающим соединениям. Здесь одно отдельное
+(не из пула) соединение на процесс и фоновый поток, который раздаёт
+уведомления подписчикам:
+
+    listener = get_listener()
+    listener.subscribe("bookings_changed", on_change, on_reset)
+
+on_change(payload) вызывается на каждое уведомление, on_reset() — когда
+соединение потеряно или восстановлено: пропущенные за это время уведомления
+не узнать, поэтому подписчик должен сбросить всё. Пока listener.connected
+ложно, кэшам нельзя доверять.
+"""
+import logging
+import os
+import select
+import threading
+
+import psycopg2
+import psycopg2.extensions
+
+from db import db_config
+
+log = logging.getLogger(__name__)
+
+
+class NotifyListener:
+    def __init__(self, conn_kwargs=None, reconnect_delay=1.0, max_delay=30.0):
+        self.conn_kwargs = conn_kwargs
+        self.reconnect_delay = reconnect_delay
+        self.max_delay = max_delay
+        self.connected = False
+        self.notifications = 0
+        self.reconnects = 0
+        self._subscribers = {}    # канал -> [(on_change, on_reset)]
+        self._lock = threading.Lock()
+        self._stopping = threading.Event()
+        self._conn = None
+        self._thread = None
+
+    def subscribe(self, channel, on_change, on_reset=None):
+        with self._lock:
+            self._subscribers.setdefault(channel, []).append((on_change, on_reset))
+            conn = self._conn
+        if conn is not None:
+            # поток уже слушает другие каналы — переподключимся с новым списком
+            self._disconnect(conn)
+        self.start()
+
+    def start(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._stopping.clear()
+                self._thread = threading.Thread(target=self._run, name="pg-notify", daemon=True)
+                self._thread.start()
+
+    def stop(self):
+        self._stopping.set()
+        conn = self._conn
+        if conn is not None:
+            self._disconnect(conn)
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+
+    def stats(self):
+        return {"connected": self.connected, "notifications": self.notifications,
+                "reconnects": self.reconnects, "channels": sorted(self._subscribers)}
+
+    # ------------------- Фоновый поток -------------------
+    def _reset_all(self):
+        with self._lock:
+            callbacks = [on_reset for subs in self._subscribers.values() for _, on_reset in subs if on_reset]
+        for on_reset in callbacks:
+            on_reset()
+
+    def _connect(self):
+        conn = psycopg2.connect(**(self.conn_kwargs or db_config()))
+        conn.set_isolation_level(psycopg2.extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+        cur = conn.cursor()
+        with self._lock:
+            channels = list(self._subscribers)
+            self._conn = conn
+        for channel in channels:
+            cur.execute("LISTEN %s" % psycopg2.extensions.quote_ident(channel, cur))
+        return conn
+
+    def _disconnect(self, conn):
+        with self._lock:
+            if self._conn is conn:
+                self._conn = None
+        try:
+            conn.close()
+        except psycopg2.Error:
+            pass
+
+    def _run(self):
+        delay = self.reconnect_delay
+        while not self._stopping.is_set():
+            try:
+                conn = self._connect()
+            except psycopg2.Error as e:
+                log.warning("connect failed: %s", e)
+                if self._stopping.wait(delay):
+                    return
+                delay = min(delay * 2, self.max_delay)
+                continue
+            delay = self.reconnect_delay
+            self.connected = True
+            # всё, что кэшировалось до LISTEN, могло пропустить уведомления
+            self._reset_all()
+            try:
+                self._listen(conn)
+            except (psycopg2.Error, OSError, ValueError) as e:
+                if not self._stopping.is_set() and not conn.closed:
+                    log.warning("connection lost: %s", e)
+            finally:
+                self.connected = False
+                self._disconnect(conn)
+                self._reset_all()
+            self.reconnects += 1
+
+    def _listen(self, conn):
+        while not self._stopping.is_set() and not conn.closed:
+            if select.select([conn], [], [], 5.0) == ([], [], []):
+                # простой — проверим, что соединение живо
+                conn.cursor().execute("SELECT 1")
+                continue
+            conn.poll()
+            while conn.notifies:
+                note = conn.notifies.pop(0)
+                self.notifications += 1
+                with self._lock:
+                    subscribers = list(self._subscribers.get(note.channel, ()))
+                for on_change, _ in subscribers:
+                    try:
+                        on_change(note.payload)
+                    except Exception as e:
+                        log.exception("subscriber failed: %s", e)
+
+
+# ------------------- Слушатель текущего процесса -------------------
+_listener = None
+_listener_pid = None
+_listener_lock = threading.Lock()
+
+
+def get_listener():
+    """Слушатель процесса; поток и соединение не переживают fork, поэтому создаём после него."""
+    global _listener, _listener_pid
+    pid = os.getpid()
+    if _listener is not None and _listener_pid == pid:
+        return _listener
+    with _listener_lock:
+        if _listener is None or _listener_pid != pid:
+            _listener = NotifyListener()
+            _listener_pid = pid
+    return _listener
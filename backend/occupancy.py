@@ -0,0 +1,239 @@
+"""
+Индекс занятости столов (таблица table_usage).
+
+На каждый стол активной (не отменённой) брони хранится одна строка
+(reservation_id, branch, date, table_id). /occupied читает только её по
+индексу, не сканируя reservations и не разворачивая массивы.
+
+Уникальный индекс (branch, date, table_id) гарантирует, что стол на дату
+занят не более чем одной бронью: occupy() вставляет строки через
+ON CONFLICT DO NOTHING и возвращает столы, которые уже заняты. Конкурентные
+транзакции, претендующие на один стол, упорядочивает сам Postgres — на уровне
+строки индекса, без блокировки всего филиала.
+
+Индекс обновляется в той же транзакции, что и сама бронь:
+create_reservation / claim_pending — occupy(), смена статуса — apply_status()
+(по списку id) или update_status() (по фильтру, /admin/reservations/status).
+
+Проверка и перестройка из reservations:
+    python occupancy.py check
+    python occupancy.py rebuild
+"""
+import sys
+
+import psycopg2.extras
+
+# Строки индекса, которые должны быть, исходя из reservations.
+# Если стол (из старых данных) занят несколькими бронями, он принадлежит самой ранней.
+EXPECTED_SQL = """
+    SELECT DISTINCT ON (r.branch, r.date, t.table_id) r.id, r.branch, r.date, t.table_id
+    FROM reservations r, unnest(r.tables) AS t(table_id)
+    WHERE r.status != 'cancelled' AND t.table_id IS NOT NULL
+    ORDER BY r.branch, r.date, t.table_id, r.id
+"""
+ACTUAL_SQL = """
+    SELECT DISTINCT reservation_id, branch, date, table_id
+    FROM table_usage
+"""
+
+
+def occupy(cur, reservations):
+    """
+    Занимает столы броней в индексе.
+    reservations — список (reservation_id, branch, date, tables, guests).
+    Бронь получает либо все свои столы, либо ни одного: при споре за стол
+    выигрывает меньший id, а строки проигравших броней удаляются.
+    Если бронь проиграла только столы, которые освободились вместе с другими
+    проигравшими, она пробует ещё раз — пока что-то меняется.
+    Возвращает {reservation_id: [занятые другими столы]} для броней,
+    которым столы не достались (пустой словарь — всё занято успешно).
+    """
+    wanted = {}
+    for res_id, branch, date, tables, guests in reservations:
+        wanted[res_id] = (branch, date, list(dict.fromkeys(tables)), guests)
+
+    conflicts = {}
+    pending = list(wanted)
+    while pending:
+        lost = _claim(cur, [(res_id,) + wanted[res_id] for res_id in pending])
+        if not lost:
+            break
+        release(cur, list(lost))
+        conflicts.update(lost)
+        # столы, которые проигравшие успели занять и только что отдали
+        freed = {(wanted[res_id][0], wanted[res_id][1], t)
+                 for res_id, taken in lost.items() for t in wanted[res_id][2] if t not in taken}
+        # каждый круг меньший id из pending либо получает столы, либо выбывает — цикл конечен
+        pending = [res_id for res_id, taken in lost.items()
+                   if all((wanted[res_id][0], wanted[res_id][1], t) in freed for t in taken)]
+        for res_id in pending:
+            del conflicts[res_id]
+
+    if conflicts:
+        # столы, освобождённые проигравшими позже, занятыми уже не считаются
+        held = _held(cur, [(res_id,) + wanted[res_id][:3] for res_id in conflicts])
+        for res_id in conflicts:
+            conflicts[res_id] = [t for t in wanted[res_id][2] if t in held.get(res_id, ())] or conflicts[res_id]
+    return conflicts
+
+
+def _claim(cur, reservations):
+    """Один INSERT строк индекса; возвращает {reservation_id: [не доставшиеся столы]}."""
+    rows = []
+    for res_id, branch, date, tables, guests in reservations:
+        for table_id in tables:
+            rows.append((res_id, branch, date, table_id, guests))
+    if not rows:
+        return {}
+    # единый порядок вставки, чтобы встречные транзакции не взаимоблокировались;
+    # внутри одного стола первым идёт меньший id — он стол и получает
+    rows.sort(key=lambda r: (str(r[1]), str(r[2]), r[3], r[0]))
+
+    acquired = psycopg2.extras.execute_values(cur, """
+        INSERT INTO table_usage (reservation_id, branch, date, table_id, used_seats)
+        VALUES %s
+        ON CONFLICT (branch, date, table_id) DO NOTHING
+        RETURNING reservation_id, table_id
+    """, rows, page_size=len(rows), fetch=True)
+
+    got = {}
+    for res_id, table_id in acquired:
+        got.setdefault(res_id, set()).add(table_id)
+    lost = {}
+    for res_id, _, _, tables, _ in reservations:
+        taken = [t for t in tables if t not in got.get(res_id, ())]
+        if taken:
+            lost[res_id] = taken
+    return lost
+
+
+def _held(cur, reservations):
+    """Какие из столов броней (reservation_id, branch, date, tables) сейчас заняты в индексе."""
+    rows = [(res_id, branch, date, table_id)
+            for res_id, branch, date, tables in reservations for table_id in tables]
+    found = psycopg2.extras.execute_values(cur, """
+        SELECT w.res_id, w.table_id
+        FROM (VALUES %s) AS w(res_id, branch, date, table_id)
+        WHERE EXISTS (SELECT 1 FROM table_usage u
+                      WHERE u.branch = w.branch AND u.date = w.date AND u.table_id = w.table_id)
+    """, rows, page_size=len(rows), fetch=True)
+    held = {}
+    for res_id, table_id in found:
+        held.setdefault(res_id, set()).add(table_id)
+    return held
+
+
+def release(cur, reservation_ids):
+    """Убирает столы указанных броней из индекса."""
+    if reservation_ids:
+        cur.execute("DELETE FROM table_usage WHERE reservation_id = ANY(%s)", (list(reservation_ids),))
+
+
+def occupied_tables(cur, branch, date):
+    cur.execute("""
+        SELECT DISTINCT table_id FROM table_usage
+        WHERE branch = %s AND date = %s
+        ORDER BY table_id
+    """, (branch, date))
+    return [row[0] for row in cur.fetchall()]
+
+
+def apply_status(cur, reservation_ids, status):
+    """
+    Меняет статус броней одним UPDATE и поправляет индекс занятости:
+    отменённые брони освобождают столы, восстановленные из 'cancelled' — занимают.
+    Если столы восстанавливаемой брони уже заняты, она остаётся отменённой.
+    Возвращает (rows, conflicts): rows — строки
+    (id, old_status, branch, date, tables, guests, user_email) изменённых броней,
+    conflicts — {id: [занятые столы]} для не восстановленных.
+    """
+    if not reservation_ids:
+        return [], {}
+    return update_status(cur, ["id = ANY(%s)"], [list(reservation_ids)], status)
+
+
+def update_status(cur, where, params, status, changed_only=False):
+    """
+    apply_status() для броней по условию: where — условия SQL по reservations
+    (объединяются через AND), params — их параметры. Строки блокируются в
+    порядке id, поэтому встречные массовые смены статуса не взаимоблокируются.
+    changed_only — не трогать брони, у которых уже этот статус.
+    Индекс занятости правится одним DELETE / INSERT на все брони сразу.
+    """
+    where = list(where)
+    params = list(params)
+    if changed_only:
+        where.append("status IS DISTINCT FROM %s")
+        params.append(status)
+    cur.execute("""
+        WITH old AS (
+            SELECT id, status FROM reservations
+            WHERE %s
+            ORDER BY id
+            FOR UPDATE
+        )
+        UPDATE reservations r
+        SET status = %%s
+        FROM old
+        WHERE r.id = old.id
+        RETURNING r.id, old.status, r.branch, r.date, r.tables, r.guests, r.user_email
+    """ % " AND ".join(where), params + [status])
+    rows = cur.fetchall()
+
+    conflicts = {}
+    if status == "cancelled":
+        release(cur, [r[0] for r in rows if r[1] != "cancelled"])
+    else:
+        conflicts = occupy(cur, [(r[0], r[2], r[3], r[4], r[5]) for r in rows if r[1] == "cancelled"])
+        if conflicts:
+            cur.execute("UPDATE reservations SET status = 'cancelled' WHERE id = ANY(%s)",
+                        (list(conflicts),))
+            rows = [r for r in rows if r[0] not in conflicts]
+    return rows, conflicts
+
+
+def check_consistency(conn, rebuild=False):
+    """
+    Сравнивает table_usage с reservations.
+    Возвращает {"missing": N, "extra": M}: строк не хватает / лишние.
+    При rebuild=True и расхождениях индекс перестраивается целиком
+    (reservations на это время блокируются от записи).
+    """
+    cur = conn.cursor()
+    if rebuild:
+        cur.execute("LOCK TABLE reservations IN SHARE ROW EXCLUSIVE MODE")
+        cur.execute("LOCK TABLE table_usage IN EXCLUSIVE MODE")
+
+    cur.execute("SELECT count(*) FROM ((%s) EXCEPT (%s)) AS d" % (EXPECTED_SQL, ACTUAL_SQL))
+    missing = cur.fetchone()[0]
+    cur.execute("SELECT count(*) FROM ((%s) EXCEPT (%s)) AS d" % (ACTUAL_SQL, EXPECTED_SQL))
+    extra = cur.fetchone()[0]
+
+    result = {"missing": missing, "extra": extra, "rebuilt": False}
+    if rebuild and (missing or extra):
+        cur.execute("DELETE FROM table_usage")
+        cur.execute("""
+            INSERT INTO table_usage (reservation_id, branch, date, table_id, used_seats)
+            SELECT DISTINCT ON (r.branch, r.date, t.table_id) r.id, r.branch, r.date, t.table_id, r.guests
+            FROM reservations r, unnest(r.tables) AS t(table_id)
+            WHERE r.status != 'cancelled' AND t.table_id IS NOT NULL
+            ORDER BY r.branch, r.date, t.table_id, r.id
+        """)
+        result["rebuilt"] = True
+    return result
+
+
+if __name__ == "__main__":
+    from dotenv import load_dotenv
+    from db import db_connection
+
+    load_dotenv()
+    command = sys.argv[1] if len(sys.argv) > 1 else "check"
+    if command not in ("check", "rebuild"):
+        print("usage: python occupancy.py [check|rebuild]")
+        sys.exit(2)
+
+    with db_connection() as conn:
+        result = check_consistency(conn, rebuild=(command == "rebuild"))
+    print("table_usage: missing=%(missing)s extra=%(extra)s rebuilt=%(rebuilt)s" % result)
+    sys.exit(0 if command == "rebuild" or not (result["missing"] or result["extra"]) else 1)
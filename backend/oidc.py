@@ -0,0 +1,189 @@
+"""
+Вход через Google (OpenID Connect) без лишних запросов к Google.
+
+authlib сам проверяет подпись id_token по JWKS, но discovery и JWKS кэширует
+навсегда (до перезапуска воркера), а раньше /authorize после обмена кода ещё и
+ходил за userinfo. Здесь:
+
+- CachedOIDCApp — клиент authlib, у которого discovery и JWKS живут
+  max-age из Cache-Control ответа (или OIDC_METADATA_TTL / OIDC_JWKS_TTL, 1 ч).
+  Неизвестный kid (Google сменил ключи) — внеочередная загрузка JWKS, но не
+  чаще раза в OIDC_JWKS_MIN_REFRESH (60 с). Если провайдер недоступен, а копия
+  есть, работаем с копией и пробуем снова через минуту;
+- данные пользователя — из claims проверенного id_token (token["userinfo"]),
+  за один вход к Google уходит один запрос — обмен кода на токен;
+- upsert_google_user() — пользователь Google сохраняется в users
+  (google_id = sub), в сессии его id из users, как при входе по паролю;
+- google_client(app) — клиент регистрируется при первом входе через Google
+  (или в warm_up()); app.py импортирует этот модуль лениво, и authlib не
+  замедляет старт воркера.
+"""
+import logging
+import os
+import re
+import threading
+import time
+
+import requests
+from authlib.common.errors import AuthlibBaseError
+from authlib.integrations.flask_client import FlaskOAuth2App, OAuth
+from joserfc.errors import JoseError
+from psycopg2 import errors as pg_errors
+
+from metrics import REGISTRY, Counter
+
+log = logging.getLogger(__name__)
+
+OIDC_FETCHES = REGISTRY.register(Counter(
+    "oidc_fetches_total", "Загрузки discovery и JWKS провайдера", ("document", "result")))
+
+# ошибки входа: state/обмен кода (authlib), подпись и claims (joserfc, authlib), сеть
+LOGIN_ERRORS = (AuthlibBaseError, JoseError, requests.RequestException)
+
+_MAX_AGE_RE = re.compile(r"max-age=(\d+)")
+RETRY_AFTER_ERROR = 60.0
+
+_register_lock = threading.Lock()
+
+
+def _max_age(response, default):
+    match = _MAX_AGE_RE.search(response.headers.get("Cache-Control", ""))
+    return float(match.group(1)) if match else default
+
+
+class CachedOIDCApp(FlaskOAuth2App):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.metadata_ttl = float(os.getenv("OIDC_METADATA_TTL", "3600"))
+        self.jwks_ttl = float(os.getenv("OIDC_JWKS_TTL", "3600"))
+        self.jwks_min_refresh = float(os.getenv("OIDC_JWKS_MIN_REFRESH", "60"))
+        self._lock = threading.Lock()
+        self._metadata_expires = 0.0
+        self._jwks_expires = 0.0
+        self._jwks_forced_at = 0.0
+
+    def _fetch(self, document, url):
+        with self._get_session() as session:
+            try:
+                response = session.request("GET", url, withhold_token=True, timeout=10)
+                response.raise_for_status()
+                data = response.json()
+            except (requests.RequestException, ValueError):
+                OIDC_FETCHES.inc(document, "error")
+                raise
+        OIDC_FETCHES.inc(document, "ok")
+        return data, response
+
+    def load_server_metadata(self):
+        if not self._server_metadata_url or time.monotonic() < self._metadata_expires:
+            return self.server_metadata
+        with self._lock:
+            if time.monotonic() >= self._metadata_expires:
+                try:
+                    metadata, response = self._fetch("discovery", self._server_metadata_url)
+                except (requests.RequestException, ValueError) as e:
+                    if "_loaded_at" not in self.server_metadata:
+                        raise
+                    log.warning("discovery failed, using cached: %s", e)
+                    self._metadata_expires = time.monotonic() + RETRY_AFTER_ERROR
+                    return self.server_metadata
+                if metadata.get("jwks_uri") != self.server_metadata.get("jwks_uri"):
+                    self.server_metadata.pop("jwks", None)
+                metadata["_loaded_at"] = time.time()
+                self.server_metadata.update(metadata)
+                self._metadata_expires = time.monotonic() + _max_age(response, self.metadata_ttl)
+        return self.server_metadata
+
+    def fetch_jwk_set(self, force=False):
+        metadata = self.load_server_metadata()
+        now = time.monotonic()
+        cached = metadata.get("jwks")
+        if cached and force and now - self._jwks_forced_at < self.jwks_min_refresh:
+            # неизвестный kid в каждом запросе не должен превращаться в запрос к Google
+            force = False
+        if cached and not force and now < self._jwks_expires:
+            return cached
+        with self._lock:
+            cached = self.server_metadata.get("jwks")
+            if cached and not force and time.monotonic() < self._jwks_expires:
+                return cached
+            uri = self.server_metadata.get("jwks_uri")
+            if not uri:
+                raise RuntimeError('Missing "jwks_uri" in metadata')
+            if force:
+                self._jwks_forced_at = time.monotonic()
+            try:
+                jwk_set, response = self._fetch("jwks", uri)
+            except (requests.RequestException, ValueError) as e:
+                if not cached:
+                    raise
+                log.warning("jwks failed, using cached: %s", e)
+                self._jwks_expires = time.monotonic() + RETRY_AFTER_ERROR
+                return cached
+            self.server_metadata["jwks"] = jwk_set
+            self._jwks_expires = time.monotonic() + _max_age(response, self.jwks_ttl)
+        return jwk_set
+
+
+def google_client(app):
+    """Клиент Google приложения (CachedOIDCApp); создаётся один раз, при первом вызове."""
+    client = app.extensions.get("google_oidc")
+    if client is None:
+        with _register_lock:
+            client = app.extensions.get("google_oidc")
+            if client is None:
+                client = OAuth(app).register(
+                    name="google",
+                    client_cls=CachedOIDCApp,
+                    client_id=app.config["GOOGLE_CLIENT_ID"],
+                    client_secret=app.config["GOOGLE_CLIENT_SECRET"],
+                    server_metadata_url=app.config["GOOGLE_DISCOVERY_URL"],
+                    client_kwargs={"scope": "openid email profile"},
+                )
+                app.extensions["google_oidc"] = client
+    return client
+
+
+def _user_by_google_id(cur, sub):
+    cur.execute("SELECT id, name, email FROM users WHERE google_id = %s", (sub,))
+    return cur.fetchone()
+
+
+def upsert_google_user(cur, claims):
+    """
+    Находит или создаёт пользователя по claims id_token. Возвращает
+    {"id", "name", "email"} или None, если email уже привязан к другому
+    аккаунту Google. Существующий аккаунт с тем же email привязывается
+    к Google (email у Google подтверждён). Если он не был подтверждён,
+    владение email доказано только сейчас: пароль и имя могли задать чужие
+    (регистрация на чужой адрес заранее), поэтому пароль сбрасывается, а имя
+    берётся из Google. Коммит — на вызывающем.
+    """
+    row = _user_by_google_id(cur, claims["sub"])
+    if row is None:
+        # два первых входа одновременно (двойной редирект, две вкладки) оба не
+        # находят пользователя; второй INSERT упрётся в уникальный google_id
+        # или в уже привязанный email — тогда берём строку, созданную первым
+        cur.execute("SAVEPOINT google_user")
+        try:
+            cur.execute("""
+                INSERT INTO users (name, email, verified, google_id)
+                VALUES (%s, %s, TRUE, %s)
+                ON CONFLICT (email) DO UPDATE
+                SET google_id = EXCLUDED.google_id, verified = TRUE,
+                    password = CASE WHEN users.verified THEN users.password END,
+                    name = CASE WHEN users.verified THEN COALESCE(users.name, EXCLUDED.name)
+                                ELSE EXCLUDED.name END
+                WHERE users.google_id IS NULL
+                RETURNING id, name, email
+            """, (claims.get("name"), claims["email"], claims["sub"]))
+            row = cur.fetchone()
+        except pg_errors.UniqueViolation:
+            cur.execute("ROLLBACK TO SAVEPOINT google_user")
+        else:
+            cur.execute("RELEASE SAVEPOINT google_user")
+        if row is None:
+            row = _user_by_google_id(cur, claims["sub"])
+        if row is None:
+            return None
+    return {"id": row[0], "name": row[1], "email": row[2]}
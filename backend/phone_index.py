@@ -0,0 +1,131 @@
+"""
+Индекс телефонов для /search_booking.
+
+Номера нормализуются до цифр в едином виде (+7 701..., 8 701... и 701...
+дают 7701...). Хранится:
+- словарь «нормализованный номер -> брони» для точного совпадения;
+- отсортированный список всех суффиксов номеров: поиск подстроки —
+  это бинарный поиск по префиксу суффикса, O(log n + k) вместо полного
+  перебора броней. Новые суффиксы копятся в небольшом отдельном списке
+  и сливаются с основным, когда он вырастает (чтобы не сдвигать
+  большой список на каждую бронь).
+
+Индекс строится один раз и затем дочитывает только новые строки журнала
+(BookingLog.read_since), поэтому /book не требует перестройки.
+"""
+import bisect
+import re
+import threading
+
+_NON_DIGITS = re.compile(r"\D+")
+
+
+def normalize_phone(phone):
+    """Цифры номера в каноническом виде: 8XXXXXXXXXX и XXXXXXXXXX -> 7XXXXXXXXXX."""
+    digits = _NON_DIGITS.sub("", str(phone or ""))
+    if len(digits) == 11 and digits[0] == "8":
+        return "7" + digits[1:]
+    if len(digits) == 10:
+        return "7" + digits
+    return digits
+
+
+def query_variants(query):
+    """
+    Варианты запроса для поиска подстроки: как ввели, в каноническом виде
+    и с заменой ведущей 8 на 7 (хосты часто набирают номер с 8).
+    """
+    digits = _NON_DIGITS.sub("", str(query or ""))
+    if not digits:
+        return []
+    variants = {digits, normalize_phone(digits)}
+    if digits[0] == "8":
+        variants.add("7" + digits[1:])
+    return sorted(variants)
+
+
+class PhoneIndex:
+    def __init__(self, booking_log):
+        self.log = booking_log
+        self.records = []
+        self._exact = {}        # номер -> [позиции в records]
+        self._suffixes = []     # отсортированные строки "суффикс|позиция"
+        self._recent = []       # то же для недавно добавленных, сливается с _suffixes
+        self._offset = 0
+        self._identity = None
+        self._lock = threading.Lock()
+
+    def _reset(self):
+        self.records = []
+        self._exact = {}
+        self._suffixes = []
+        self._recent = []
+
+    def _add(self, records, bulk):
+        new_suffixes = []
+        for record in records:
+            pos = len(self.records)
+            self.records.append(record)
+            phone = normalize_phone(record.get("phone")) if isinstance(record, dict) else ""
+            if not phone:
+                continue
+            self._exact.setdefault(phone, []).append(pos)
+            tail = "|%d" % pos
+            for i in range(len(phone)):
+                new_suffixes.append(phone[i:] + tail)
+
+        if bulk:
+            self._suffixes.extend(new_suffixes)
+            self._suffixes.sort()
+            return
+        for item in new_suffixes:
+            bisect.insort(self._recent, item)
+        if len(self._recent) > max(4096, len(self._suffixes) // 16):
+            self._suffixes.extend(self._recent)
+            self._suffixes.sort()
+            self._recent = []
+
+    def refresh(self):
+        """Дочитывает новые брони из журнала (или перестраивает индекс после clear/compact)."""
+        with self._lock:
+            records, offset, identity, reset = self.log.read_since(self._offset, self._identity)
+            if reset:
+                self._reset()
+            if records:
+                self._add(records, bulk=reset)
+            self._offset = offset
+            self._identity = identity
+
+    def _lookup_exact(self, phone):
+        return list(self._exact.get(phone, ()))
+
+    @staticmethod
+    def _scan(suffixes, digits, found):
+        i = bisect.bisect_left(suffixes, digits)
+        while i < len(suffixes):
+            item = suffixes[i]
+            if not item.startswith(digits):
+                break
+            found.add(int(item[item.index("|") + 1:]))
+            i += 1
+
+    def _lookup_substring(self, digits):
+        found = set()
+        self._scan(self._suffixes, digits, found)
+        self._scan(self._recent, digits, found)
+        return found
+
+    def search(self, query, exact=False):
+        """
+        Брони, номер которых содержит query (или совпадает с ним при exact=True),
+        в порядке добавления.
+        """
+        self.refresh()
+        with self._lock:
+            if exact:
+                positions = self._lookup_exact(normalize_phone(query))
+            else:
+                positions = set()
+                for variant in query_variants(query):
+                    positions |= self._lookup_substring(variant)
+            return [self.records[pos] for pos in sorted(positions)]
@@ -0,0 +1,76 @@
+"""
+Создание броней: общая проверка входных данных и вставка.
+
+Используется /reservation, /pending/claim и пакетным /reservations/batch,
+чтобы правила проверки и запись в индекс занятости были одни и те же.
+"""
+from datetime import date as date_cls
+
+import psycopg2.extras
+
+from occupancy import occupy
+
+REQUIRED_FIELDS = ["user_email", "branch", "date", "tables", "guests"]
+
+
+def validate_reservation(data):
+    """
+    Проверяет бронь из JSON.
+    Возвращает (row, None) или (None, текст ошибки), где row —
+    (user_email, branch, date, tables, guests, notes, menu_items).
+    """
+    if not isinstance(data, dict) or any(k not in data for k in REQUIRED_FIELDS):
+        return None, "Заполнены не все обязательные поля"
+
+    for field in ("user_email", "branch"):
+        if not isinstance(data[field], str) or not data[field].strip():
+            return None, "%s должен быть непустой строкой" % field
+    notes = data.get("notes")
+    if notes is None:
+        notes = ""
+    if not isinstance(notes, str):
+        return None, "notes должен быть строкой"
+
+    tables = data["tables"]       # ["L4-1", "C6-1"]
+    if not isinstance(tables, list) or not tables or not all(isinstance(t, str) and t for t in tables):
+        return None, "tables должен быть непустым списком столов"
+
+    try:
+        date = date_cls.fromisoformat(str(data["date"]))
+        guests = int(data["guests"])
+    except (TypeError, ValueError):
+        return None, "Некорректные date (YYYY-MM-DD) или guests"
+    if guests < 1:
+        return None, "guests должен быть больше нуля"
+
+    menu_items = data.get("menu_items") or []
+    if not isinstance(menu_items, list) or not all(isinstance(m, str) for m in menu_items):
+        return None, "menu_items должен быть списком строк"
+
+    row = (data["user_email"], data["branch"], date, tables, guests, notes, menu_items)
+    return row, None
+
+
+def insert_reservations(cur, rows):
+    """
+    Вставляет брони одним многострочным INSERT и атомарно занимает их столы.
+    Брони, чьи столы уже заняты (в том числе более ранней бронью того же
+    пакета), удаляются в той же транзакции; стол, который такая бронь
+    освободила, достаётся следующей по порядку.
+    Возвращает список (reservation_id или None, занятые столы) в порядке rows.
+    Коммит — на вызывающем.
+    """
+    if not rows:
+        return []
+    returned = psycopg2.extras.execute_values(cur, """
+        INSERT INTO reservations (user_email, branch, date, tables, guests, notes, menu_items)
+        VALUES %s
+        RETURNING id
+    """, rows, page_size=len(rows), fetch=True)
+    ids = [r[0] for r in returned]
+
+    conflicts = occupy(cur, [(res_id, row[1], row[2], row[3], row[4]) for res_id, row in zip(ids, rows)])
+    if conflicts:
+        # столы этих броней occupy() уже освободил
+        cur.execute("DELETE FROM reservations WHERE id = ANY(%s)", (list(conflicts),))
+    return [(None, conflicts[res_id]) if res_id in conflicts else (res_id, []) for res_id in ids]
@@ -0,0 +1,268 @@
+"""
+Серверные сессии.
+
+Стандартная сессия Flask — подписанная cookie: всё её содержимое (пользователь,
+pending_booking со столами, заметками и блюдами) браузер отправляет с каждым
+запросом, включая /static и /menu, а сервер каждый раз проверяет подпись.
+Здесь cookie содержит только случайный id, а данные лежат в хранилище:
+
+    SESSION_BACKEND=postgres  — таблица sessions (общая для всех воркеров gunicorn);
+    SESSION_BACKEND=memory    — LRU в памяти процесса (один процесс / разработка);
+    SESSION_BACKEND=cookie    — прежняя подписанная cookie Flask.
+
+Данные читаются из хранилища только при первом обращении к session в запросе,
+поэтому запросы к статике и меню хранилище не трогают. Время жизни скользящее:
+PERMANENT_SESSION_LIFETIME для постоянных сессий, SESSION_IDLE_TIMEOUT для
+остальных; продление записывается не чаще, чем раз в половину срока.
+
+При входе и выходе вызывается regenerate_session(): данные переезжают под
+новый id, а старая запись удаляется. Иначе id, известный до входа (например,
+подброшенный чужой cookie), после входа давал бы доступ к аккаунту.
+"""
+import os
+import re
+import secrets
+import threading
+import time
+from collections import OrderedDict
+from datetime import timedelta
+
+from flask.sessions import SecureCookieSessionInterface, SessionInterface, SessionMixin, session_json_serializer
+
+from db import db_connection
+
+SID_RE = re.compile(r"^[A-Za-z0-9_-]{43}$")   # secrets.token_urlsafe(32)
+
+
+class ServerSideSession(SessionMixin):
+    """Сессия, которая загружает данные из хранилища при первом обращении."""
+
+    def __init__(self, sid=None, loader=None):
+        self.sid = sid
+        self.new = sid is None
+        self.modified = False
+        self.accessed = False
+        self.expires_at = None     # срок записи в хранилище (unix time), если загружена
+        self.rotated_from = None   # прежний id после regenerate() — удаляется при сохранении
+        self._loader = loader
+        self._data = None if loader else {}
+
+    def _load(self):
+        self.accessed = True
+        if self._data is None:
+            record = self._loader()
+            if record is None:
+                # id устарел или подделан — начинаем новую сессию
+                self.sid, self.new, self._data = None, True, {}
+            else:
+                raw, self.expires_at = record
+                self._data = session_json_serializer.loads(raw)
+        return self._data
+
+    @property
+    def loaded(self):
+        return self._data is not None
+
+    def __getitem__(self, key):
+        return self._load()[key]
+
+    def __setitem__(self, key, value):
+        self._load()[key] = value
+        self.modified = True
+
+    def __delitem__(self, key):
+        del self._load()[key]
+        self.modified = True
+
+    def __iter__(self):
+        return iter(self._load())
+
+    def __len__(self):
+        return len(self._load())
+
+    def dumps(self):
+        return session_json_serializer.dumps(self._load())
+
+    def regenerate(self):
+        """Новый id для тех же данных; прежняя запись удалится в save_session."""
+        self._load()
+        if self.sid is not None:
+            self.rotated_from = self.rotated_from or self.sid
+        self.sid, self.new, self.modified = None, True, True
+
+
+# ------------------- Хранилища -------------------
+class MemorySessionStore:
+    """LRU с TTL в памяти процесса. Между воркерами gunicorn не разделяется."""
+
+    def __init__(self, max_entries=10000):
+        self.max_entries = max_entries
+        self._items = OrderedDict()   # sid -> (expires_at, data)
+        self._lock = threading.Lock()
+        self.evictions = 0
+
+    def get(self, sid):
+        with self._lock:
+            item = self._items.get(sid)
+            if item is None:
+                return None
+            if item[0] <= time.time():
+                del self._items[sid]
+                return None
+            self._items.move_to_end(sid)
+            return item[1], item[0]
+
+    def set(self, sid, data, ttl):
+        with self._lock:
+            self._items[sid] = (time.time() + ttl, data)
+            self._items.move_to_end(sid)
+            while len(self._items) > self.max_entries:
+                self._items.popitem(last=False)
+                self.evictions += 1
+
+    def touch(self, sid, ttl):
+        with self._lock:
+            item = self._items.get(sid)
+            if item is not None:
+                self._items[sid] = (time.time() + ttl, item[1])
+
+    def delete(self, sid):
+        with self._lock:
+            self._items.pop(sid, None)
+
+    def stats(self):
+        return {"backend": "memory", "sessions": len(self._items),
+                "max_entries": self.max_entries, "evictions": self.evictions}
+
+
+class PostgresSessionStore:
+    """
+    Таблица sessions (миграция 005): общая для всех воркеров.
+    Просроченные строки удаляются раз в purge_every записей.
+    """
+
+    def __init__(self, purge_every=1000):
+        self.purge_every = purge_every
+        self._writes = 0
+        self._lock = threading.Lock()
+
+    def get(self, sid):
+        with db_connection() as conn:
+            cur = conn.cursor()
+            cur.execute("SELECT data, expires_at FROM sessions WHERE id = %s AND expires_at > NOW()", (sid,))
+            row = cur.fetchone()
+        if row is None:
+            return None
+        return row[0], row[1].timestamp()
+
+    def set(self, sid, data, ttl):
+        with db_connection() as conn:
+            cur = conn.cursor()
+            cur.execute("""
+                INSERT INTO sessions (id, data, expires_at)
+                VALUES (%s, %s, NOW() + %s)
+                ON CONFLICT (id) DO UPDATE SET data = EXCLUDED.data, expires_at = EXCLUDED.expires_at
+            """, (sid, data, timedelta(seconds=ttl)))
+            if self._count_write():
+                cur.execute("DELETE FROM sessions WHERE expires_at <= NOW()")
+
+    def touch(self, sid, ttl):
+        with db_connection() as conn:
+            conn.cursor().execute("UPDATE sessions SET expires_at = NOW() + %s WHERE id = %s",
+                                  (timedelta(seconds=ttl), sid))
+
+    def delete(self, sid):
+        with db_connection() as conn:
+            conn.cursor().execute("DELETE FROM sessions WHERE id = %s", (sid,))
+
+    def _count_write(self):
+        with self._lock:
+            self._writes += 1
+            return self._writes % self.purge_every == 0
+
+    def stats(self):
+        with db_connection() as conn:
+            cur = conn.cursor()
+            cur.execute("SELECT count(*) FROM sessions WHERE expires_at > NOW()")
+            return {"backend": "postgres", "sessions": cur.fetchone()[0]}
+
+
+# ------------------- Интерфейс для Flask -------------------
+class ServerSessionInterface(SessionInterface):
+    def __init__(self, store):
+        self.store = store
+
+    def _ttl(self, app, session):
+        if session.permanent:
+            return app.permanent_session_lifetime.total_seconds()
+        return app.config.get("SESSION_IDLE_TIMEOUT", timedelta(hours=24)).total_seconds()
+
+    def open_session(self, app, request):
+        sid = request.cookies.get(self.get_cookie_name(app))
+        if not sid or not SID_RE.match(sid):
+            return ServerSideSession()
+        return ServerSideSession(sid, loader=lambda: self.store.get(sid))
+
+    def save_session(self, app, session, response):
+        name = self.get_cookie_name(app)
+        domain = self.get_cookie_domain(app)
+        path = self.get_cookie_path(app)
+
+        if session.accessed:
+            response.vary.add("Cookie")
+        if not session.loaded:
+            return
+        if session.rotated_from is not None:
+            self.store.delete(session.rotated_from)
+
+        if not session:
+            if (session.sid is not None or session.rotated_from is not None) and session.modified:
+                if session.sid is not None:
+                    self.store.delete(session.sid)
+                response.delete_cookie(name, domain=domain, path=path,
+                                       secure=self.get_cookie_secure(app),
+                                       samesite=self.get_cookie_samesite(app),
+                                       httponly=self.get_cookie_httponly(app))
+            return
+
+        ttl = self._ttl(app, session)
+        if session.modified or session.new:
+            if session.sid is None:
+                session.sid = secrets.token_urlsafe(32)
+            self.store.set(session.sid, session.dumps(), ttl)
+        elif session.expires_at is not None and session.expires_at - time.time() < ttl / 2:
+            self.store.touch(session.sid, ttl)
+        else:
+            return
+
+        response.set_cookie(
+            name,
+            session.sid,
+            expires=self.get_expiration_time(app, session),
+            httponly=self.get_cookie_httponly(app),
+            domain=domain,
+            path=path,
+            secure=self.get_cookie_secure(app),
+            samesite=self.get_cookie_samesite(app),
+        )
+
+
+def regenerate_session(session):
+    """
+    Меняет id серверной сессии при смене уровня доступа (вход, выход).
+    Подписанной cookie (SESSION_BACKEND=cookie) это не нужно: её содержимое
+    и так меняется вместе с данными.
+    """
+    if isinstance(session, ServerSideSession):
+        session.regenerate()
+
+
+def make_session_interface(backend=None):
+    backend = backend or os.getenv("SESSION_BACKEND", "postgres")
+    if backend == "cookie":
+        return SecureCookieSessionInterface()
+    if backend == "memory":
+        return ServerSessionInterface(MemorySessionStore(int(os.getenv("SESSION_MAX_ENTRIES", "10000"))))
+    if backend == "postgres":
+        return ServerSessionInterface(PostgresSessionStore())
+    raise ValueError("Неизвестный SESSION_BACKEND: %s" % backend)
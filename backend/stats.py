@@ -0,0 +1,259 @@
+"""
+Отчёт для панели администратора: /admin/stats?from=&to=&branch=&group=
+
+Раньше для отчёта выгружали /admin/bookings и считали вручную. Теперь брони
+сворачиваются в агрегаты (миграции 011, 013):
+
+- stats_daily (branch, date) — брони по статусам, гости и столы неотменённых броней;
+- stats_tables (branch, month, table_id) — сколько раз бронировали стол;
+- stats_menu_items (branch, month, item) — предзаказы блюд.
+
+Триггер на reservations только дописывает изменённые строки в очередь
+stats_changes: запись брони не ждёт общих строк агрегатов. В агрегаты их
+сворачивает reservations_stats_fold() — перед каждым отчётом (fold) и по cron,
+чтобы очередь не росла:
+    python stats.py fold
+
+Отчёт читает одну строку на филиал (ряды по дням массивами) и помесячные
+счётчики, остальное считает numpy без циклов по дням: ряды по дням, неделям
+или месяцам, средний размер компании, профиль по дням недели, пиковые дни,
+самые популярные столы и блюда. Столы и блюда считаются помесячно, поэтому
+для них диапазон расширяется до целых месяцев (top_from / top_to в ответе).
+
+    {"from": "2025-01-01", "to": "2025-12-31", "group": "week",
+     "branches": {"Абая 150": {"bookings": 4210, "guests": 11630, "avg_party": 2.76, ...}},
+     "total": {...}}
+
+Пересчёт агрегатов из reservations (если их правили в обход триггера):
+    python stats.py rebuild
+"""
+import os
+import sys
+from datetime import date as date_cls, timedelta
+
+import numpy as np
+
+STATS_MAX_DAYS = int(os.getenv("STATS_MAX_DAYS", "7320"))
+STATS_DEFAULT_DAYS = 30
+GROUPS = ("day", "week", "month")
+TOP_N = 10
+PEAK_DAYS = 5
+
+# строки матрицы дня: столбцы stats_daily в том же порядке
+PENDING, CONFIRMED, CANCELLED, GUESTS, TABLES = range(5)
+# 1970-01-05 — понедельник: (дни от эпохи - 4) // 7 — номер недели с понедельника
+_MONDAY = np.datetime64("1970-01-05", "D")
+
+
+def parse_stats_args(args, today=None):
+    """
+    from/to (по умолчанию — последние 30 дней) и group из query-строки.
+    group по умолчанию: day до 92 дней, week до двух лет, дальше month.
+    Возвращает (date_from, date_to, group, None) или (None, None, None, ошибка).
+    """
+    today = today or date_cls.today()
+    try:
+        date_to = date_cls.fromisoformat(args["to"]) if args.get("to") else today
+        date_from = (date_cls.fromisoformat(args["from"]) if args.get("from")
+                     else date_to - timedelta(days=STATS_DEFAULT_DAYS - 1))
+    except ValueError:
+        return None, None, None, "from и to в формате YYYY-MM-DD"
+    if date_to < date_from:
+        return None, None, None, "to раньше from"
+    days = (date_to - date_from).days + 1
+    if days > STATS_MAX_DAYS:
+        return None, None, None, "Диапазон не больше %d дней" % STATS_MAX_DAYS
+    group = args.get("group") or ("day" if days <= 92 else "week" if days <= 731 else "month")
+    if group not in GROUPS:
+        return None, None, None, "group: одно из " + ", ".join(GROUPS)
+    return date_from, date_to, group, None
+
+
+def _branch_filter(branches):
+    return (" AND branch = ANY(%s)", [list(branches)]) if branches else ("", [])
+
+
+def load_daily(cur, branches, date_from, date_to):
+    """{branch: (дни от date_from, матрица 5 x дни)} — одна строка на филиал, ряды массивами."""
+    where, params = _branch_filter(branches)
+    cur.execute("""
+        SELECT branch, array_agg(date - %%s ORDER BY date),
+               array_agg(ARRAY[pending, confirmed, cancelled, guests, tables] ORDER BY date)
+        FROM stats_daily
+        WHERE date BETWEEN %%s AND %%s%s
+        GROUP BY branch
+    """ % where, [date_from, date_from, date_to] + params)
+    return {branch: (np.array(offsets, dtype=np.int64), np.array(values, dtype=np.int64).reshape(-1, 5).T)
+            for branch, offsets, values in cur.fetchall()}
+
+
+def load_counts(cur, table, column, value, branches, month_from, month_to):
+    """{branch: (имена, счётчики)} помесячного агрегата за месяцы month_from..month_to."""
+    where, params = _branch_filter(branches)
+    cur.execute("""
+        SELECT branch, %s, sum(%s) FROM %s
+        WHERE month BETWEEN %%s AND %%s%s
+        GROUP BY branch, %s
+        HAVING sum(%s) > 0
+        ORDER BY branch, %s
+    """ % (column, value, table, where, column, value, column), [month_from, month_to] + params)
+    grouped = {}
+    for branch, name, count in cur.fetchall():
+        names, counts = grouped.setdefault(branch, ([], []))
+        names.append(name)
+        counts.append(count)
+    return {branch: (np.array(names, dtype=object), np.array(counts, dtype=np.int64))
+            for branch, (names, counts) in grouped.items()}
+
+
+def _top(names, counts, key, n=TOP_N):
+    if names is None or not len(counts):
+        return []
+    # stable: при равенстве — по имени (SQL отдаёт имена по алфавиту)
+    order = np.argsort(-counts, kind="stable")[:n]
+    return [{key: name, "count": count} for name, count in zip(names[order].tolist(), counts[order].tolist())]
+
+
+def _merge_counts(parts):
+    """Сумма счётчиков нескольких филиалов по именам."""
+    parts = [p for p in parts if len(p[1])]
+    if not parts:
+        return None, None
+    names, inverse = np.unique(np.concatenate([p[0] for p in parts]).astype(str), return_inverse=True)
+    counts = np.bincount(inverse, weights=np.concatenate([p[1] for p in parts]), minlength=len(names))
+    return names.astype(object), counts.astype(np.int64)
+
+
+class _Calendar:
+    """Дни диапазона и разбиение на периоды группировки — общее для всех филиалов."""
+
+    def __init__(self, date_from, date_to, group):
+        self.days = np.arange(np.datetime64(date_from, "D"), np.datetime64(date_to, "D") + 1)
+        self.weekday = (self.days - _MONDAY).astype(np.int64) % 7
+        self.weekday_count = np.bincount(self.weekday, minlength=7)
+        if group == "day":
+            keys, labels = None, self.days
+        elif group == "week":
+            keys = (self.days - _MONDAY).astype(np.int64) // 7
+            labels = _MONDAY + keys * 7
+        else:
+            keys = self.days.astype("datetime64[M]")
+            labels = keys.astype("datetime64[D]")
+        if keys is None:
+            self.starts = np.arange(len(self.days))
+        else:
+            self.starts = np.flatnonzero(np.r_[True, keys[1:] != keys[:-1]])
+            labels = labels[self.starts]
+        self.periods = np.datetime_as_string(labels).tolist()
+
+    def dense(self, offsets, values):
+        """Матрица 5 x все дни диапазона (дни без броней — нули)."""
+        matrix = np.zeros((5, len(self.days)), dtype=np.int64)
+        if len(offsets):
+            matrix[:, offsets] = values
+        return matrix
+
+
+def _summary(calendar, matrix, tables=None, items=None):
+    active = matrix[PENDING] + matrix[CONFIRMED]
+    totals = matrix.sum(axis=1)
+    bookings = int(totals[PENDING] + totals[CONFIRMED])
+    everything = bookings + int(totals[CANCELLED])
+    by_period = np.add.reduceat(matrix, calendar.starts, axis=1)
+
+    peak = np.argsort(-matrix[TABLES], kind="stable")[:PEAK_DAYS]
+    peak = peak[matrix[TABLES][peak] > 0]
+    weekdays = np.bincount(calendar.weekday, weights=active, minlength=7) / np.maximum(calendar.weekday_count, 1)
+
+    summary = {
+        "bookings": bookings,
+        "guests": int(totals[GUESTS]),
+        "tables": int(totals[TABLES]),
+        "avg_party": round(int(totals[GUESTS]) / bookings, 2) if bookings else None,
+        "by_status": {"pending": int(totals[PENDING]), "confirmed": int(totals[CONFIRMED]),
+                      "cancelled": int(totals[CANCELLED])},
+        "cancel_rate": round(int(totals[CANCELLED]) / everything, 4) if everything else None,
+        "series": {
+            "periods": calendar.periods,
+            "bookings": (by_period[PENDING] + by_period[CONFIRMED]).tolist(),
+            "guests": by_period[GUESTS].tolist(),
+            "cancelled": by_period[CANCELLED].tolist(),
+        },
+        # среднее число броней в понедельник, вторник, ... воскресенье
+        "weekdays": np.round(weekdays, 2).tolist(),
+        "peak_days": [{"date": day, "tables": t, "bookings": b} for day, t, b in zip(
+            np.datetime_as_string(calendar.days[peak]).tolist(),
+            matrix[TABLES][peak].tolist(), active[peak].tolist())],
+        "top_menu_items": _top(*(items or (None, None)), key="item"),
+    }
+    if tables is not None:
+        summary["top_tables"] = _top(*tables, key="table")
+    return summary
+
+
+def build_report(daily, tables, items, branches, date_from, date_to, group):
+    """
+    Отчёт из агрегатов: daily — {branch: (дни от date_from, матрица 5 x дни)},
+    tables / items — {branch: (имена, счётчики)}. Без branches — все филиалы из daily.
+    """
+    calendar = _Calendar(date_from, date_to, group)
+    branches = list(branches) or sorted(set(daily) | set(tables) | set(items))
+    total = np.zeros((5, len(calendar.days)), dtype=np.int64)
+    report = {}
+    for branch in branches:
+        offsets, values = daily.get(branch, ((), None))
+        matrix = calendar.dense(offsets, values)
+        total += matrix
+        empty = (np.array([], dtype=object), np.array([], dtype=np.int64))
+        report[branch] = _summary(calendar, matrix, tables.get(branch, empty), items.get(branch, empty))
+
+    month_to = date_to.replace(day=1)
+    return {
+        "from": date_from.isoformat(),
+        "to": date_to.isoformat(),
+        "group": group,
+        "top_from": date_from.replace(day=1).isoformat(),
+        "top_to": ((month_to + timedelta(days=31)).replace(day=1) - timedelta(days=1)).isoformat(),
+        "branches": report,
+        "total": _summary(calendar, total, items=_merge_counts([items[b] for b in branches if b in items])),
+    }
+
+
+def fold(cur):
+    """Сворачивает очередь stats_changes в агрегаты; возвращает число изменений."""
+    cur.execute("SELECT reservations_stats_fold()")
+    return cur.fetchone()[0]
+
+
+def stats_report(cur, branches, date_from, date_to, group):
+    """Отчёт /admin/stats: свёртка очереди, три запроса к агрегатам и расчёт в numpy."""
+    fold(cur)
+    month_from, month_to = date_from.replace(day=1), date_to.replace(day=1)
+    daily = load_daily(cur, branches, date_from, date_to)
+    tables = load_counts(cur, "stats_tables", "table_id", "bookings", branches, month_from, month_to)
+    items = load_counts(cur, "stats_menu_items", "item", "orders", branches, month_from, month_to)
+    return build_report(daily, tables, items, branches, date_from, date_to, group)
+
+
+def rebuild(conn):
+    """Пересчитывает агрегаты из reservations; запись броней на это время блокируется."""
+    cur = conn.cursor()
+    cur.execute("LOCK TABLE reservations IN SHARE ROW EXCLUSIVE MODE")
+    cur.execute("SELECT reservations_stats_rebuild()")
+    cur.execute("SELECT count(*) FROM stats_daily")
+    return cur.fetchone()[0]
+
+
+if __name__ == "__main__":
+    from dotenv import load_dotenv
+    from db import db_connection
+
+    load_dotenv()
+    if sys.argv[1:] not in (["rebuild"], ["fold"]):
+        print("usage: python stats.py [fold|rebuild]")
+        sys.exit(2)
+    with db_connection() as conn:
+        if sys.argv[1] == "fold":
+            print("folded changes:", fold(conn.cursor()))
+        else:
+            print("stats_daily rows:", rebuild(conn))